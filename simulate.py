@@ -1,5 +1,4 @@
 
-import copy
 import carla
 import logging
 from numpy import random
@@ -10,11 +9,14 @@ import os
 
 from simulation.utils.option import get_args
 from simulation.world import World
-from simulation.sensors import RGBCamera, GNSS, InstanceCamera, SemanticCamera
+from simulation.sensors import (RGBCamera, GNSS, InstanceCamera, SemanticCamera, CameraRig, DepthCamera, Lidar,
+                                SemanticLidar)
 from simulation.config import (WorldConfig, RGBCameraConfig, GNSSConfig, InstanceCameraConfig,
-                               SemanticCameraConfig, RecorderConfig, GeneratorConfig)
-from simulation.recorders import BufferRecorder
+                               SemanticCameraConfig, DepthCameraConfig, LidarConfig, CameraRigConfig, RecorderConfig,
+                               GeneratorConfig)
+from simulation.recorders import BufferRecorder, ShardRecorder
 from simulation.generator import TrafficGenerator
+from simulation.utils.capture import CadenceCapture
 
 try:
     sys.path.append(glob.glob('../carla/dist/carla-*%d.%d-%s.egg' % (
@@ -51,15 +53,39 @@ def main():
         world.add_carla_sensor(RGBCamera(name='rgb_camera', rgb_cam_config=RGBCameraConfig, parent_actor=world.ego_veh, world=carla_world))
         world.add_carla_sensor(GNSS(name='gnss', gnss_config=GNSSConfig, parent_actor=world.ego_veh))
         world.add_carla_sensor(InstanceCamera(name='instance_camera', in_cam_config=InstanceCameraConfig, parent_actor=world.ego_veh))
-        world.add_carla_sensor(SemanticCamera(name='semantic_camera', ss_cam_config=SemanticCameraConfig, parent_actor=world.ego_veh))
+        cameras = ['rgb_camera', 'instance_camera']
+        # The instance camera can produce labelIds itself, which saves rendering a semantic camera
+        if not InstanceCameraConfig['labelIds']:
+            world.add_carla_sensor(SemanticCamera(name='semantic_camera', ss_cam_config=SemanticCameraConfig, parent_actor=world.ego_veh))
+            cameras.append('semantic_camera')
+        if DepthCameraConfig['enabled']:
+            world.add_carla_sensor(DepthCamera(name='depth_camera', depth_cam_config=DepthCameraConfig, parent_actor=world.ego_veh))
+            cameras.append('depth_camera')
+        if LidarConfig['enabled']:
+            lidar_class = SemanticLidar if LidarConfig['semantic'] else Lidar
+            world.add_carla_sensor(lidar_class(name='lidar', lidar_config=LidarConfig, parent_actor=world.ego_veh))
+            cameras.append('lidar')
+        # All views of the rig are synchronized and decoded as one sensor
+        if CameraRigConfig['enabled']:
+            world.add_carla_sensor(CameraRig(name='camera_rig', rig_config=CameraRigConfig, parent_actor=world.ego_veh))
+            cameras.append('camera_rig')
 
         world.set_ego_autopilot(True)
+        # Cameras are only rendered every sensor_trick seconds, and frames are recorded when all of them report.
+        world.set_capture_policy(CadenceCapture(world.scheduler, cameras))
 
         generator = TrafficGenerator(generator_config=GeneratorConfig, client=client)
         generator.generate()
+        # Static boxes of the generated actors are fetched once, others are registered when first annotated
+        world.registry.seed(generator.vehicles_list, generator.walkers_list)
 
         # Third, we need to create a recorder to record the data from sensors to disk.
-        recorder = BufferRecorder(recorder_config=RecorderConfig, map_name=args.map)
+        recorder_class = ShardRecorder if RecorderConfig['shards'] else BufferRecorder
+        recorder = recorder_class(recorder_config=RecorderConfig, map_name=args.map, release=world.release)
+        # Captured frames are decoded and buffered on worker threads while the world keeps ticking
+        world.start_pipeline(on_frame=recorder.buffering,
+                             depth=WorldConfig['world']['pipeline_depth'],
+                             num_workers=WorldConfig['world']['pipeline_workers'])
 
         # Fourth, we need to start the world tick.
 
@@ -67,11 +93,12 @@ def main():
 
             world.step_forward()
 
-            world.see_ego_veh()
+            if args.spectator:
+                world.see_ego_veh()
 
-            if world.all_sensor_data['rgb_camera']['frame'] % 100 == 0:
-                print(f"Frame: {world.all_sensor_data['rgb_camera']['frame']}")
-                recorder.buffering(copy.deepcopy(world.all_sensor_data))
+            if world.is_capture_frame:
+                print(f"Frame: {world.frame}")
+                world.capture_async()
 
     finally:
         if world is not None:
@@ -89,7 +116,7 @@ def main():
         #     vehicle.destroy()
 
         if recorder is not None:
-            recorder.flush()
+            recorder.close()
 
 
 if __name__ == '__main__':
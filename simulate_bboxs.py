@@ -1,5 +1,4 @@
 
-import copy
 import carla
 import logging
 from numpy import random
@@ -10,11 +9,13 @@ import os
 
 from simulation.utils.option import get_args
 from simulation.world import World
-from simulation.sensors import RGBCamera, GNSS, InstanceCamera, SemanticCamera, RGBBboxsCamera
+from simulation.sensors import RGBCamera, GNSS, InstanceCamera, SemanticCamera, RGBBboxsCamera, DepthCamera
 from simulation.config import (WorldConfig, RGBCameraConfig, GNSSConfig, InstanceCameraConfig,
-                               SemanticCameraConfig, RecorderConfig, GeneratorConfig)
-from simulation.recorders import BufferRecorder
+                               SemanticCameraConfig, DepthCameraConfig, RecorderConfig, GeneratorConfig)
+from simulation.recorders import BufferRecorder, ShardRecorder
 from simulation.generator import TrafficGenerator
+from simulation.utils.capture import CadenceCapture
+from simulation.utils.environment import EnvironmentCache
 
 try:
     sys.path.append(glob.glob('../carla/dist/carla-*%d.%d-%s.egg' % (
@@ -56,31 +57,55 @@ def main():
 
         generator = TrafficGenerator(generator_config=GeneratorConfig, client=client)
         generator.generate()
+        # Static boxes of the generated actors are fetched once, others are registered when first annotated
+        world.registry.seed(generator.vehicles_list, generator.walkers_list)
 
 
 
         world.add_carla_sensor(RGBBboxsCamera(name='rgb_camera', rgb_cam_config=RGBCameraConfig, parent_actor=world.ego_veh, world=carla_world))
         world.add_carla_sensor(GNSS(name='gnss', gnss_config=GNSSConfig, parent_actor=world.ego_veh))
         world.add_carla_sensor(InstanceCamera(name='instance_camera', in_cam_config=InstanceCameraConfig, parent_actor=world.ego_veh))
-        world.add_carla_sensor(SemanticCamera(name='semantic_camera', ss_cam_config=SemanticCameraConfig, parent_actor=world.ego_veh))
+        cameras = ['rgb_camera', 'instance_camera']
+        # The instance camera can produce labelIds itself, which saves rendering a semantic camera
+        if not InstanceCameraConfig['labelIds']:
+            world.add_carla_sensor(SemanticCamera(name='semantic_camera', ss_cam_config=SemanticCameraConfig, parent_actor=world.ego_veh))
+            cameras.append('semantic_camera')
+        # Boxes are scored against a depth camera at the same pose, and fully occluded ones are dropped
+        if DepthCameraConfig['enabled']:
+            world.add_carla_sensor(DepthCamera(name='depth_camera', depth_cam_config=DepthCameraConfig, parent_actor=world.ego_veh))
+            world.carla_sensors['rgb_camera'].set_depth_camera(world.carla_sensors['depth_camera'])
+            cameras.append('depth_camera')
+        # Boxes of static objects are fetched once per town and cached next to the outputs
+        if RGBCameraConfig['env_classes']:
+            environment = EnvironmentCache.load_or_build(carla_world,
+                                                         os.path.join(RecorderConfig['save_path'], '%s_environment.npz' % args.map),
+                                                         RGBCameraConfig['env_classes'])
+            world.carla_sensors['rgb_camera'].set_environment(environment)
+
+        # Cameras are only rendered every sensor_trick seconds, and frames are recorded when all of them report.
+        world.set_capture_policy(CadenceCapture(world.scheduler, cameras))
 
         # Third, we need to create a recorder to record the data from sensors to disk.
-        recorder = BufferRecorder(recorder_config=RecorderConfig, map_name=args.map)
+        recorder_class = ShardRecorder if RecorderConfig['shards'] else BufferRecorder
+        recorder = recorder_class(recorder_config=RecorderConfig, map_name=args.map, release=world.release)
+        # Captured frames are decoded and buffered on worker threads while the world keeps ticking
+        world.start_pipeline(on_frame=recorder.buffering,
+                             depth=WorldConfig['world']['pipeline_depth'],
+                             num_workers=WorldConfig['world']['pipeline_workers'])
 
         # Fourth, we need to start the world tick.
         while True:
             world.step_forward()
 
-            if world.all_sensor_data['rgb_camera']['frame'] % 100 == 0:
-                print(f"Frame: {world.all_sensor_data['rgb_camera']['frame']}")
+            if world.is_capture_frame:
+                print(f"Frame: {world.frame}")
 
-                # get the bounding box of RGB camera Image
-                world.carla_sensors['rgb_camera'].bounding()
+                # Bounding boxes of the RGB camera image are annotated by capture_async()
+                # To avoid overlapping, the frame buffers are handed over to the recorder instead of `recorder.buffering(world.all_sensor_data)`
+                world.capture_async()
 
-                # To avoid overlapping, we need to copy the data from all_sensor_data to recorder instead of `recorder.buffering(world.all_sensor_data)`
-                recorder.buffering(copy.deepcopy(world.all_sensor_data))
-
-            world.see_ego_veh()
+            if args.spectator:
+                world.see_ego_veh()
 
     finally:
         if world is not None:
@@ -98,7 +123,7 @@ def main():
         #     vehicle.destroy()
 
         if recorder is not None:
-            recorder.flush()
+            recorder.close()
 
 
 if __name__ == '__main__':
@@ -9,6 +9,12 @@ WorldConfig = {
         'no_rendering': False, # Activate no rendering mode
         'sync_mode': True,
         'delta_seconds': 0.05,
+        'sensor_timeout': 2.0, # Seconds to wait for the due sensors before the frame is given up
+        'max_pending_frames': 8, # Maximum number of frames buffered by the frame synchronizer
+        'pipeline_depth': 2, # Maximum number of captured frames decoded while the world keeps ticking, 0 disables pipelining
+        'pipeline_workers': 3, # Number of threads decoding captured frames
+        'spectator_interval': 1, # Ticks between two spectator moves, 0 leaves the spectator alone (headless)
+        'log_pose': True, # Record the ego pose read from the world snapshot with every captured frame
     },
     'ego_veh': {
 
@@ -21,7 +27,13 @@ RGBCameraConfig = {
     'fov': '70',
     'pos_x': 1.5,
     'pos_z': 2.4,
-    'sensor_trick': 1.5, # Sensor trick (default: 1.5)
+    'sensor_trick': 5.0, # Seconds between two captures, 0.0 captures every tick (default: 5.0, one frame in 100)
+    'pool_size': 12, # Number of preallocated frame buffers, it must exceed recorder capacity (or write_queue + writer_threads) + pipeline depth (default: 12)
+    'bbox_classes': ['pedestrian'], # Classes annotated by RGBBboxsCamera, 'vehicle' and/or 'pedestrian'
+    'min_visibility': 0.0, # Boxes scoring this visibility or less against the depth camera are dropped, see DepthCameraConfig
+    'kitti': False, # Also write KITTI object labels and calibration of the annotated actors, see simulation/utils/kitti.py
+    'env_classes': [], # Static objects of the town annotated by RGBBboxsCamera: 'traffic_light', 'traffic_sign', 'pole', 'static_vehicle'
+    'env_distance': 100.0, # Maximum distance in meters of the annotated static objects
 }
 
 GNSSConfig = {
@@ -32,7 +44,7 @@ GNSSConfig = {
     'noise_lon_bias': '0.0',
     'noise_lon_stddev': '0.0',
     'pos_x': 1.5,
-    'sensor_trick': 1.5,
+    'sensor_trick': 0.0, # GNSS is cheap, so it runs every tick
 }
 
 InstanceCameraConfig = {
@@ -41,7 +53,14 @@ InstanceCameraConfig = {
     'fov': '70',
     'pos_x': 1.5,
     'pos_z': 2.4,
-    'sensor_trick': 1.5,
+    'sensor_trick': 5.0,
+    'pool_size': 12,
+    'compact': False, # Store a uint16 object id map and a uint8 semantic tag map instead of the 3-channel image
+    'labelIds': False, # Derive labelIds (and the color image) from the instance camera, so no SemanticCamera is spawned
+    'boxes': False, # Derive occlusion-aware 2D boxes of the visible actors from the instance image
+    'bbox_classes': ['vehicle', 'pedestrian'], # Classes of the actors the boxes are matched to
+    'min_pixels': 10, # Minimum number of visible pixels of a box
+    'objects': False, # Gather a per-run table of the actors (distance, relative velocity, 3D box, visible pixels), see simulation/utils/objects.py
 }
 
 SemanticCameraConfig = {
@@ -50,12 +69,75 @@ SemanticCameraConfig = {
     'fov': '70',
     'pos_x': 1.5,
     'pos_z': 2.4,
-    'sensor_trick': 1.5,
+    'sensor_trick': 5.0,
+    'pool_size': 12,
+}
+
+DepthCameraConfig = {
+    'enabled': False,
+    'img_width': '2048',
+    'img_height': '1024',
+    'fov': '70',
+    'pos_x': 1.5,
+    'pos_z': 2.4,
+    'sensor_trick': 5.0,
+    'pool_size': 12,
+}
+
+LidarConfig = {
+    'enabled': False,
+    'semantic': False, # Spawn a semantic LiDAR, which reports object ids and tags instead of intensity
+    'channels': '64',
+    'range': '100.0', # Meters
+    'points_per_second': '1200000', # Points of one turn are points_per_second * delta_seconds, the turn is one tick
+    'upper_fov': '10.0',
+    'lower_fov': '-30.0',
+    'pos_x': 0.0,
+    'pos_z': 2.4,
+    'sensor_trick': 5.0,
+}
+
+CameraRigConfig = {
+    'enabled': False, # Spawn the rig in addition to the forward cameras
+    'img_width': '2048',
+    'img_height': '1024',
+    'fov': '90', # Four 90 degree views cover all around the ego vehicle
+    'sensor_trick': 5.0,
+    'pool_size': 12, # Every buffer holds all the views, so a rig of 4 views uses 4 times the memory of a camera
+    'modalities': ['rgb', 'semantic', 'instance'], # Cameras spawned at every pose
+    'poses': { # View name: pose relative to the ego vehicle
+        'front': {'x': 1.5, 'y': 0.0, 'z': 2.4, 'yaw': 0.0},
+        'left': {'x': 0.0, 'y': -0.9, 'z': 2.4, 'yaw': -90.0},
+        'right': {'x': 0.0, 'y': 0.9, 'z': 2.4, 'yaw': 90.0},
+        'rear': {'x': -1.5, 'y': 0.0, 'z': 2.4, 'yaw': 180.0},
+    },
 }
 
 RecorderConfig = {
     'save_path': PROJECT_DIR / "outputs/",
     'capacity': 8,
+    'save_color': True, # Store the CityScapes color image (_color) derived from labelIds
+    'box_formats': ['voc'], # Formats of the RGB camera boxes: 'voc' (_bounding_box.xml), 'yolo' (_bounding_box.txt), 'jsonl' (one file per run)
+    'parquet': True, # Store per-run tables as Parquet if pyarrow is installed, otherwise as .npz chunks
+    'writer_threads': 2, # Threads writing frames behind the simulation, 0 writes them in flush() when the buffer is full
+    'write_queue': 4, # Frames waiting for a writer thread before buffering() blocks, they hold pooled buffers
+    'encoder_workers': 0, # Processes encoding images of any codec via shared memory, 0 encodes them on the writing thread
+    'array_store': False, # Append labelIds and instance ids to memory-mapped .npy chunks (<map>_labelIds/) instead of PNGs, see ArrayStoreReader
+    'array_chunk_frames': 256, # Frames of a chunk of the array store
+    'shards': False, # Write the files of every frame into tar shards (<map>-000000.tar) with an index instead of loose files
+    'shard_bytes': 1 << 30, # Maximum size of a shard
+    'shard_samples': None, # Maximum number of frames of a shard, unlimited if None
+    'codecs': { # Codec of every image modality: 'png', 'webp' (lossless), 'jpeg' (rgb only), 'npy' or 'palette_png'
+        # (labelIds and instance_tags, the CityScapes palette makes _color redundant). Arguments as a dict,
+        # e.g. {'codec': 'png', 'compression': 3} or {'codec': 'jpeg', 'quality': 95}, see simulation/tools/codec_benchmark.py
+        'rgb': 'png',
+        'color': 'png',
+        'labelIds': 'png',
+        'instance': 'png',
+        'instance_ids': 'png',
+        'instance_tags': 'png',
+    },
+    'encoder_slot_bytes': 2048 * 1024 * 3, # Size of a shared memory slot, it should hold the largest image
 }
 
 GeneratorConfig = {
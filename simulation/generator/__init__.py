@@ -1,2 +1,3 @@
 from .base import Generator
-from .generator import TrafficGenerator
\ No newline at end of file
+from .generator import TrafficGenerator
+from .registry import ActorRegistry, ACTOR_CLASSES
\ No newline at end of file
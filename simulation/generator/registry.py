@@ -0,0 +1,148 @@
+
+import numpy as np
+
+# Actor classes live in simulation.utils.classes, so that offline tools do not need carla
+from simulation.utils.classes import ACTOR_CLASSES, actor_class
+
+
+class ActorRegistry(object):
+    """
+    Registry of the static attributes of annotated actors, i.e. vehicles and pedestrians.
+
+    Class, bounding box and blueprint id of an actor never change after it is spawned, so they are fetched once
+    and kept in contiguous arrays, one row per actor:
+
+        ids: N int64 numpy array of actor ids.
+        classes: N uint8 numpy array of indices into ACTOR_CLASSES.
+        box_locations: Nx3 numpy array of box centers relative to the actors.
+        box_extents: Nx3 numpy array of box half sizes.
+        blueprints: N int32 numpy array of indices into blueprint_ids and base_types.
+
+    The registry is seeded with the actors spawned by TrafficGenerator, then kept up to date by sync() with the
+    actor ids of each annotated frame, which catches actors spawned or destroyed by others, e.g. respawned dormant
+    vehicles. Rows are compacted when actors are removed, so they must not be kept across calls to sync().
+    """
+
+    def __init__(self, carla_world):
+        """
+        Constructor method.
+
+        Input:
+            carla_world: Carla.World to fetch actors from.
+        """
+        self.carla_world = carla_world
+
+        self.ids = np.empty(0, dtype=np.int64)
+        self.classes = np.empty(0, dtype=np.uint8)
+        self.box_locations = np.empty((0, 3))
+        self.box_extents = np.empty((0, 3))
+        self.blueprints = np.empty(0, dtype=np.int32)
+        self.blueprint_ids = []
+        # Base type of each blueprint, e.g. 'car', 'truck' or 'bicycle', empty if the blueprint has none
+        self.base_types = []
+
+        self._rows = {}
+        self._blueprint_index = {}
+        # Ids of actors which are not annotated, e.g. sensors and controllers, so they are not fetched again
+        self._ignored = set()
+
+    def __len__(self):
+        return len(self.ids)
+
+    def seed(self, vehicles_list, walkers_list):
+        """
+        Register the actors spawned by TrafficGenerator.
+
+        Input:
+            vehicles_list: List of vehicle ids.
+            walkers_list: List of dicts of walker ids ("id") and their controller ids ("con").
+        """
+        self.add(list(vehicles_list) + [walker['id'] for walker in walkers_list])
+
+    def add(self, actor_ids):
+        """
+        Register actors, fetching them from the server in one request.
+
+        Input:
+            actor_ids: List of actor ids.
+        """
+        actor_ids = [int(actor_id) for actor_id in actor_ids if actor_id not in self._rows]
+        if not actor_ids:
+            return
+
+        ids, classes, boxes, blueprints = [], [], [], []
+        for actor in self.carla_world.get_actors(actor_ids):
+            class_index = actor_class(actor.type_id)
+            if class_index is None:
+                self._ignored.add(actor.id)
+                continue
+            bb = actor.bounding_box
+            ids.append(actor.id)
+            classes.append(class_index)
+            boxes.append((bb.location.x, bb.location.y, bb.location.z, bb.extent.x, bb.extent.y, bb.extent.z))
+            if actor.type_id not in self._blueprint_index:
+                self._blueprint_index[actor.type_id] = len(self.blueprint_ids)
+                self.blueprint_ids.append(actor.type_id)
+                self.base_types.append(actor.attributes.get('base_type', '').lower())
+            blueprints.append(self._blueprint_index[actor.type_id])
+
+        if not ids:
+            return
+        boxes = np.array(boxes, dtype=np.float64)
+        for actor_id in ids:
+            self._rows[actor_id] = len(self._rows)
+        self.ids = np.concatenate([self.ids, np.array(ids, dtype=np.int64)])
+        self.classes = np.concatenate([self.classes, np.array(classes, dtype=np.uint8)])
+        self.box_locations = np.concatenate([self.box_locations, boxes[:, 0:3]])
+        self.box_extents = np.concatenate([self.box_extents, boxes[:, 3:6]])
+        self.blueprints = np.concatenate([self.blueprints, np.array(blueprints, dtype=np.int32)])
+
+    def remove(self, actor_ids):
+        """
+        Unregister actors, e.g. once they are destroyed.
+
+        Input:
+            actor_ids: List of actor ids.
+        """
+        keep = ~np.isin(self.ids, np.asarray(actor_ids, dtype=np.int64))
+        if keep.all():
+            return
+
+        self.ids = self.ids[keep]
+        self.classes = self.classes[keep]
+        self.box_locations = self.box_locations[keep]
+        self.box_extents = self.box_extents[keep]
+        self.blueprints = self.blueprints[keep]
+        self._rows = {actor_id: row for row, actor_id in enumerate(self.ids.tolist())}
+
+    def sync(self, actor_ids):
+        """
+        Register the actors seen for the first time and unregister those which are gone.
+
+        Input:
+            actor_ids: Numpy array of ids of all actors at a frame, e.g. WorldState.ids.
+        """
+        new_ids = [actor_id for actor_id in actor_ids.tolist() if actor_id not in self._rows and actor_id not in self._ignored]
+        if new_ids:
+            self.add(new_ids)
+
+        gone = ~np.isin(self.ids, actor_ids)
+        if gone.any():
+            self.remove(self.ids[gone])
+        if len(self._ignored) > 2 * len(actor_ids):
+            self._ignored.intersection_update(actor_ids.tolist())
+
+    def lookup(self, actor_ids):
+        """
+        Get the rows of actors.
+
+        Input:
+            actor_ids: Numpy array of actor ids.
+        Output:
+            rows: Numpy array of rows, -1 for actors which are not registered.
+        """
+        return np.array([self._rows.get(actor_id, -1) for actor_id in actor_ids.tolist()], dtype=np.intp)
+
+    def class_mask(self, class_names):
+        """ Get the mask of the rows of actors of some classes, e.g. ('vehicle', 'pedestrian'). """
+        return np.isin(self.classes, [ACTOR_CLASSES.index(name) for name in class_names])
@@ -1,2 +1,3 @@
 from .base import Recorder
-from .buffer_recorder import BufferRecorder
\ No newline at end of file
+from .buffer_recorder import BufferRecorder
+from .shard_recorder import ShardRecorder
\ No newline at end of file
@@ -1,35 +1,98 @@
 
 import os
-import cv2
 import json
+import time
+import queue
+import threading
+import numpy as np
 from .base import Recorder
+from simulation.utils.palette import colorize
+from simulation.utils.instance import table_to_list
+from simulation.utils.kitti import format_labels, format_calib
+from simulation.utils.boxes import BOX_SERIALIZERS
+from simulation.utils.table import ChunkedTable
+from simulation.utils.codecs import make_codecs, NPYCodec
+from simulation.utils.array_store import ArrayStore
+from .image_encoder import ImageEncoder
 
 class BufferRecorder(Recorder):
     """BufferRecorder class to record data to disk.
     Don't save data to disk from buffer until buffer is full.
+
+    With writer threads, frames are written behind instead: buffering() hands every frame to a bounded queue and
+    returns at once, background threads write the frame files, and the per-run files (objects table, per-run box
+    formats) are appended every `capacity` frames. buffering() only blocks while the queue is full, and flush()
+    waits until everything handed over is written. Frames in the queue keep their pooled buffers, so pool sizes must
+    exceed write_queue + writer_threads + the pipeline depth.
     """
-    def __init__(self, recorder_config: dict, map_name: str):
+    def __init__(self, recorder_config: dict, map_name: str, release=None):
         """
         Constructor method.
 
         Input:
             recoder_config: Dict of recorders configuration.
+            release: Callable taking the data of a flushed frame, e.g. World.release to give frame buffers back.
         """
 
         super().__init__(recorder_config, map_name)
         self.map_name = map_name
         self.buffer = None
         self.capacity = recorder_config['capacity']
+        self.release = release
+        # Codec of every image modality, see simulation/utils/codecs.py
+        self.codecs = make_codecs(recorder_config.get('codecs', {}))
+        self._npy = NPYCodec()
+        # Whether to store the CityScapes color image derived from labelIds, redundant if labelIds embed the palette
+        self.save_color = recorder_config.get('save_color', True) and not self.codecs['labelIds'].embeds_palette
+        # Scratch buffer the color images are rendered into before being written, one per writing thread
+        self._scratch = threading.local()
+        # Serializers of the boxes of the RGB camera, see simulation/utils/boxes.py
+        self.box_serializers = [BOX_SERIALIZERS[box_format]() for box_format in recorder_config.get('box_formats', ['voc'])]
+        self.use_parquet = recorder_config.get('parquet', True)
+        # Per-run table of the actors, created with the first objects to flush
+        self.object_table = None
+        # Memory-mapped stores of labelIds and instance ids keyed by name, e.g. labelIds or front_labelIds, instead of PNGs
+        self.use_array_store = recorder_config.get('array_store', False)
+        self.array_chunk_frames = recorder_config.get('array_chunk_frames', 256)
+        self.array_stores = {}
+        self._array_lock = threading.Lock()
 
         self.init()
 
+        # Processes encoding images with their codec, none encodes them on the writing thread
+        self.image_encoder = None
+        if recorder_config.get('encoder_workers', 0) > 0:
+            self.image_encoder = ImageEncoder(num_workers=recorder_config['encoder_workers'],
+                                              slot_bytes=recorder_config.get('encoder_slot_bytes', 2048 * 1024 * 3))
+
+        # Write-behind threads, none writes frames in flush() on the calling thread
+        self._writers = []
+        self._queue = queue.Queue(maxsize=recorder_config.get('write_queue', 4))
+        # Guards self.buffer, which only gathers the per-run data of written frames with writer threads
+        self._run_lock = threading.Lock()
+        # Frames are numbered by buffering() and join self.buffer in that order, whichever writer finishes first
+        self._next_seq = 0
+        self._buffered_seq = 0
+        self._held = {}
+        self._errors = []
+        self._stats = {'frames': 0, 'write_seconds': 0.0, 'max_write_seconds': 0.0, 'blocked_seconds': 0.0,
+                       'max_queue_depth': 0}
+        for i in range(recorder_config.get('writer_threads', 0)):
+            writer = threading.Thread(target=self._write_behind, name='recorder-%d' % i, daemon=True)
+            writer.start()
+            self._writers.append(writer)
+
     def init(self):
         """ Initialize buffer. """
         self.buffer = {
             'rgb_camera': [],
             'gnss': [],
             'instance_camera': [],
-            'semantic_camera': []
+            'semantic_camera': [],
+            'camera_rig': [],
+            'depth_camera': [],
+            'lidar': [],
+            'ego_pose': []
         }
 
     def clean(self):
@@ -42,12 +105,8 @@ class BufferRecorder(Recorder):
         Output:
             size: Int of current size of buffer.
         """
-        size = 0
-        for _, data_buffers in self.buffer.items():
-            size = len(data_buffers)
-            break
-
-        return size
+        # Groups of sensors which are not spawned stay empty
+        return max(len(data_buffers) for data_buffers in self.buffer.values())
 
     def buffering(self, source: dict):
         """
@@ -57,59 +116,369 @@ class BufferRecorder(Recorder):
         Input:
             data: Dict of data to be saved.
         """
+        if self._writers:
+            self._raise_errors()
+            frame = {group: source[group] for group in self.buffer if group in source}
+            # Backpressure: wait for a writer thread only when the queue is full
+            start = time.perf_counter()
+            self._queue.put((self._next_seq, frame))
+            self._next_seq += 1
+            self._stats['blocked_seconds'] += time.perf_counter() - start
+            self._stats['max_queue_depth'] = max(self._stats['max_queue_depth'], self._queue.qsize())
+            return
 
         if self.get_size() >= self.capacity:
             self.flush()
 
         # Iterate over groups
         for group, _ in self.buffer.items():
-            self.buffer[group].append(source[group])
+            if group in source:
+                self.buffer[group].append(source[group])
 
     def flush(self):
         """
         Flush data to disk from buffer.
+        With writer threads, wait until all frames handed over by buffering() are written instead.
         """
+        if self._writers:
+            self._queue.join()
+            self._raise_errors()
+            if self.image_encoder is not None:
+                self.image_encoder.drain()
+            with self._run_lock:
+                if self.get_size() > 0:
+                    self.write_run(self.buffer)
+                    self.clean()
+                    self.init()
+            self.report()
+            return
+
         if self.get_size() == 0:
             return
 
+        self.write_frames(self.buffer)
+        self.write_run(self.buffer)
+
+        # Give the frame buffers back since they have been written to disk
+        if self.release is not None:
+            for group, data_buffers in self.buffer.items():
+                for data in data_buffers:
+                    self.release({group: data})
+
+        # Clean the buffer and re-initialize it
+        self.clean()
+        self.init()
+
+        if self.image_encoder is not None:
+            self.image_encoder.drain()
+
+    def imwrite(self, name, image, frame, modality):
+        """
+        Write an image with the codec of its modality, in a process of the image encoder if there is one.
+
+        Input:
+            name: Str of file name without extension, the codec appends its own.
+            image: Numpy array of image, it can be reused as soon as this returns.
+            frame: Int of frame id.
+            modality: Str of modality of the image, see MODALITIES.
+        """
+        codec = self.codecs[modality]
+        if self.image_encoder is None:
+            self.write_file(name + codec.extension, codec.encode(image))
+            return
+        self.image_encoder.submit(os.path.join(self.save_path, name + codec.extension), image, frame, codec)
+
+    def close(self):
+        """
+        Flush the buffer, wait until every image is encoded and written, stop the image encoder and close the array
+        stores.
+        """
+        self.flush()
+        if self.image_encoder is not None:
+            self.image_encoder.close()
+            print('Recorder: %d images, %.1f MB encoded by %d processes'
+                  % (self.image_encoder.num_images, self.image_encoder.num_bytes / 1e6, self.image_encoder.num_workers))
+            self.image_encoder = None
+        for store in self.array_stores.values():
+            store.close()
+        self.array_stores = {}
+
+    def write_file(self, name, data):
+        """
+        Write a file of a frame.
+
+        Input:
+            name: Str of file name, e.g. <map>_<timestamp>_<frame>_gnss.json.
+            data: Bytes-like object of file content.
+        """
+        with open(os.path.join(self.save_path, name), 'wb') as f:
+            f.write(data)
+
+    def write_json(self, name, obj):
+        """ Write a JSON file of a frame. """
+        self.write_file(name, json.dumps(obj).encode())
+
+    def write_frames(self, buffer):
+        """
+        Write the files of every frame.
+
+        Input:
+            buffer: Dict of lists of data of frames keyed by group, as self.buffer.
+        """
         # Save the RGB Image to disk
-        for i in range(len(self.buffer['rgb_camera'])):
-            timestamp = self.buffer['rgb_camera'][i]['timestamp']
-            frame = self.buffer['rgb_camera'][i]['frame']
-            cv2.imwrite(os.path.join(self.save_path, '%s_%06d_%06d_img.png' % (self.map_name, timestamp, frame)),
-                        self.buffer['rgb_camera'][i]['rgb_image'])
+        for i in range(len(buffer['rgb_camera'])):
+            timestamp = buffer['rgb_camera'][i]['timestamp']
+            frame = buffer['rgb_camera'][i]['frame']
+            prefix = '%s_%06d_%06d' % (self.map_name, timestamp, frame)
+            self.imwrite(prefix + '_img', buffer['rgb_camera'][i]['rgb_image'], frame, 'rgb')
 
-            if 'bboxs' in self.buffer['rgb_camera'][i] and self.buffer['rgb_camera'][i]['bboxs'] is not None:
-                self.buffer['rgb_camera'][i]['bboxs'].save(os.path.join(self.save_path, '%s_%06d_%06d_bounding_box.xml' % (self.map_name, timestamp, frame)))
+            if buffer['rgb_camera'][i].get('kitti_labels') is not None:
+                self.write_file(prefix + '_label.txt', format_labels(buffer['rgb_camera'][i]['kitti_labels']).encode())
+                self.write_file(prefix + '_calib.txt', format_calib(buffer['rgb_camera'][i]['kitti_calib']).encode())
 
+        # Serialize the boxes of all frames at once
+        for serializer in self.box_serializers:
+            if not serializer.per_run:
+                for box_frame in self._box_frames(buffer):
+                    self.write_file(box_frame['prefix'] + serializer.suffix,
+                                    serializer.serialize(self.save_path, box_frame).encode())
 
         # Save the Semantic Segmentation Image to disk
-        for i in range(len(self.buffer['semantic_camera'])):
-            timestamp = self.buffer['semantic_camera'][i]['timestamp']
-            frame = self.buffer['semantic_camera'][i]['frame']
-            cv2.imwrite(os.path.join(self.save_path, '%s_%06d_%06d_color.png' % (self.map_name, timestamp, frame)),
-                        self.buffer['semantic_camera'][i]['ss_image'])
-
-            cv2.imwrite(os.path.join(self.save_path, '%s_%06d_%06d_labelIds.png' % (self.map_name, timestamp, frame)),
-                        self.buffer['semantic_camera'][i]['labelIds_image'])
+        for i in range(len(buffer['semantic_camera'])):
+            timestamp = buffer['semantic_camera'][i]['timestamp']
+            frame = buffer['semantic_camera'][i]['frame']
+            self.save_labelIds(buffer['semantic_camera'][i]['labelIds_image'], timestamp, frame)
 
         # Save the Instance Segmentation Image to disk
-        for i in range(len(self.buffer['instance_camera'])):
-            timestamp = self.buffer['instance_camera'][i]['timestamp']
-            frame = self.buffer['instance_camera'][i]['frame']
-            cv2.imwrite(os.path.join(self.save_path, '%s_%06d_%06d_instance.png' % (self.map_name, timestamp, frame)),
-                        self.buffer['instance_camera'][i]['in_image'])
+        for i in range(len(buffer['instance_camera'])):
+            timestamp = buffer['instance_camera'][i]['timestamp']
+            frame = buffer['instance_camera'][i]['frame']
+            prefix = '%s_%06d_%06d' % (self.map_name, timestamp, frame)
+            # The instance camera stands in for the semantic camera
+            if buffer['instance_camera'][i].get('labelIds_image') is not None:
+                self.save_labelIds(buffer['instance_camera'][i]['labelIds_image'], timestamp, frame)
+
+            if buffer['instance_camera'][i].get('in_image') is not None:
+                self.imwrite(prefix + '_instance', buffer['instance_camera'][i]['in_image'], frame, 'instance')
+
+            # Compact encoding: 16-bit object id map, semantic tag map and per object table
+            if buffer['instance_camera'][i].get('instance_ids') is not None:
+                if self.use_array_store:
+                    self.store_array('instanceIds', buffer['instance_camera'][i]['instance_ids'], timestamp, frame)
+                else:
+                    self.imwrite(prefix + '_instanceIds', buffer['instance_camera'][i]['instance_ids'], frame,
+                                 'instance_ids')
+                if buffer['instance_camera'][i].get('semantic_tags') is not None:
+                    self.imwrite(prefix + '_instanceTags', buffer['instance_camera'][i]['semantic_tags'], frame,
+                                 'instance_tags')
+                self.write_json(prefix + '_instance.json', table_to_list(buffer['instance_camera'][i]['instance_table']))
+
+            # Boxes of the visible actors derived from the instance image
+            if buffer['instance_camera'][i].get('boxes') is not None:
+                self.write_json(prefix + '_boxes.json', table_to_list(buffer['instance_camera'][i]['boxes']))
+
+        # Save every view of the camera rig to disk, the view name is appended to the file names
+        for i in range(len(buffer['camera_rig'])):
+            timestamp = buffer['camera_rig'][i]['timestamp']
+            frame = buffer['camera_rig'][i]['frame']
+            prefix = '%s_%06d_%06d' % (self.map_name, timestamp, frame)
+            for v, view in enumerate(buffer['camera_rig'][i]['views']):
+                if buffer['camera_rig'][i].get('rgb_images') is not None:
+                    self.imwrite('%s_%s_img' % (prefix, view), buffer['camera_rig'][i]['rgb_images'][v], frame, 'rgb')
+                if buffer['camera_rig'][i].get('labelIds_images') is not None:
+                    self.save_labelIds(buffer['camera_rig'][i]['labelIds_images'][v], timestamp, frame, view)
+                if buffer['camera_rig'][i].get('in_images') is not None:
+                    self.imwrite('%s_%s_instance' % (prefix, view), buffer['camera_rig'][i]['in_images'][v], frame,
+                                 'instance')
+
+        # Save depth in meters as float16 .npy
+        for i in range(len(buffer['depth_camera'])):
+            timestamp = buffer['depth_camera'][i]['timestamp']
+            frame = buffer['depth_camera'][i]['frame']
+            self.write_file('%s_%06d_%06d_depth.npy' % (self.map_name, timestamp, frame),
+                            self._npy.encode(buffer['depth_camera'][i]['depth_image']))
+
+        # Save LiDAR points. Intensity clouds are raw float32 x, y, z, intensity records (.bin, as KITTI velodyne),
+        # semantic clouds keep their structured dtype (.npy)
+        for i in range(len(buffer['lidar'])):
+            timestamp = buffer['lidar'][i]['timestamp']
+            frame = buffer['lidar'][i]['frame']
+            points = buffer['lidar'][i]['points']
+            if 'intensity' in points.dtype.names:
+                self.write_file('%s_%06d_%06d_lidar.bin' % (self.map_name, timestamp, frame),
+                                np.ascontiguousarray(points).data)
+            else:
+                self.write_file('%s_%06d_%06d_semantic_lidar.npy' % (self.map_name, timestamp, frame),
+                                self._npy.encode(points))
 
         # Save the GNSS data to disk
-        for i in range(len(self.buffer['gnss'])):
-            timestamp = self.buffer['gnss'][i]['timestamp']
-            frame = self.buffer['gnss'][i]['frame']
-            with open(os.path.join(self.save_path, '%s_%06d_%06d_gnss.json' % (self.map_name, timestamp, frame)), 'w') as f:
-                json.dump(self.buffer['gnss'][i], f)
+        for i in range(len(buffer['gnss'])):
+            timestamp = buffer['gnss'][i]['timestamp']
+            frame = buffer['gnss'][i]['frame']
+            self.write_json('%s_%06d_%06d_gnss.json' % (self.map_name, timestamp, frame), buffer['gnss'][i])
 
-        # Clean the buffer and re-initialize it
-        self.clean()
-        self.init()
+        # Save the ego pose to disk
+        for i in range(len(buffer['ego_pose'])):
+            timestamp = buffer['ego_pose'][i]['timestamp']
+            frame = buffer['ego_pose'][i]['frame']
+            self.write_json('%s_%06d_%06d_pose.json' % (self.map_name, timestamp, frame), buffer['ego_pose'][i])
+
+    def write_run(self, buffer):
+        """
+        Append the frames to the per-run files, i.e. the objects table and per-run box formats.
+
+        Input:
+            buffer: Dict of lists of data of frames keyed by group, as self.buffer.
+        """
+        box_frames = self._box_frames(buffer)
+        if box_frames:
+            for serializer in self.box_serializers:
+                if serializer.per_run:
+                    serializer.write(self.save_path, self.map_name, box_frames)
+
+        # Append the actors of all frames to the objects table as a single chunk
+        objects = [data['objects'] for data in buffer['instance_camera'] if data.get('objects') is not None]
+        if objects:
+            if self.object_table is None:
+                self.object_table = ChunkedTable(os.path.join(self.save_path, '%s_objects' % self.map_name), self.use_parquet)
+            self.object_table.append(np.concatenate(objects))
+
+    def _write_behind(self):
+        """ Write the frames handed over by buffering(), on a writer thread. """
+        while True:
+            seq, frame = self._queue.get()
+            written = None
+            try:
+                start = time.perf_counter()
+                self.write_frames({group: [frame[group]] if group in frame else [] for group in self.buffer})
+                written = frame
+
+                if self.release is not None:
+                    for group, data in frame.items():
+                        self.release({group: data})
+
+                elapsed = time.perf_counter() - start
+                with self._run_lock:
+                    self._stats['frames'] += 1
+                    self._stats['write_seconds'] += elapsed
+                    self._stats['max_write_seconds'] = max(self._stats['max_write_seconds'], elapsed)
+            except Exception as e:
+                # Raised again on the thread calling buffering() or flush()
+                self._errors.append(e)
+            finally:
+                try:
+                    self._buffer_in_order(seq, written)
+                except Exception as e:
+                    self._errors.append(e)
+                self._queue.task_done()
+
+    def _buffer_in_order(self, seq, frame):
+        """
+        Add a written frame to the buffer once the frames handed over before it are, so per-run files are in capture
+        order. Per-run files are appended in chunks of `capacity` frames, one writer at a time.
+
+        Input:
+            seq: Int of number of the frame given by buffering().
+            frame: Dict of data of the frame, None if it failed to be written.
+        """
+        with self._run_lock:
+            self._held[seq] = frame
+            while self._buffered_seq in self._held:
+                frame = self._held.pop(self._buffered_seq)
+                self._buffered_seq += 1
+                if frame is None:
+                    continue
+                for group, data in frame.items():
+                    self.buffer[group].append(data)
+                if self.get_size() >= self.capacity:
+                    self.write_run(self.buffer)
+                    self.clean()
+                    self.init()
+
+    def _raise_errors(self):
+        """ Raise the first error of the writer threads. """
+        if self._errors:
+            raise RuntimeError('Recorder writer thread failed.') from self._errors[0]
+
+    def stats(self):
+        """
+        Get the statistics of the writer threads.
+
+        Output:
+            stats: Dict of frames written, queue depth (current and maximum), write latency per frame in ms
+                (mean and maximum) and seconds buffering() was blocked by a full queue.
+        """
+        frames = self._stats['frames']
+        return {
+            'frames': frames,
+            'queue_depth': self._queue.qsize(),
+            'max_queue_depth': self._stats['max_queue_depth'],
+            'mean_write_ms': self._stats['write_seconds'] / frames * 1000.0 if frames else 0.0,
+            'max_write_ms': self._stats['max_write_seconds'] * 1000.0,
+            'blocked_seconds': self._stats['blocked_seconds'],
+        }
+
+    def report(self):
+        """ Print the statistics of the writer threads. """
+        stats = self.stats()
+        print('Recorder: %d frames written by %d threads, queue depth %d (max %d/%d), write %.1f ms per frame '
+              '(max %.1f ms), blocked %.2f s' % (stats['frames'], len(self._writers), stats['queue_depth'],
+                                                 stats['max_queue_depth'], self._queue.maxsize, stats['mean_write_ms'],
+                                                 stats['max_write_ms'], stats['blocked_seconds']))
+
+    def _box_frames(self, buffer):
+        """ Gather the boxes of the RGB camera frames for the box serializers. """
+        box_frames = []
+        for data in buffer['rgb_camera']:
+            if data.get('bboxs') is not None:
+                height, width = data['rgb_image'].shape[:2]
+                box_frames.append({'prefix': '%s_%06d_%06d' % (self.map_name, data['timestamp'], data['frame']),
+                                   'timestamp': data['timestamp'], 'frame': data['frame'], 'boxes': data['bboxs'],
+                                   'width': width, 'height': height, 'extension': self.codecs['rgb'].extension})
+        return box_frames
+
+    def save_labelIds(self, labelIds_image, timestamp, frame, view=None):
+        """
+        Save labelIds and the CityScapes color image derived from them to disk.
+
+        Input:
+            labelIds_image: HxW uint8 numpy array of labelIds.
+            timestamp: Float of timestamp of the frame.
+            frame: Int of frame id.
+            view: Optional str of the camera rig view, appended to the file names.
+        """
+        prefix = '%s_%06d_%06d' % (self.map_name, timestamp, frame)
+        if view is not None:
+            prefix += '_' + view
+
+        if self.save_color:
+            color_image = getattr(self._scratch, 'color_image', None)
+            if color_image is None or color_image.shape[:2] != labelIds_image.shape:
+                color_image = self._scratch.color_image = colorize(labelIds_image)
+            else:
+                colorize(labelIds_image, out=color_image)
+            self.imwrite(prefix + '_color', color_image, frame, 'color')
+
+        if self.use_array_store:
+            self.store_array('labelIds' if view is None else view + '_labelIds', labelIds_image, timestamp, frame)
+        else:
+            self.imwrite(prefix + '_labelIds', labelIds_image, frame, 'labelIds')
+
+    def store_array(self, name, image, timestamp, frame):
+        """
+        Append a label map to its memory-mapped store (<map>_<name>/), created with its first frame.
+
+        Input:
+            name: Str of store name, e.g. labelIds.
+            image: HxW numpy array.
+            timestamp: Float of timestamp of the frame.
+            frame: Int of frame id.
+        """
+        with self._array_lock:
+            if name not in self.array_stores:
+                self.array_stores[name] = ArrayStore(os.path.join(self.save_path, '%s_%s' % (self.map_name, name)),
+                                                     self.array_chunk_frames)
+        self.array_stores[name].append(image, timestamp, frame)
 
     def save(self, data: dict):
         pass
\ No newline at end of file
@@ -0,0 +1,157 @@
+
+import queue
+import threading
+import collections
+import multiprocessing
+from multiprocessing import shared_memory
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from simulation.utils.codecs import PNGCodec
+
+# Shared memory slots attached by a worker process, see _attach()
+_worker_slots = []
+
+
+def _attach(slot_names):
+    """ Attach the shared memory slots in a worker process, the encoder unlinks them in close(). """
+    for name in slot_names:
+        _worker_slots.append(shared_memory.SharedMemory(name=name))
+
+
+def _encode(slot, shape, dtype, path, frame, codec, image=None):
+    """
+    Encode an image held in a slot, or passed along if it does not fit in one, and write it in a worker process.
+
+    Output:
+        record: Tuple of (frame, path, bytes written).
+    """
+    if image is None:
+        image = np.ndarray(shape, dtype=dtype, buffer=_worker_slots[slot].buf)
+    return frame, path, codec.write(path, image)
+
+
+class ImageEncoder(object):
+    """
+    Pool of processes compressing and writing images with any codec, PNG by default, so that encoding is not bound by
+    the GIL.
+
+    Images move to the workers through fixed shared memory slots instead of being pickled: submit() copies the image
+    into a free slot and returns, and the slot is free again once the worker has written the file. submit() blocks
+    while all slots are in use. Images larger than a slot are pickled as a fallback.
+
+    Every completion is a record (frame, path, bytes), the latest ones are kept for completed().
+    """
+
+    def __init__(self, num_workers=4, num_slots=None, slot_bytes=2048 * 1024 * 3, compression=None, max_records=4096):
+        """
+        Constructor method.
+
+        Input:
+            num_workers: Int of number of worker processes.
+            num_slots: Int of number of shared memory slots, i.e. images in flight (default: 2 per worker).
+            slot_bytes: Int of size of a slot, it should hold the largest image, e.g. 2048x1024 RGB.
+            compression: Optional int of PNG compression level from 0 to 9 of the default codec, OpenCV's if None.
+            max_records: Int of number of completion records kept until completed() takes them.
+        """
+        self.num_workers = num_workers
+        self.slot_bytes = slot_bytes
+        self.codec = PNGCodec(compression)
+
+        num_slots = num_slots or 2 * num_workers
+        self._slots = [shared_memory.SharedMemory(create=True, size=slot_bytes) for _ in range(num_slots)]
+        self._free = queue.Queue()
+        for slot in range(num_slots):
+            self._free.put(slot)
+
+        # Fresh worker processes, they must not inherit the threads and locks of the simulation process
+        methods = multiprocessing.get_all_start_methods()
+        context = multiprocessing.get_context('forkserver' if 'forkserver' in methods else 'spawn')
+        self._executor = ProcessPoolExecutor(max_workers=num_workers, mp_context=context, initializer=_attach,
+                                             initargs=([slot.name for slot in self._slots],))
+
+        self._lock = threading.Lock()
+        self._pending = set()
+        self._completed = collections.deque(maxlen=max_records)
+        self._errors = []
+        # Totals of the written images
+        self.num_images = 0
+        self.num_bytes = 0
+
+    def submit(self, path, image, frame=None, codec=None):
+        """
+        Encode and write an image to disk in a worker process. The image can be reused as soon as this returns.
+
+        Input:
+            path: Str of file path.
+            image: HxW or HxWxC numpy array, uint8 or uint16.
+            frame: Optional frame id reported in the completion record.
+            codec: Optional Codec of the image, PNG by default, see simulation/utils/codecs.py.
+        """
+        codec = codec or self.codec
+        if self._errors:
+            raise RuntimeError('Image encoder worker failed.') from self._errors[0]
+
+        image = np.ascontiguousarray(image)
+        if image.nbytes > self.slot_bytes:
+            # Copied since the image is pickled later on, by the thread feeding the workers
+            future = self._executor.submit(_encode, None, None, None, path, frame, codec, image.copy())
+            slot = None
+        else:
+            slot = self._free.get()
+            np.copyto(np.ndarray(image.shape, dtype=image.dtype, buffer=self._slots[slot].buf), image)
+            future = self._executor.submit(_encode, slot, image.shape, image.dtype.str, path, frame, codec)
+
+        with self._lock:
+            self._pending.add(future)
+        future.add_done_callback(lambda done: self._done(done, slot))
+
+    def _done(self, future, slot):
+        """ Free the slot of an encoded image and keep its completion record. """
+        if slot is not None:
+            self._free.put(slot)
+        with self._lock:
+            self._pending.discard(future)
+            if future.exception() is not None:
+                self._errors.append(future.exception())
+            else:
+                record = future.result()
+                self._completed.append(record)
+                self.num_images += 1
+                self.num_bytes += record[2]
+
+    def completed(self):
+        """
+        Take the records of the images written since the last call.
+
+        Output:
+            records: List of tuples of (frame, path, bytes written).
+        """
+        records = []
+        with self._lock:
+            while self._completed:
+                records.append(self._completed.popleft())
+        return records
+
+    def drain(self):
+        """ Wait until all submitted images are written. """
+        while True:
+            with self._lock:
+                pending = list(self._pending)
+            if not pending:
+                break
+            for future in pending:
+                future.exception()
+        if self._errors:
+            raise RuntimeError('Image encoder worker failed.') from self._errors[0]
+
+    def close(self):
+        """ Write the submitted images, stop the workers and free the slots. """
+        try:
+            self.drain()
+        finally:
+            self._executor.shutdown()
+            for slot in self._slots:
+                slot.close()
+                slot.unlink()
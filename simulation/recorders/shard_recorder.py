@@ -0,0 +1,54 @@
+
+import threading
+from .buffer_recorder import BufferRecorder
+from simulation.utils.shards import ShardWriter, key_pattern
+
+
+class ShardRecorder(BufferRecorder):
+    """ShardRecorder class to record data to disk as tar shards.
+    The files of a frame are written as consecutive members of size-capped tar shards instead of loose files, see
+    ShardWriter. Per-run files (objects table, per-run box formats) stay next to the shards.
+
+    Images are encoded on the writing threads since they go into the shards, encoder_workers is ignored.
+    """
+    def __init__(self, recorder_config: dict, map_name: str, release=None):
+        """
+        Constructor method.
+
+        Input:
+            recoder_config: Dict of recorders configuration.
+            release: Callable taking the data of a flushed frame, e.g. World.release to give frame buffers back.
+        """
+        self.shards = None
+        # Files of the frames being written, gathered per writing thread
+        self._samples = threading.local()
+        self._shard_lock = threading.Lock()
+        self._key = key_pattern(map_name)
+        super().__init__(dict(recorder_config, encoder_workers=0), map_name, release)
+        self.shards = ShardWriter(self.save_path, map_name, max_bytes=recorder_config.get('shard_bytes', 1 << 30),
+                                  max_samples=recorder_config.get('shard_samples'))
+
+    def write_file(self, name, data):
+        """ Add a file of a frame to its sample, written to a shard once all files of the frame are encoded. """
+        key, extension = self._key.match(name).groups()
+        self._samples.members.setdefault(key, []).append((extension, data))
+
+    def write_frames(self, buffer):
+        self._samples.members = {}
+        try:
+            super().write_frames(buffer)
+            # One writer at a time, so the files of a frame stay consecutive
+            with self._shard_lock:
+                for key, members in self._samples.members.items():
+                    self.shards.write(key, members)
+        finally:
+            self._samples.members = None
+
+    def close(self):
+        """ Flush the buffer and finish the shards. """
+        super().close()
+        if self.shards is not None:
+            self.shards.close()
+            print('Recorder: %d frames, %.1f MB in %d shards' % (self.shards.num_samples, self.shards.num_bytes / 1e6,
+                                                                  self.shards.num_shards))
+            self.shards = None
@@ -3,4 +3,7 @@ from .camera import *
 from .semantic import *
 from .gnss import *
 from .instance import *
-from .camera_bboxs import *
\ No newline at end of file
+from .camera_bboxs import *
+from .rig import *
+from .depth import *
+from .lidar import *
\ No newline at end of file
@@ -1,6 +1,8 @@
 
 import queue
 
+from simulation.utils.pool import FramePool
+
 class CarlaSensor(object):
     """ Base class for sensor provided by carla. """
 
@@ -23,10 +25,214 @@ class CarlaSensor(object):
         # The callback will likely not finish before data get accessed from the main loop, causing inconsistent data.
         # Here the queue is expected to be used in listen() instead. The callback simply puts the sensor data into the queue,
         # then the data can be obtained in update() using get() which blocks and make sure synchronization.
+        # Once the sensor is added to a World, events go to the world's FrameSync instead, see _put().
         self._queue = queue.Queue()
+        self._frame_sync = None
+        # Raw sensor event of the latest tick which has not been decoded into data yet.
+        # Decoding is deferred until the frame is captured or read, so off-capture ticks only cost a queue get.
+        self._event = None
+        # Pools of preallocated frame buffers keyed by data key, see add_frame_pool()
+        self._pools = {}
+        # Keys of data whose buffers still belong to this sensor, i.e. they have not been handed over by detach()
+        self._owned = set()
+        # Number of frames between two sensor events, see set_sensor_tick().
+        # None means the sensor reports at a rate that can't be predicted in frames.
+        self.period = 1
+
+    def set_sensor_tick(self, blueprint, sensor_tick):
+        """
+        Make the server only render and stream this sensor every sensor_tick seconds.
+
+        It must be called before the sensor is spawned. The period in frames is derived from the fixed delta seconds
+        of the world, so World only waits for this sensor on the frames it is due.
+
+        Input:
+            blueprint: Carla.ActorBlueprint of the sensor.
+            sensor_tick: Float of seconds between two sensor events, 0.0 means every tick.
+        """
+        sensor_tick = float(sensor_tick)
+        if sensor_tick <= 0.0:
+            self.period = 1
+            return
+
+        blueprint.set_attribute('sensor_tick', str(sensor_tick))
+        delta_seconds = self._parent.get_world().get_settings().fixed_delta_seconds
+        if delta_seconds:
+            self.period = max(1, int(round(sensor_tick / delta_seconds)))
+        else:
+            self.period = None
+
+    def add_frame_pool(self, key, shape, dtype, size):
+        """
+        Preallocate a pool of buffers that the decoded data[key] is written into.
+
+        Input:
+            key: Str of data key.
+            shape: Tuple of buffer shape.
+            dtype: Numpy dtype of buffer.
+            size: Int of number of buffers. It should exceed the number of frames held by the recorder.
+        """
+        self._pools[key] = FramePool(shape, dtype, size)
+        self.data[key] = None
+
+    def _frame_buffer(self, key, data):
+        """
+        Get the pooled buffer that the decoded data[key] should be written into.
+
+        The buffer currently held in self.data is reused as long as it has not been handed over by detach().
+        """
+        if data is self.data and key in self._owned:
+            return data[key]
+
+        buf = self._pools[key].acquire()
+        if data is self.data:
+            self._owned.add(key)
+        return buf
+
+    def _put(self, event):
+        """ Listen callback handing the sensor event to the frame synchronizer, or to the queue if there is none. """
+        frame_sync = self._frame_sync
+        if frame_sync is not None:
+            frame_sync.put(self.name, event)
+        else:
+            self._queue.put(event)
+
+    def attach_frame_sync(self, frame_sync):
+        """
+        Make the sensor report its events to a frame synchronizer instead of its own queue.
+
+        Input:
+            frame_sync: FrameSync of the world.
+        """
+        self._frame_sync = frame_sync
+        # Events received before are not synchronized with the world
+        with self._queue.mutex:
+            self._queue.queue.clear()
+
+    def update(self, capture=True, timeout=None):
+        """
+        Wait for sensor event to be put in queue and update data.
+
+        Input:
+            capture: Bool to indicate whether this frame is going to be recorded.
+                     If False, only timestamp and frame are updated and the raw event is kept for decode().
+            timeout: Float of seconds to wait for the event, None waits forever.
+        Output:
+            bool to indicate if an event was received.
+        """
+        # get() blocks the script so synchronization is guaranteed
+        try:
+            event = self._queue.get(timeout=timeout)
+        except queue.Empty:
+            return False
+
+        self.receive(event, capture)
+        return True
+
+    def receive(self, event, capture=True):
+        """
+        Update data with a sensor event. The raw event is kept and only decoded if the frame is captured.
+
+        Input:
+            event: Carla.SensorData received from the sensor.
+            capture: Bool to indicate whether this frame is going to be recorded.
+        """
+        self.data['timestamp'] = event.timestamp
+        self.data['frame'] = event.frame
+        self._event = event
+
+        if capture:
+            self.decode()
 
-    def update(self):
-        """ Wait for sensor event to be put in queue and update data. """
+    def decode(self):
+        """
+        Decode the pending raw event into data. Nothing is done if the latest event has been decoded already.
+
+        Output:
+            data: Dict of sensor data.
+        """
+        if self._event is not None:
+            event, self._event = self._event, None
+            self._decode(event, self.data)
+
+        return self.data
+
+    def annotate(self, state):
+        """
+        Add annotations derived from the world state to data, e.g. bounding boxes.
+
+        It is called by World on capture frames before the data are handed over, on the main thread, so it may read
+        the server state at this frame. Nothing is done by default.
+
+        Input:
+            state: WorldState of the frame.
+        """
+        pass
+
+    def detach(self):
+        """
+        Decode the latest data and hand it over, e.g. to a recorder.
+
+        The pooled buffers in the returned data belong to the caller until they are given back with release().
+        Subsequent frames are decoded into other buffers of the pools.
+
+        Output:
+            data: Dict of sensor data.
+        """
+        data = dict(self.decode())
+        self._owned.clear()
+        return data
+
+    def detach_raw(self):
+        """
+        Hand over the latest data without decoding it, so it can be decoded on another thread with decode_detached().
+
+        Output:
+            data: Dict of sensor data whose pooled buffers are not decoded yet.
+            event: Carla.SensorData to decode into data, None if the latest event has been decoded already.
+        """
+        data = dict(self.data)
+        event, self._event = self._event, None
+        if event is None:
+            # Decoded buffers are handed over as in detach()
+            self._owned.clear()
+        else:
+            for key in self._pools:
+                data[key] = None
+
+        return data, event
+
+    def decode_detached(self, data, event):
+        """
+        Decode a raw event handed over by detach_raw(). It is safe to call on worker threads
+        since the buffers are taken from the pools and not shared with self.data.
+
+        Output:
+            data: Dict of decoded sensor data, its pooled buffers must be given back with release().
+        """
+        if event is not None:
+            self._decode(event, data)
+
+        return data
+
+    def release(self, data):
+        """
+        Give the pooled buffers of data handed over by detach() back to the pools.
+
+        Input:
+            data: Dict of sensor data.
+        """
+        for key, pool in self._pools.items():
+            pool.release(data.get(key))
+
+    def _decode(self, event, data):
+        """
+        Convert a raw sensor event into data.
+
+        Input:
+            event: Carla.SensorData received from the sensor.
+            data: Dict to write the decoded data into.
+        """
         raise NotImplementedError()
 
     def destroy(self):
@@ -34,4 +240,4 @@ class CarlaSensor(object):
         if self.sensor:
             print('Destroying {}'.format(self.name))
             self.sensor.destroy()
-            self.sensor = None
\ No newline at end of file
+            self.sensor = None
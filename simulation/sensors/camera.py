@@ -20,19 +20,20 @@ class RGBCamera(CarlaSensor):
         rgb_cam_bp.set_attribute('image_size_x', rgb_cam_config['img_width'])
         rgb_cam_bp.set_attribute('image_size_y', rgb_cam_config['img_height'])
         rgb_cam_bp.set_attribute('fov', rgb_cam_config['fov'])
+        self.set_sensor_tick(rgb_cam_bp, rgb_cam_config['sensor_trick'])
 
         self.sensor = carla_world.spawn_actor(rgb_cam_bp,
                                               carla.Transform(carla.Location(x=rgb_cam_config['pos_x'], z=rgb_cam_config['pos_z'])),
                                               attach_to=self._parent)
 
-        self.listener = self.sensor.listen(lambda image: self._queue.put(image))
+        self.listener = self.sensor.listen(lambda image: self._put(image))
 
-    def update(self):
-        """ Wait for RGB image and update data. """
-        image = self._queue.get()
-        self.data['timestamp'] = image.timestamp
-        self.data['frame'] = image.frame
+        # RGB images are written into preallocated buffers, the alpha channel is dropped
+        self.add_frame_pool('rgb_image', (int(rgb_cam_config['img_height']), int(rgb_cam_config['img_width']), 3), np.uint8,
+                            rgb_cam_config['pool_size'])
 
+    def _decode(self, image, data):
+        """ Convert RGB image to numpy array. """
         # print('RGB camera received at frame %06d.' % image.frame)
 
         np_img = np.frombuffer(image.raw_data, dtype=np.uint8)
@@ -41,5 +42,7 @@ class RGBCamera(CarlaSensor):
         # Convert to RGB
         np_img = np_img[:, :, :3]
         # Since np_img is from the buffer, which is reused by Carla
-        # Making a copy makes sure rgb_image is not subject to side-effect when the underlying buffer is modified
-        self.data['rgb_image'] = np_img.copy()
\ No newline at end of file
+        # Copying it into a pooled buffer makes sure rgb_image is not subject to side-effect when the underlying buffer is modified
+        rgb_image = self._frame_buffer('rgb_image', data)
+        np.copyto(rgb_image, np_img)
+        data['rgb_image'] = rgb_image
\ No newline at end of file
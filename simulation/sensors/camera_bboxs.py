@@ -1,14 +1,25 @@
 
 import carla
 import numpy as np
-from simulation.utils.writer import XMLWriter
 from .base import CarlaSensor
-from simulation.utils.util import build_projection_matrix, get_image_point
+from simulation.utils.util import build_projection_matrix, box_vertices, filter_actors, project_boxes
+from simulation.utils.depth import box_visibility
+from simulation.utils.boxes import BOX_DTYPE
+from simulation.utils.kitti import kitti_labels, kitti_calib
+from simulation.utils.classes import ACTOR_CLASSES
 
 class RGBBboxsCamera(CarlaSensor):
     """
     Class for RGB camera and 2D Bounding Boxs.
 
+    The boxes of a frame are kept as a numpy structured array of BOX_DTYPE (bboxs), the recorder serializes them
+    when it flushes, see simulation/utils/boxes.py.
+
+    With kitti enabled, the actors are also labelled in the KITTI object format (kitti_labels), along with the
+    calibration of the camera (kitti_calib), see simulation/utils/kitti.py.
+
+    With an EnvironmentCache, the static objects of the town near the ego vehicle are annotated as well, e.g. traffic
+    lights and signs, see set_environment().
     """
     def __init__(self, name, rgb_cam_config, parent_actor=None, world=None):
         super().__init__(name, parent_actor)
@@ -17,6 +28,10 @@ class RGBBboxsCamera(CarlaSensor):
         self.data['frame'] = 0
         self.data['rgb_image'] = None
         self.data['bboxs'] = None
+        self.kitti = rgb_cam_config.get('kitti', False)
+        if self.kitti:
+            self.data['kitti_labels'] = None
+            self.data['kitti_calib'] = None
 
         # Setting RGB camera
         self.carla_world = self._parent.get_world()
@@ -24,12 +39,17 @@ class RGBBboxsCamera(CarlaSensor):
         self.rgb_cam_bp.set_attribute('image_size_x', rgb_cam_config['img_width'])
         self.rgb_cam_bp.set_attribute('image_size_y', rgb_cam_config['img_height'])
         self.rgb_cam_bp.set_attribute('fov', rgb_cam_config['fov'])
+        self.set_sensor_tick(self.rgb_cam_bp, rgb_cam_config['sensor_trick'])
 
         self.sensor = self.carla_world.spawn_actor(self.rgb_cam_bp,
                                               carla.Transform(carla.Location(x=rgb_cam_config['pos_x'], z=rgb_cam_config['pos_z'])),
                                               attach_to=self._parent)
 
-        self.listener = self.sensor.listen(lambda image: self._queue.put(image))
+        self.listener = self.sensor.listen(lambda image: self._put(image))
+
+        # RGB images are written into preallocated buffers, the alpha channel is dropped
+        self.add_frame_pool('rgb_image', (int(rgb_cam_config['img_height']), int(rgb_cam_config['img_width']), 3), np.uint8,
+                            rgb_cam_config['pool_size'])
 
         self.image_w = self.rgb_cam_bp.get_attribute("image_size_x").as_int()
         self.image_h = self.rgb_cam_bp.get_attribute("image_size_y").as_int()
@@ -38,74 +58,107 @@ class RGBBboxsCamera(CarlaSensor):
         # Calculate the camera projection matrix to project from 3D -> 2D
         self.K = build_projection_matrix(self.image_w, self.image_h, fov)
 
-    def bounding(self):
+        # Classes of actors to annotate, see ACTOR_CLASSES
+        self.bbox_classes = rgb_cam_config.get('bbox_classes', ('pedestrian',))
+        # DepthCamera at the same pose used to score the visibility of boxes, see set_depth_camera()
+        self.depth_camera = None
+        # Boxes less visible than this are dropped
+        self.min_visibility = rgb_cam_config.get('min_visibility', 0.0)
+        # EnvironmentCache of static objects to annotate, see set_environment()
+        self.environment = None
+        self.env_distance = rgb_cam_config.get('env_distance', 100.0)
+
+    def set_depth_camera(self, depth_camera):
+        """
+        Score the visibility of boxes against the frames of a depth camera, and drop fully occluded boxes.
+
+        Input:
+            depth_camera: DepthCamera with the same pose, resolution and fov as this camera, ticking with it.
+        """
+        self.depth_camera = depth_camera
+
+    def set_environment(self, environment):
+        """
+        Annotate the static environment objects of the town, their boxes are projected every frame without a request.
+
+        Input:
+            environment: EnvironmentCache of the loaded town, see simulation/utils/environment.py.
+        """
+        self.environment = environment
+
+    def bounding(self, state):
 
         """
         How to remove invisible bounding boxes?
         client_bounding_boxes.py : remove non visible vehicles #5552
         https://github.com/carla-simulator/carla/discussions/5552
         https://github.com/MMNavetty/Carla_gen_GT/blob/main/modules/get_bboxes.py
+
+        Input:
+            state: WorldState of the frame, transforms are read from it rather than requested per actor.
         """
 
         # Get the camera matrix
-        world_2_camera = np.array(self.sensor.get_transform().get_inverse_matrix())
-
-        # Initialize the exporter
-        writer = XMLWriter('', self.image_w, self.image_h)
-
-        for npc in self.carla_world.get_actors().filter('*pedestrian*'):  # vehicle
-
-            # Filter out the ego vehicle
-            if npc.id != self._parent.id:
-
-                bb = npc.bounding_box
-                dist = npc.get_transform().location.distance(self._parent.get_transform().location)
-
-                # Filter for the vehicles within 500m
-                if dist < 500:
-
-                    # Calculate the dot product between the forward vector
-                    # of the vehicle and the vector between the vehicle
-                    # and the other vehicle. We threshold this dot product
-                    # to limit to drawing bounding boxes IN FRONT OF THE CAMERA
-                    forward_vec = self._parent.get_transform().get_forward_vector()
-                    ray = npc.get_transform().location - self._parent.get_transform().location
-
-                    if forward_vec.dot(ray) > 1:
-                        p1 = get_image_point(bb.location, self.K, world_2_camera)
-                        verts = [v for v in bb.get_world_vertices(npc.get_transform())]
-                        x_max = -10000
-                        x_min = 10000
-                        y_max = -10000
-                        y_min = 10000
-
-                        for vert in verts:
-                            p = get_image_point(vert, self.K, world_2_camera)
-                            # Find the rightmost vertex
-                            if p[0] > x_max:
-                                x_max = p[0]
-                            # Find the leftmost vertex
-                            if p[0] < x_min:
-                                x_min = p[0]
-                            # Find the highest vertex
-                            if p[1] > y_max:
-                                y_max = p[1]
-                            # Find the lowest  vertex
-                            if p[1] < y_min:
-                                y_min = p[1]
-
-                        # Add the object to the frame (ensure it is inside the image)
-                        if x_min > 0 and x_max < self.image_w and y_min > 0 and y_max < self.image_h:
-                            writer.addObject('pedestrian', x_min, y_min, x_max, y_max)
-
-        self.data['bboxs'] = writer
-
-    def update(self):
-        """ Wait for RGB image and update data. """
-        image = self._queue.get()
-        self.data['timestamp'] = image.timestamp
-        self.data['frame'] = image.frame
-
+        world_2_camera = state.inverse_matrix(self.sensor.id)
+
+        # All annotated classes in one pass, static boxes come from the actor registry
+        rows, entries = state.select(self.bbox_classes)
+        # Filter out the ego vehicle
+        not_ego = state.ids[rows] != self._parent.id
+        rows, entries = rows[not_ego], entries[not_ego]
+        matrices = state.matrices[rows]
+        registry = state.registry
+        ego_location = state.matrix(self._parent.id)[:3, 3]
+        ego_forward = state.forward_vector(self._parent.id)
+
+        # Limit to the actors within 500m and IN FRONT OF THE CAMERA, i.e. the dot product between the forward
+        # vector of the ego vehicle and the ray to the actor is above a threshold
+        mask = filter_actors(matrices[:, :3, 3], ego_location, ego_forward)
+        rows, entries = rows[mask], entries[mask]
+
+        vertices = box_vertices(matrices[mask], registry.box_locations[entries], registry.box_extents[entries])
+        class_ids = registry.classes[entries]
+        actor_ids = registry.ids[entries]
+
+        # Static environment objects near the ego vehicle, their boxes are read from the cache of the town
+        if self.environment is not None:
+            env_rows = self.environment.query(ego_location, self.env_distance)
+            env_rows = env_rows[filter_actors(self.environment.centers[env_rows], ego_location, ego_forward,
+                                              self.env_distance)]
+            vertices = np.concatenate([vertices, self.environment.vertices[env_rows]])
+            class_ids = np.concatenate([class_ids, len(ACTOR_CLASSES) + self.environment.classes[env_rows]])
+            actor_ids = np.concatenate([actor_ids, np.full(len(env_rows), -1, dtype=np.int64)])
+
+        rects, valid = project_boxes(vertices, self.K, world_2_camera, self.image_w, self.image_h)
+
+        # Test the boxes against the depth frame of this tick, fully occluded boxes score 0
+        visibility = np.full(len(rects), np.nan)
+        if self.depth_camera is not None and self.depth_camera.data['frame'] == self.data['frame']:
+            visibility[valid] = box_visibility(vertices[valid], self.K, world_2_camera, self.depth_camera.sample,
+                                               self.image_w, self.image_h)
+            valid[valid] = visibility[valid] > self.min_visibility
+
+        # Add the objects to the frame (ensure they are inside the image)
+        boxes = np.empty(int(valid.sum()), dtype=BOX_DTYPE)
+        boxes['class_id'] = class_ids[valid]
+        boxes['x1'], boxes['y1'], boxes['x2'], boxes['y2'] = rects[valid].T
+        boxes['visibility'] = visibility[valid]
+        boxes['actor_id'] = actor_ids[valid]
+        self.data['bboxs'] = boxes
+
+        if self.kitti:
+            # Same actors and visibility scores, boxes which are not on the image are unknown (NaN)
+            self.data['kitti_labels'] = kitti_labels(state, rows, entries, self.K, world_2_camera, self.image_w,
+                                                     self.image_h, visibility=None if self.depth_camera is None
+                                                     else visibility[:len(entries)])
+            self.data['kitti_calib'] = kitti_calib(self.K, world_2_camera, state.matrix(self._parent.id))
+
+    def annotate(self, state):
+        """ Project the bounding boxes of the actors at this frame. """
+        self.bounding(state)
+
+    def _decode(self, image, data):
+        """ Convert RGB image to numpy array. """
         # print('RGB camera received at frame %06d.' % image.frame)
 
         np_img = np.frombuffer(image.raw_data, dtype=np.uint8)
@@ -114,7 +167,8 @@ class RGBBboxsCamera(CarlaSensor):
         # Convert to RGB
         np_img = np_img[:, :, :3]
         # Since np_img is from the buffer, which is reused by Carla
-        # Making a copy makes sure rgb_image is not subject to side-effect when the underlying buffer is modified
-        self.data['rgb_image'] = np_img.copy()
-
+        # Copying it into a pooled buffer makes sure rgb_image is not subject to side-effect when the underlying buffer is modified
+        rgb_image = self._frame_buffer('rgb_image', data)
+        np.copyto(rgb_image, np_img)
+        data['rgb_image'] = rgb_image
 
@@ -42,33 +42,29 @@ class GNSS(CarlaSensor):
             'noise_lon_bias', gnss_config['noise_lon_bias'])
         gnss_bp.set_attribute('noise_lon_stddev',
                               gnss_config['noise_lon_stddev'])
+        self.set_sensor_tick(gnss_bp, gnss_config['sensor_trick'])
 
         self.sensor = carla_world.spawn_actor(gnss_bp,
                                               carla.Transform(carla.Location(
                                                   x=gnss_config['pos_x'], z=0.0)),
                                               attach_to=self._parent)
-        self.sensor.listen(lambda event: self._queue.put(event))
+        self.sensor.listen(lambda event: self._put(event))
 
         # Object to transform from geo location to carla location
         self._geo2location = Geo2Location(carla_world.get_map())
 
-    def update(self):
-        """ Wait for GNSS measurement and update data. """
-        # get() blocks the script so synchronization is guaranteed
-        event = self._queue.get()
-
+    def _decode(self, event, data):
+        """ Convert GNSS measurement to geolocation and carla location. """
         # print('GNSS sensor received at frame %06d.' % event.frame)
 
-        self.data['timestamp'] = event.timestamp
-        self.data['frame'] = event.frame
-        self.data['latitude'] = event.latitude
-        self.data['longitude'] = event.longitude
-        self.data['altitude'] = event.altitude
+        data['latitude'] = event.latitude
+        data['longitude'] = event.longitude
+        data['altitude'] = event.altitude
 
         # Get transform from geolocation to location
         location = self._geo2location.transform(
-            carla.GeoLocation(self.data['latitude'], self.data['longitude'], self.data['altitude']))
+            carla.GeoLocation(data['latitude'], data['longitude'], data['altitude']))
 
-        self.data['x'] = location.x
-        self.data['y'] = location.y
-        self.data['z'] = location.z
\ No newline at end of file
+        data['x'] = location.x
+        data['y'] = location.y
+        data['z'] = location.z
\ No newline at end of file
@@ -2,40 +2,177 @@
 import numpy as np
 import carla
 from .base import CarlaSensor
+from simulation.utils.instance import split_instance, instance_table, mask_boxes
+from simulation.utils.util import build_projection_matrix, box_vertices, project_points
+from simulation.utils.objects import object_table, count_pixels
 
 class InstanceCamera(CarlaSensor):
+    """
+    Class for instance segmentation camera.
+
+    By default the 3-channel image is stored as in_image. With compact encoding, it is split into a uint16 object id
+    map (instance_ids) and a uint8 semantic tag map (semantic_tags), along with a table of the pixel count and
+    bounding rectangle of every object (instance_table), see simulation/utils/instance.py.
+
+    Since the R channel holds the semantic tag, the camera can also produce labelIds_image itself, which makes
+    a separate SemanticCamera unnecessary. Use simulation/tools/label_consistency.py to check both agree.
+
+    With boxes enabled, the boxes of the visible vehicles and pedestrians are taken from the instance table (boxes),
+    see simulation/utils/instance.py:mask_boxes(). They are tight and only exist for actors with visible pixels.
+
+    With objects enabled, facts about every actor are gathered in a table (objects): distance and relative velocity
+    to the ego vehicle, 3D box, visible pixels and whether it is in frame, see simulation/utils/objects.py.
+    """
     def __init__(self, name, in_cam_config, parent_actor=None):
         super().__init__(name, parent_actor)
+        self.compact = in_cam_config.get('compact', False)
+        self.labelIds = in_cam_config.get('labelIds', False)
+        # Key of the semantic tag map, it is the labelIds image if the camera stands in for a SemanticCamera
+        self._tags_key = 'labelIds_image' if self.labelIds else 'semantic_tags'
+        self.boxes = in_cam_config.get('boxes', False)
+        # Classes of actors to match boxes to, see ACTOR_CLASSES
+        self.bbox_classes = in_cam_config.get('bbox_classes', ('vehicle', 'pedestrian'))
+        self.min_pixels = in_cam_config.get('min_pixels', 1)
+        self.objects = in_cam_config.get('objects', False)
+
         self.data['timestamp'] = 0
         self.data['frame'] = 0
-        self.data['in_image'] = None
+        if self.compact:
+            self.data['instance_ids'] = None
+            self.data[self._tags_key] = None
+            self.data['instance_table'] = None
+        else:
+            self.data['in_image'] = None
+            if self.labelIds:
+                self.data['labelIds_image'] = None
+        if self.boxes or self.objects:
+            self.data['instance_table'] = None
+            # Actors at the frame, see annotate()
+            self.data['actors'] = None
+        if self.boxes:
+            self.data['boxes'] = None
+        if self.objects:
+            self.data['objects'] = None
 
         carla_world = self._parent.get_world()
         in_cam_bp = carla_world.get_blueprint_library().find('sensor.camera.instance_segmentation')
         in_cam_bp.set_attribute('image_size_x', in_cam_config['img_width'])
         in_cam_bp.set_attribute('image_size_y', in_cam_config['img_height'])
         in_cam_bp.set_attribute('fov', in_cam_config['fov'])
+        self.set_sensor_tick(in_cam_bp, in_cam_config['sensor_trick'])
 
         self.sensor = carla_world.spawn_actor(in_cam_bp,
                                               carla.Transform(carla.Location(x=in_cam_config['pos_x'], z=in_cam_config['pos_z'])),
                                               attach_to=self._parent)
 
-        self.sensor.listen(lambda image: self._queue.put(image))
+        self.sensor.listen(lambda image: self._put(image))
 
-    def update(self):
-        """ Wait for instance image and update data. """
-        image = self._queue.get()
+        self.image_w = int(in_cam_config['img_width'])
+        self.image_h = int(in_cam_config['img_height'])
+        # Calculate the camera projection matrix to project from 3D -> 2D
+        self.K = build_projection_matrix(self.image_w, self.image_h, float(in_cam_config['fov']))
 
-        # print('Instance camera received at frame %06d.' % image.frame)
+        shape = (self.image_h, self.image_w)
+        if self.compact:
+            self.add_frame_pool('instance_ids', shape, np.uint16, in_cam_config['pool_size'])
+            self.add_frame_pool(self._tags_key, shape, np.uint8, in_cam_config['pool_size'])
+        else:
+            self.add_frame_pool('in_image', shape + (3,), np.uint8, in_cam_config['pool_size'])
+            if self.labelIds:
+                self.add_frame_pool('labelIds_image', shape, np.uint8, in_cam_config['pool_size'])
 
-        self.data['timestamp'] = image.timestamp
-        self.data['frame'] = image.frame
+    def _decode(self, image, data):
+        """ Convert instance image to numpy array. """
+        # print('Instance camera received at frame %06d.' % image.frame)
 
         np_img = np.frombuffer(image.raw_data, dtype=np.uint8)
         # Reshape to BGRA format
         np_img = np.reshape(np_img, (image.height, image.width, -1))
+
+        if self.compact:
+            # Split ids and tags straight into pooled buffers
+            instance_ids, semantic_tags = split_instance(np_img,
+                                                         ids_out=self._frame_buffer('instance_ids', data),
+                                                         tags_out=self._frame_buffer(self._tags_key, data))
+            data['instance_ids'] = instance_ids
+            data[self._tags_key] = semantic_tags
+            data['instance_table'] = instance_table(instance_ids, semantic_tags)
+            if self._has_actors(data):
+                self._annotate_table(data)
+            return
+
+        if self.labelIds:
+            # Semantic tags are stored in the R channel, as for the semantic camera
+            labelIds_image = self._frame_buffer('labelIds_image', data)
+            np.copyto(labelIds_image, np_img[:, :, 2])
+            data['labelIds_image'] = labelIds_image
+
+        if self.boxes or self.objects:
+            instance_ids, semantic_tags = split_instance(np_img)
+            data['instance_table'] = instance_table(instance_ids, semantic_tags)
+            if self._has_actors(data):
+                self._annotate_table(data)
+
         # Convert to RGB
         np_img = np_img[:, :, :3]
         # Since np_img is from the buffer, which is reused by Carla
-        # Making a copy makes sure in_image is not subject to side-effect when the underlying buffer is modified
-        self.data['in_image'] = np_img.copy()
\ No newline at end of file
+        # Copying it into a pooled buffer makes sure in_image is not subject to side-effect when the underlying buffer is modified
+        in_image = self._frame_buffer('in_image', data)
+        np.copyto(in_image, np_img)
+        data['in_image'] = in_image
+
+    def annotate(self, state):
+        """
+        Keep the ids, classes and projected 3D boxes of the actors at this frame, the boxes are matched to them,
+        and gather the objects table.
+
+        No request is sent to the server, everything is read from the snapshot and the actor registry.
+        """
+        if not (self.boxes or self.objects):
+            return
+
+        rows, entries = state.select(self.bbox_classes)
+        # Filter out the ego vehicle
+        not_ego = state.ids[rows] != self._parent.id
+        rows, entries = rows[not_ego], entries[not_ego]
+        registry = state.registry
+
+        # Amodal rectangles, i.e. of the whole projected 3D boxes, not clipped to the image
+        vertices = box_vertices(state.matrices[rows], registry.box_locations[entries], registry.box_extents[entries])
+        points_img = project_points(vertices.reshape(-1, 3), self.K, state.inverse_matrix(self.sensor.id)).reshape(-1, 8, 3)
+        rects = np.concatenate([points_img[:, :, :2].min(axis=1), points_img[:, :, :2].max(axis=1)], axis=1)
+        rects[~np.all(points_img[:, :, 2] > 0.0, axis=1)] = np.nan
+
+        self.data['actors'] = {'frame': state.frame, 'ids': registry.ids[entries], 'classes': registry.classes[entries],
+                               'rects': rects}
+        if self.objects:
+            self.data['objects'] = object_table(state, rows, entries, self._parent.id, rects, self.image_w, self.image_h)
+
+        if self._event is None and self.data['instance_table'] is not None:
+            # The frame has been decoded before the actors were known
+            self._annotate_table(self.data)
+
+    def _has_actors(self, data):
+        """
+        Whether the actors kept by annotate() are those of the frame of data. A frame decoded before annotate() runs at
+        it still holds the actors of a previous frame, annotate() derives its boxes and pixels instead.
+        """
+        actors = data.get('actors')
+        return actors is not None and actors['frame'] == data['frame']
+
+    def _annotate_table(self, data):
+        """ Derive the boxes and the visible pixels of the actors from the instance table. """
+        if self.boxes:
+            data['boxes'] = self._mask_boxes(data)
+        objects = data.get('objects')
+        # Objects of a previous frame, already handed over, are left alone: annotate() counts the pixels of this one
+        if self.objects and objects is not None and np.all(objects['frame'] == data['frame']):
+            count_pixels(objects, data['instance_table'], self.image_w, self.image_h)
+
+    def _mask_boxes(self, data):
+        """ Get the boxes of the visible actors from the instance table. """
+        actors = data.get('actors')
+        if actors is None:
+            actors = {'ids': np.empty(0, dtype=np.int64), 'classes': np.empty(0, dtype=np.uint8), 'rects': None}
+        return mask_boxes(data['instance_table'], self.image_w, self.image_h, actors['ids'], actors['classes'],
+                          actors['rects'], self.min_pixels)
\ No newline at end of file
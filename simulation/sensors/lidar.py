@@ -0,0 +1,74 @@
+
+import numpy as np
+import carla
+from .base import CarlaSensor
+
+# Layout of a point in the raw data of carla.LidarMeasurement
+LIDAR_DTYPE = np.dtype([
+    ('x', np.float32),
+    ('y', np.float32),
+    ('z', np.float32),
+    ('intensity', np.float32),
+])
+
+# Layout of a point in the raw data of carla.SemanticLidarMeasurement
+SEMANTIC_LIDAR_DTYPE = np.dtype([
+    ('x', np.float32),
+    ('y', np.float32),
+    ('z', np.float32),
+    ('cos_inc_angle', np.float32),  # cosine of the incident angle of the ray
+    ('object_idx', np.uint32),      # id of the actor hit
+    ('object_tag', np.uint32),      # semantic tag (labelId) of the actor hit
+])
+
+
+class Lidar(CarlaSensor):
+    """
+    Class for ray-cast LiDAR.
+
+    data['points'] is a numpy structured array of LIDAR_DTYPE in the sensor coordinate system.
+    """
+
+    BLUEPRINT = 'sensor.lidar.ray_cast'
+    DTYPE = LIDAR_DTYPE
+
+    def __init__(self, name, lidar_config, parent_actor=None):
+        """ Constructor method. """
+        super().__init__(name, parent_actor)
+        self.data['timestamp'] = 0
+        self.data['frame'] = 0
+        self.data['points'] = None
+
+        carla_world = self._parent.get_world()
+        lidar_bp = carla_world.get_blueprint_library().find(self.BLUEPRINT)
+        for attribute in ('channels', 'range', 'points_per_second', 'upper_fov', 'lower_fov'):
+            lidar_bp.set_attribute(attribute, lidar_config[attribute])
+        # One full turn per tick, so the cloud of a captured frame covers 360 degrees
+        delta_seconds = carla_world.get_settings().fixed_delta_seconds
+        if delta_seconds:
+            lidar_bp.set_attribute('rotation_frequency', str(1.0 / delta_seconds))
+        self.set_sensor_tick(lidar_bp, lidar_config['sensor_trick'])
+
+        self.sensor = carla_world.spawn_actor(lidar_bp,
+                                              carla.Transform(
+                                                  carla.Location(x=lidar_config['pos_x'], z=lidar_config['pos_z'])),
+                                              attach_to=self._parent)
+
+        self.sensor.listen(lambda measurement: self._put(measurement))
+
+    def _decode(self, measurement, data):
+        """ View the raw points as a structured array. """
+        # The number of points varies from frame to frame, so they are copied rather than written into a pooled buffer.
+        # Copying makes sure points are not subject to side-effect when the buffer reused by Carla is modified.
+        data['points'] = np.frombuffer(measurement.raw_data, dtype=self.DTYPE).copy()
+
+
+class SemanticLidar(Lidar):
+    """
+    Class for semantic LiDAR.
+
+    data['points'] is a numpy structured array of SEMANTIC_LIDAR_DTYPE in the sensor coordinate system.
+    """
+
+    BLUEPRINT = 'sensor.lidar.ray_cast_semantic'
+    DTYPE = SEMANTIC_LIDAR_DTYPE
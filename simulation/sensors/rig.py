@@ -0,0 +1,135 @@
+
+import threading
+import numpy as np
+import carla
+
+from .base import CarlaSensor
+
+# Blueprint of each modality of the rig
+RIG_BLUEPRINTS = {
+    'rgb': 'sensor.camera.rgb',
+    'semantic': 'sensor.camera.semantic_segmentation',
+    'instance': 'sensor.camera.instance_segmentation',
+}
+
+
+class RigEvent(object):
+    """ Images of all the cameras of a rig at one frame. """
+
+    def __init__(self, frame, timestamp, images):
+        """
+        Constructor method.
+
+        Input:
+            frame: Int of frame id.
+            timestamp: Float of simulation time.
+            images: Dict of carla.Image keyed by (view, modality).
+        """
+        self.frame = frame
+        self.timestamp = timestamp
+        self.images = images
+
+
+class CameraRig(CarlaSensor):
+    """
+    Class for a rig of synchronized cameras registered to World as one sensor.
+
+    From one config, it spawns a camera of every modality (RGB, semantic, instance) at every pose, e.g. front, left,
+    right and rear. Images of the same frame are gathered into one RigEvent, and all views of a modality are decoded
+    into one pooled NxHxW(x3) buffer, where N is the number of views:
+
+        data['views']: List of view names, in the order of the first axis of the buffers.
+        data['rgb_images']: NxHxWx3 uint8 BGR images.
+        data['labelIds_images']: NxHxW uint8 labelIds.
+        data['in_images']: NxHxWx3 uint8 instance images.
+    """
+
+    def __init__(self, name, rig_config, parent_actor=None):
+        """ Constructor method. """
+        super().__init__(name, parent_actor)
+
+        self.views = list(rig_config['poses'].keys())
+        self.modalities = list(rig_config['modalities'])
+
+        self.data['timestamp'] = 0
+        self.data['frame'] = 0
+        self.data['views'] = self.views
+
+        # Images gathered for frames which are not complete yet, {frame: {(view, modality): image}}
+        self._pending = {}
+        self._pending_lock = threading.Lock()
+        self._max_pending = rig_config.get('max_pending_frames', 8)
+
+        carla_world = self._parent.get_world()
+        blueprint_library = carla_world.get_blueprint_library()
+
+        self.sensors = {}
+        for view, pose in rig_config['poses'].items():
+            transform = carla.Transform(carla.Location(x=pose['x'], y=pose['y'], z=pose['z']),
+                                        carla.Rotation(pitch=pose.get('pitch', 0.0), yaw=pose['yaw']))
+            for modality in self.modalities:
+                cam_bp = blueprint_library.find(RIG_BLUEPRINTS[modality])
+                cam_bp.set_attribute('image_size_x', rig_config['img_width'])
+                cam_bp.set_attribute('image_size_y', rig_config['img_height'])
+                cam_bp.set_attribute('fov', rig_config['fov'])
+                self.set_sensor_tick(cam_bp, rig_config['sensor_trick'])
+
+                sensor = carla_world.spawn_actor(cam_bp, transform, attach_to=self._parent)
+                sensor.listen(lambda image, key=(view, modality): self._put_view(key, image))
+                self.sensors[(view, modality)] = sensor
+
+        shape = (len(self.views), int(rig_config['img_height']), int(rig_config['img_width']))
+        if 'rgb' in self.modalities:
+            self.add_frame_pool('rgb_images', shape + (3,), np.uint8, rig_config['pool_size'])
+        if 'semantic' in self.modalities:
+            self.add_frame_pool('labelIds_images', shape, np.uint8, rig_config['pool_size'])
+        if 'instance' in self.modalities:
+            self.add_frame_pool('in_images', shape + (3,), np.uint8, rig_config['pool_size'])
+
+    def _put_view(self, key, image):
+        """ Listen callback gathering the images of a frame, which are put as one RigEvent once all have arrived. """
+        with self._pending_lock:
+            images = self._pending.setdefault(image.frame, {})
+            images[key] = image
+            if len(images) < len(self.sensors):
+                # Drop the oldest incomplete frames if too many are pending
+                while len(self._pending) > self._max_pending:
+                    del self._pending[min(self._pending)]
+                return
+            del self._pending[image.frame]
+
+        self._put(RigEvent(image.frame, image.timestamp, images))
+
+    def _decode(self, event, data):
+        """ Decode the images of all views, one modality at a time into a shared pooled buffer. """
+        if 'rgb' in self.modalities:
+            rgb_images = self._frame_buffer('rgb_images', data)
+            for i, view in enumerate(self.views):
+                np.copyto(rgb_images[i], self._to_array(event.images[(view, 'rgb')])[:, :, :3])
+            data['rgb_images'] = rgb_images
+
+        if 'semantic' in self.modalities:
+            labelIds_images = self._frame_buffer('labelIds_images', data)
+            for i, view in enumerate(self.views):
+                # Semantic info is stored only in the R channel
+                np.copyto(labelIds_images[i], self._to_array(event.images[(view, 'semantic')])[:, :, 2])
+            data['labelIds_images'] = labelIds_images
+
+        if 'instance' in self.modalities:
+            in_images = self._frame_buffer('in_images', data)
+            for i, view in enumerate(self.views):
+                np.copyto(in_images[i], self._to_array(event.images[(view, 'instance')])[:, :, :3])
+            data['in_images'] = in_images
+
+    @staticmethod
+    def _to_array(image):
+        """ View the raw data of a carla.Image as a HxWx4 BGRA numpy array without copying. """
+        return np.reshape(np.frombuffer(image.raw_data, dtype=np.uint8), (image.height, image.width, -1))
+
+    def destroy(self):
+        """ Destroy all camera actors of the rig. """
+        if self.sensors:
+            print('Destroying {}'.format(self.name))
+            for sensor in self.sensors.values():
+                sensor.destroy()
+            self.sensors.clear()
@@ -4,14 +4,18 @@ import carla
 from .base import CarlaSensor
 
 class SemanticCamera(CarlaSensor):
-    """ Class for semantic camera. """
+    """
+    Class for semantic camera.
+
+    Only labelIds are extracted from the image. The CityScapes color image is derived from them at write time
+    with simulation.utils.palette.colorize() instead of converting the carla.Image a second time.
+    """
 
     def __init__(self, name, ss_cam_config, parent_actor=None):
         """ Constructor method. """
         super().__init__(name, parent_actor)
         self.data['timestamp'] = 0
         self.data['frame'] = 0
-        self.data['ss_image'] = None
         self.data['labelIds_image'] = None
 
         carla_world = self._parent.get_world()
@@ -20,33 +24,28 @@ class SemanticCamera(CarlaSensor):
         ss_cam_bp.set_attribute('image_size_x', ss_cam_config['img_width'])
         ss_cam_bp.set_attribute('image_size_y', ss_cam_config['img_height'])
         ss_cam_bp.set_attribute('fov', ss_cam_config['fov'])
+        self.set_sensor_tick(ss_cam_bp, ss_cam_config['sensor_trick'])
 
         self.sensor = carla_world.spawn_actor(ss_cam_bp,
                                               carla.Transform(
                                                   carla.Location(x=ss_cam_config['pos_x'], z=ss_cam_config['pos_z'])),
                                               attach_to=self._parent)
 
-        self.sensor.listen(lambda image: self._queue.put(image))
+        self.sensor.listen(lambda image: self._put(image))
 
-    def update(self):
-        """ Wait for semantic image and update data. """
-        image = self._queue.get()
+        self.add_frame_pool('labelIds_image', (int(ss_cam_config['img_height']), int(ss_cam_config['img_width'])), np.uint8,
+                            ss_cam_config['pool_size'])
 
+    def _decode(self, image, data):
+        """ Extract labelIds from semantic image. """
         # print('Semantic camera received at frame %06d.' % image.frame)
 
-        self.data['timestamp'] = image.timestamp
-        self.data['frame'] = image.frame
-
-
         np_img = np.frombuffer(image.raw_data, dtype=np.uint8)
         # Reshap to BGRA format
         np_img = np.reshape(np_img, (image.height, image.width, -1))
         # Semantic info is stored only in the R channel
         # Since np_img is from the buffer, which is reused by Carla
-        # Making a copy makes sure ss_image is not subject to side-effect when the underlying buffer is modified
-        self.data['labelIds_image'] = np_img[:, :, 2].copy()
-
-        image.convert(carla.ColorConverter.CityScapesPalette)
-        np_img = np.frombuffer(image.raw_data, dtype=np.uint8)
-        np_img = np.reshape(np_img, (image.height, image.width, -1))
-        self.data['ss_image'] = np_img[:, :, :3].copy()
\ No newline at end of file
+        # Copying it into a pooled buffer makes sure labelIds_image is not subject to side-effect when the underlying buffer is modified
+        labelIds_image = self._frame_buffer('labelIds_image', data)
+        np.copyto(labelIds_image, np_img[:, :, 2])
+        data['labelIds_image'] = labelIds_image
\ No newline at end of file
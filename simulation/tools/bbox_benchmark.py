@@ -0,0 +1,161 @@
+
+import time
+import argparse
+import numpy as np
+
+from simulation.utils.util import (build_projection_matrix, get_image_point, box_vertices, filter_actors,
+                                   project_boxes)
+from simulation.utils.depth import box_visibility
+
+
+class Location(object):
+    """ Stand-in for carla.Location, get_image_point() only reads x, y and z. """
+
+    def __init__(self, x, y, z):
+        self.x, self.y, self.z = x, y, z
+
+
+def timeit(func, repeat):
+    """ Return the average milliseconds of calling func. """
+    func()
+    start = time.perf_counter()
+    for _ in range(repeat):
+        func()
+    return (time.perf_counter() - start) / repeat * 1000.0
+
+
+def loop_boxes(locations, vertices, origin, forward, K, w2c, image_w, image_h):
+    """ Per-actor loop of RGBBboxsCamera.bounding() before it was vectorized, one get_image_point() per vertex. """
+    rects = []
+    for location, verts in zip(locations, vertices):
+        ray = location - origin
+        if np.linalg.norm(ray) < 500 and np.dot(forward, ray) > 1:
+            x_max = -10000
+            x_min = 10000
+            y_max = -10000
+            y_min = 10000
+            for vert in verts:
+                p = get_image_point(Location(*vert), K, w2c)
+                x_max = max(x_max, p[0])
+                x_min = min(x_min, p[0])
+                y_max = max(y_max, p[1])
+                y_min = min(y_min, p[1])
+            if x_min > 0 and x_max < image_w and y_min > 0 and y_max < image_h:
+                rects.append((x_min, y_min, x_max, y_max))
+    return rects
+
+
+def batch_boxes(matrices, box_locations, box_extents, origin, forward, K, w2c, image_w, image_h):
+    """ Batched projection used by RGBBboxsCamera.bounding(). """
+    mask = filter_actors(matrices[:, :3, 3], origin, forward)
+    vertices = box_vertices(matrices[mask], box_locations[mask], box_extents[mask])
+    rects, valid = project_boxes(vertices, K, w2c, image_w, image_h)
+    return rects[valid]
+
+
+def random_scene(num_actors, seed):
+    """ Walker sized boxes scattered around a camera at the origin looking along x. """
+    rng = np.random.default_rng(seed)
+    yaws = rng.uniform(-np.pi, np.pi, num_actors)
+    matrices = np.tile(np.identity(4), (num_actors, 1, 1))
+    matrices[:, 0, 0] = matrices[:, 1, 1] = np.cos(yaws)
+    matrices[:, 0, 1] = -np.sin(yaws)
+    matrices[:, 1, 0] = np.sin(yaws)
+    matrices[:, :3, 3] = np.column_stack([rng.uniform(-50, 100, num_actors), rng.uniform(-50, 50, num_actors),
+                                          np.zeros(num_actors)])
+    box_locations = np.tile([0.0, 0.0, 0.9], (num_actors, 1))
+    box_extents = np.tile([0.3, 0.3, 0.9], (num_actors, 1))
+    # Camera 2.4m above the origin, world to camera is the inverse of its transform
+    w2c = np.identity(4)
+    w2c[2, 3] = -2.4
+    return matrices, box_locations, box_extents, w2c
+
+
+def benchmark(num_actors, width, height, fov, repeat, seed):
+    """ Time both projections on a synthetic scene and check they find the same rectangles. """
+    K = build_projection_matrix(width, height, fov)
+    matrices, box_locations, box_extents, w2c = random_scene(num_actors, seed)
+    origin = np.zeros(3)
+    forward = np.array([1.0, 0.0, 0.0])
+    vertices = box_vertices(matrices, box_locations, box_extents)
+
+    loop_ms = timeit(lambda: loop_boxes(matrices[:, :3, 3], vertices, origin, forward, K, w2c, width, height), repeat)
+    batch_ms = timeit(lambda: batch_boxes(matrices, box_locations, box_extents, origin, forward, K, w2c, width, height),
+                      repeat)
+
+    expected = np.array(loop_boxes(matrices[:, :3, 3], vertices, origin, forward, K, w2c, width, height)).reshape(-1, 4)
+    rects = batch_boxes(matrices, box_locations, box_extents, origin, forward, K, w2c, width, height)
+    same = expected.shape == rects.shape and np.allclose(expected, rects)
+
+    print('%4d actors, %3d boxes: loop %.3f ms, batch %.3f ms (x%.1f), same rectangles: %s'
+          % (num_actors, len(rects), loop_ms, batch_ms, loop_ms / batch_ms, same))
+
+
+def check_visibility(width, height, fov):
+    """ Score a walker 10 m ahead of the camera against synthetic depth frames and check the expected visibility. """
+    K = build_projection_matrix(width, height, fov)
+    matrix = np.identity(4)
+    matrix[0, 3] = 10.0
+    vertices = box_vertices(matrix[None], np.array([[0.0, 0.0, 0.0]]), np.array([[0.3, 0.3, 0.9]]))
+    w2c = np.identity(4)
+
+    def wall(depth, columns=slice(None)):
+        # Depth frame of the background 50 m away and the front face of the walker, with a wall at depth over columns
+        frame = np.full((height, width), 50.0)
+        rect = project_boxes(vertices, K, w2c, width, height)[0][0].astype(int)
+        frame[rect[1]:rect[3], rect[0]:rect[2]] = 9.7
+        frame[:, columns] = np.minimum(frame[:, columns], depth)
+        return lambda u, v: frame[v, u]
+
+    cases = [
+        ('unoccluded', wall(np.inf), 1.0),
+        ('behind a wall at 8.5 m', wall(8.5), 0.0),
+        ('0.4 m behind a wall', wall(9.3), 0.0),
+        # Samples are on a 3x3x3 grid, the wall hides the column of samples left of the center
+        ('left side behind a wall', wall(8.5, slice(0, width // 2)), 2.0 / 3.0),
+    ]
+    for name, depth_lookup, expected in cases:
+        visibility = box_visibility(vertices, K, w2c, depth_lookup, width, height)[0]
+        print('walker %s: visibility %.2f (expected %.2f)%s'
+              % (name, visibility, expected, '' if abs(visibility - expected) < 0.01 else ', FAILED'))
+
+
+if __name__ == '__main__':
+    argparser = argparse.ArgumentParser(
+        description='Benchmark batched bounding box projection against the per-actor loop, and check box visibility')
+    argparser.add_argument(
+        '--actors',
+        default=[10, 120, 500],
+        type=int,
+        nargs='+',
+        help='Numbers of actors in the synthetic scenes (default: 10 120 500)')
+    argparser.add_argument(
+        '--width',
+        default=2048,
+        type=int,
+        help='Image width (default: 2048)')
+    argparser.add_argument(
+        '--height',
+        default=1024,
+        type=int,
+        help='Image height (default: 1024)')
+    argparser.add_argument(
+        '--fov',
+        default=70.0,
+        type=float,
+        help='Horizontal field of view (default: 70)')
+    argparser.add_argument(
+        '-n', '--repeat',
+        default=20,
+        type=int,
+        help='Number of repetitions (default: 20)')
+    argparser.add_argument(
+        '--seed',
+        default=0,
+        type=int,
+        help='Seed of the synthetic scenes (default: 0)')
+    args = argparser.parse_args()
+
+    for num_actors in args.actors:
+        benchmark(num_actors, args.width, args.height, args.fov, args.repeat, args.seed)
+    check_visibility(args.width, args.height, args.fov)
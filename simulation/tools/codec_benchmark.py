@@ -0,0 +1,112 @@
+import glob
+import time
+import argparse
+import cv2
+import numpy as np
+
+from path import Path
+from simulation.utils.codecs import MODALITIES, PNGCodec, WebPCodec, JPEGCodec, NPYCodec, PalettePNGCodec
+from simulation.utils.instance import split_instance
+from simulation.utils.palette import colorize
+
+PROJECT_DIR = Path(__file__).parent.parent.parent.abspath()
+
+
+def load_samples(directory, limit):
+    """ Get the images of every modality of the sample frames, derived from the _img, _labelIds and _instance files. """
+    samples = {modality: [] for modality in MODALITIES}
+    for labelIds_path in sorted(glob.glob(Path(directory) / '*_labelIds.png'))[:limit]:
+        prefix = labelIds_path[:-len('_labelIds.png')]
+        label_ids = cv2.imread(labelIds_path, cv2.IMREAD_UNCHANGED)
+        samples['labelIds'].append(label_ids)
+        samples['color'].append(colorize(label_ids))
+
+        rgb = cv2.imread(prefix + '_img.png')
+        if rgb is not None:
+            samples['rgb'].append(rgb)
+        instance = cv2.imread(prefix + '_instance.png')
+        if instance is not None:
+            samples['instance'].append(instance)
+            instance_ids, semantic_tags = split_instance(instance)
+            samples['instance_ids'].append(instance_ids)
+            samples['instance_tags'].append(semantic_tags)
+    return samples
+
+
+def candidate_codecs(levels, quality):
+    """ Get the codecs to compare, by name. """
+    codecs = {}
+    for level in levels:
+        codecs['png -%d' % level] = PNGCodec(level)
+        codecs['palette_png -%d' % level] = PalettePNGCodec(level)
+    codecs['webp lossless'] = WebPCodec()
+    codecs['jpeg q%d' % quality] = JPEGCodec(quality)
+    codecs['npy'] = NPYCodec()
+    return codecs
+
+
+def benchmark(codec, images, repeat):
+    """ Return the mean encode ms, decode ms and bytes per image, and the largest error after decoding. """
+    encode_ms, decode_ms, sizes, error = [], [], [], 0
+    for image in images:
+        for _ in range(repeat):
+            start = time.perf_counter()
+            data = codec.encode(image)
+            encode_ms.append((time.perf_counter() - start) * 1000.0)
+
+            start = time.perf_counter()
+            decoded = codec.decode(data)
+            decode_ms.append((time.perf_counter() - start) * 1000.0)
+        sizes.append(len(data))
+        error = max(error, int(np.abs(decoded.astype(np.int32) - image.astype(np.int32)).max()))
+    return np.mean(encode_ms), np.mean(decode_ms), np.mean(sizes), error
+
+
+if __name__ == '__main__':
+    argparser = argparse.ArgumentParser(
+        description='Benchmark encode time, decode time and size of every codec on every modality of sample frames')
+    argparser.add_argument(
+        '--dir',
+        type=str,
+        default=str(PROJECT_DIR / 'images'),
+        help='Directory of _img.png, _labelIds.png and _instance.png sample frames (default: images/)')
+    argparser.add_argument(
+        '-n', '--frames',
+        default=4,
+        type=int,
+        help='Number of sample frames (default: 4)')
+    argparser.add_argument(
+        '-r', '--repeat',
+        default=3,
+        type=int,
+        help='Number of repetitions per image (default: 3)')
+    argparser.add_argument(
+        '--levels',
+        default=[1, 3, 6, 9],
+        nargs='+',
+        type=int,
+        help='PNG compression levels to compare (default: 1 3 6 9)')
+    argparser.add_argument(
+        '--quality',
+        default=95,
+        type=int,
+        help='JPEG quality (default: 95)')
+    args = argparser.parse_args()
+
+    samples = load_samples(args.dir, args.frames)
+    codecs = candidate_codecs(args.levels, args.quality)
+    for modality, (dtype, channels) in MODALITIES.items():
+        images = samples[modality]
+        if not images:
+            continue
+        raw_bytes = images[0].nbytes
+        print('%s (%d frames, %dx%d, %s, %d channels, %.0f KB raw)'
+              % (modality, len(images), images[0].shape[1], images[0].shape[0], np.dtype(dtype).name, channels,
+                 raw_bytes / 1024.0))
+        for name, codec in codecs.items():
+            if not codec.supports(dtype, channels):
+                continue
+            encode_ms, decode_ms, size, error = benchmark(codec, images, args.repeat)
+            print('  %-16s encode %7.2f ms  decode %7.2f ms  %8.0f KB  %5.1f%% of raw  %s'
+                  % (name, encode_ms, decode_ms, size / 1024.0, size / raw_bytes * 100.0,
+                     'lossless' if error == 0 else 'max error %d' % error))
@@ -0,0 +1,191 @@
+
+import glob
+import random
+import argparse
+import numpy as np
+
+from path import Path
+from simulation.utils.palette import CITYSCAPES_PALETTE
+from simulation.utils.codecs import find_image, read_image
+
+PROJECT_DIR = Path(__file__).parent.parent.parent.abspath()
+
+# Names of labelIds, see README.md
+LABEL_NAMES = ['unlabeled', 'road', 'sidewalk', 'building', 'wall', 'fence', 'pole', 'traffic light', 'traffic sign',
+               'vegetation', 'terrain', 'sky', 'pedestrian', 'rider', 'car', 'truck', 'bus', 'train', 'motorcycle',
+               'bicycle', 'static', 'dynamic', 'other', 'water', 'road line', 'ground', 'bridge', 'rail track',
+               'guard rail']
+
+
+class LabelConsistencyChecker(object):
+    """
+    Compare labelIds from the semantic camera with the semantic tags in the R channel of the instance camera.
+
+    It accumulates a confusion matrix over a sample of frames, to confirm that the CARLA version in use encodes
+    tags the same way in both sensors before InstanceCameraConfig['labelIds'] replaces the semantic camera.
+    """
+
+    def __init__(self):
+        """ Constructor method. """
+        # confusion[i, j] counts pixels labelled i by the semantic camera and j by the instance camera
+        self.confusion = np.zeros((256, 256), dtype=np.int64)
+        self.num_frames = 0
+
+    def add(self, semantic_labelIds, instance_labelIds):
+        """
+        Accumulate one frame.
+
+        Input:
+            semantic_labelIds: HxW uint8 numpy array of labelIds from the semantic camera.
+            instance_labelIds: HxW uint8 numpy array of the R channel of the instance camera.
+        """
+        pairs = semantic_labelIds.astype(np.intp) * 256 + instance_labelIds
+        self.confusion += np.bincount(pairs.ravel(), minlength=256 * 256).reshape(256, 256)
+        self.num_frames += 1
+
+    def agreement(self):
+        """ Get the ratio of pixels on which both sources agree. """
+        total = self.confusion.sum()
+        return np.trace(self.confusion) / total if total else float('nan')
+
+    def report(self, top=10):
+        """ Print overall and per class agreement and the most frequent disagreements. """
+        print('%d frames, %.4f%% pixels agree' % (self.num_frames, self.agreement() * 100.0))
+
+        pixels = self.confusion.sum(axis=1)
+        for label in np.flatnonzero(pixels):
+            name = LABEL_NAMES[label] if label < len(LABEL_NAMES) else str(label)
+            print('  %-14s %12d pixels, %8.4f%% agree' % (name, pixels[label], self.confusion[label, label] / pixels[label] * 100.0))
+
+        disagreement = self.confusion.copy()
+        np.fill_diagonal(disagreement, 0)
+        order = np.argsort(disagreement.ravel())[::-1][:top]
+        print('Most frequent disagreements (semantic -> instance):')
+        for index in order:
+            count = disagreement.ravel()[index]
+            if count == 0:
+                break
+            semantic, instance = divmod(index, 256)
+            print('  %d -> %d: %d pixels' % (semantic, instance, count))
+
+        unknown = np.flatnonzero(self.confusion[:, len(CITYSCAPES_PALETTE):].sum(axis=0))
+        if len(unknown):
+            print('Tags outside the CityScapes palette in instance images: %s' % (unknown + len(CITYSCAPES_PALETTE)).tolist())
+
+
+def check_recorded(checker, directory, sample):
+    """ Compare recorded _labelIds with the R channel of recorded _instance images, whatever their codecs. """
+    labelIds_paths = sorted(glob.glob(Path(directory) / '*_labelIds.*'))
+    if sample and len(labelIds_paths) > sample:
+        labelIds_paths = sorted(random.sample(labelIds_paths, sample))
+
+    for labelIds_path in labelIds_paths:
+        instance_path = find_image(labelIds_path[:labelIds_path.rindex('_labelIds.')] + '_instance')
+        if instance_path is None:
+            continue
+        # Images are in BGR order, so channel 2 is R
+        checker.add(read_image(labelIds_path), read_image(instance_path)[:, :, 2])
+
+
+def check_carla(checker, host, port, width, height, num_frames, interval):
+    """ Spawn a semantic and an instance camera at the same pose on a running server and compare them. """
+    import queue
+    import carla
+
+    client = carla.Client(host, port)
+    client.set_timeout(50.0)
+    carla_world = client.get_world()
+
+    original_settings = carla_world.get_settings()
+    settings = carla_world.get_settings()
+    settings.synchronous_mode = True
+    settings.fixed_delta_seconds = 0.05
+    carla_world.apply_settings(settings)
+
+    cameras = []
+    try:
+        transform = random.choice(carla_world.get_map().get_spawn_points())
+        transform.location.z += 2.4
+        queues = {}
+        for name in ('semantic_segmentation', 'instance_segmentation'):
+            bp = carla_world.get_blueprint_library().find('sensor.camera.' + name)
+            bp.set_attribute('image_size_x', str(width))
+            bp.set_attribute('image_size_y', str(height))
+            camera = carla_world.spawn_actor(bp, transform)
+            queues[name] = queue.Queue()
+            camera.listen(queues[name].put)
+            cameras.append(camera)
+
+        for i in range(num_frames * interval):
+            frame = carla_world.tick()
+            images = {}
+            for name, image_queue in queues.items():
+                image = image_queue.get()
+                while image.frame < frame:
+                    image = image_queue.get()
+                images[name] = np.reshape(np.frombuffer(image.raw_data, dtype=np.uint8), (image.height, image.width, -1))
+
+            if i % interval == 0:
+                checker.add(images['semantic_segmentation'][:, :, 2], images['instance_segmentation'][:, :, 2])
+    finally:
+        for camera in cameras:
+            camera.destroy()
+        carla_world.apply_settings(original_settings)
+
+
+if __name__ == '__main__':
+    argparser = argparse.ArgumentParser(
+        description='Check that the instance camera encodes semantic tags as the semantic camera does')
+    argparser.add_argument(
+        '--dir',
+        type=str,
+        default=PROJECT_DIR / 'images',
+        help='Directory of recorded _labelIds.png and _instance.png (default: images/)')
+    argparser.add_argument(
+        '--sample',
+        type=int,
+        default=50,
+        help='Number of recorded frames to sample, 0 checks all of them (default: 50)')
+    argparser.add_argument(
+        '--carla',
+        action='store_true',
+        help='Compare both cameras live on a running CARLA server instead of recorded frames')
+    argparser.add_argument(
+        '--host',
+        metavar='H',
+        default='127.0.0.1',
+        help='IP of the host server (default: 127.0.0.1)')
+    argparser.add_argument(
+        '-p', '--port',
+        metavar='P',
+        default=2000,
+        type=int,
+        help='TCP port to listen to (default: 2000)')
+    argparser.add_argument(
+        '--width',
+        default=2048,
+        type=int,
+        help='Image width (default: 2048)')
+    argparser.add_argument(
+        '--height',
+        default=1024,
+        type=int,
+        help='Image height (default: 1024)')
+    argparser.add_argument(
+        '-n', '--frames',
+        default=20,
+        type=int,
+        help='Number of live frames to compare (default: 20)')
+    argparser.add_argument(
+        '--interval',
+        default=20,
+        type=int,
+        help='Ticks between two compared live frames (default: 20)')
+    args = argparser.parse_args()
+
+    checker = LabelConsistencyChecker()
+    if args.carla:
+        check_carla(checker, args.host, args.port, args.width, args.height, args.frames, args.interval)
+    else:
+        check_recorded(checker, args.dir, args.sample)
+    checker.report()
@@ -0,0 +1,131 @@
+
+import glob
+import time
+import argparse
+import cv2
+import numpy as np
+
+from path import Path
+from simulation.utils.palette import colorize, CITYSCAPES_LUT
+
+PROJECT_DIR = Path(__file__).parent.parent.parent.abspath()
+
+
+def timeit(func, repeat):
+    """ Return the average milliseconds of calling func. """
+    func()
+    start = time.perf_counter()
+    for _ in range(repeat):
+        func()
+    return (time.perf_counter() - start) / repeat * 1000.0
+
+
+def benchmark_samples(repeat):
+    """ Benchmark LUT colorization on the sample labelIds shipped in images/ and check it against the stored colors. """
+    for labelIds_path in sorted(glob.glob(PROJECT_DIR / 'images' / '*_labelIds.png')):
+        label_ids = cv2.imread(labelIds_path, cv2.IMREAD_UNCHANGED)
+        color = cv2.imread(labelIds_path.replace('_labelIds.png', '_color.png'))
+        out = np.empty(label_ids.shape + (3,), dtype=np.uint8)
+
+        lut_ms = timeit(lambda: colorize(label_ids, out=out), repeat)
+        index_ms = timeit(lambda: CITYSCAPES_LUT[label_ids], repeat)
+        matched = np.mean(np.all(colorize(label_ids) == color, axis=-1)) * 100.0 if color is not None else float('nan')
+
+        print('%s: colorize %.2f ms, fancy indexing %.2f ms, %.2f%% pixels match _color.png'
+              % (Path(labelIds_path).basename(), lut_ms, index_ms, matched))
+
+
+def benchmark_carla(host, port, width, height, repeat):
+    """ Compare image.convert(CityScapesPalette) with LUT colorization on images rendered by a running server. """
+    import queue
+    import carla
+
+    client = carla.Client(host, port)
+    client.set_timeout(50.0)
+    carla_world = client.get_world()
+
+    original_settings = carla_world.get_settings()
+    settings = carla_world.get_settings()
+    settings.synchronous_mode = True
+    settings.fixed_delta_seconds = 0.05
+    carla_world.apply_settings(settings)
+
+    camera = None
+    try:
+        bp = carla_world.get_blueprint_library().find('sensor.camera.semantic_segmentation')
+        bp.set_attribute('image_size_x', str(width))
+        bp.set_attribute('image_size_y', str(height))
+        camera = carla_world.spawn_actor(bp, carla_world.get_map().get_spawn_points()[0])
+        images = queue.Queue()
+        camera.listen(images.put)
+
+        convert_ms, lut_ms, matched = [], [], []
+        out = np.empty((height, width, 3), dtype=np.uint8)
+        for _ in range(repeat):
+            carla_world.tick()
+            image = images.get()
+
+            # LUT path: one pass to extract labelIds, one gather to colorize
+            start = time.perf_counter()
+            np_img = np.reshape(np.frombuffer(image.raw_data, dtype=np.uint8), (image.height, image.width, -1))
+            label_ids = np_img[:, :, 2].copy()
+            colorize(label_ids, out=out)
+            lut_ms.append((time.perf_counter() - start) * 1000.0)
+
+            # Previous path: extract labelIds, then convert the image and copy the colors
+            start = time.perf_counter()
+            np_img = np.reshape(np.frombuffer(image.raw_data, dtype=np.uint8), (image.height, image.width, -1))
+            label_ids = np_img[:, :, 2].copy()
+            image.convert(carla.ColorConverter.CityScapesPalette)
+            np_img = np.reshape(np.frombuffer(image.raw_data, dtype=np.uint8), (image.height, image.width, -1))
+            color = np_img[:, :, :3].copy()
+            convert_ms.append((time.perf_counter() - start) * 1000.0)
+
+            matched.append(np.mean(np.all(color == out, axis=-1)) * 100.0)
+
+        print('image.convert %.2f ms, colorize %.2f ms, %.2f%% pixels match'
+              % (np.mean(convert_ms), np.mean(lut_ms), np.mean(matched)))
+    finally:
+        if camera is not None:
+            camera.destroy()
+        carla_world.apply_settings(original_settings)
+
+
+if __name__ == '__main__':
+    argparser = argparse.ArgumentParser(
+        description='Benchmark CityScapes colorization with a lookup table against image.convert')
+    argparser.add_argument(
+        '--carla',
+        action='store_true',
+        help='Also benchmark against image.convert on images rendered by a running CARLA server')
+    argparser.add_argument(
+        '--host',
+        metavar='H',
+        default='127.0.0.1',
+        help='IP of the host server (default: 127.0.0.1)')
+    argparser.add_argument(
+        '-p', '--port',
+        metavar='P',
+        default=2000,
+        type=int,
+        help='TCP port to listen to (default: 2000)')
+    argparser.add_argument(
+        '--width',
+        default=2048,
+        type=int,
+        help='Image width (default: 2048)')
+    argparser.add_argument(
+        '--height',
+        default=1024,
+        type=int,
+        help='Image height (default: 1024)')
+    argparser.add_argument(
+        '-n', '--repeat',
+        default=20,
+        type=int,
+        help='Number of repetitions (default: 20)')
+    args = argparser.parse_args()
+
+    benchmark_samples(args.repeat)
+    if args.carla:
+        benchmark_carla(args.host, args.port, args.width, args.height, args.repeat)
@@ -0,0 +1,90 @@
+import os
+import time
+import argparse
+import tempfile
+import cv2
+import numpy as np
+
+from path import Path
+from simulation.recorders.image_encoder import ImageEncoder
+
+PROJECT_DIR = Path(__file__).parent.parent.parent.abspath()
+
+
+def load_images(width, height, cameras):
+    """ Get one image per camera, the sample images shipped in images/ resized, or noise if there are none. """
+    images = []
+    for image_path in sorted((PROJECT_DIR / 'images').glob('*_img.png'))[:cameras]:
+        images.append(cv2.resize(cv2.imread(image_path), (width, height)))
+    rng = np.random.default_rng(0)
+    while len(images) < cameras:
+        images.append(rng.integers(0, 256, (height, width, 3), dtype=np.uint8))
+    return images
+
+
+def benchmark(images, frames, workers, compression, directory):
+    """ Return the frames per second of writing every image of every frame, on this thread if workers is 0. """
+    params = [] if compression is None else [cv2.IMWRITE_PNG_COMPRESSION, compression]
+    encoder = None
+    if workers:
+        encoder = ImageEncoder(num_workers=workers, slot_bytes=images[0].nbytes, compression=compression)
+    try:
+        start = time.perf_counter()
+        for frame in range(frames):
+            for camera, image in enumerate(images):
+                path = os.path.join(directory, '%06d_%d.png' % (frame, camera))
+                if encoder is None:
+                    cv2.imwrite(path, image, params)
+                else:
+                    encoder.submit(path, image, frame)
+        if encoder is not None:
+            encoder.drain()
+        return frames / (time.perf_counter() - start)
+    finally:
+        if encoder is not None:
+            encoder.close()
+
+
+if __name__ == '__main__':
+    argparser = argparse.ArgumentParser(
+        description='Benchmark PNG encoding of multi-camera frames in worker processes against cv2.imwrite')
+    argparser.add_argument(
+        '--width',
+        default=2048,
+        type=int,
+        help='Image width (default: 2048)')
+    argparser.add_argument(
+        '--height',
+        default=1024,
+        type=int,
+        help='Image height (default: 1024)')
+    argparser.add_argument(
+        '--cameras',
+        default=3,
+        type=int,
+        help='Number of images per frame (default: 3)')
+    argparser.add_argument(
+        '-n', '--frames',
+        default=20,
+        type=int,
+        help='Number of frames (default: 20)')
+    argparser.add_argument(
+        '--workers',
+        default=[1, 2, 4, os.cpu_count()],
+        nargs='+',
+        type=int,
+        help='Numbers of worker processes to compare (default: 1 2 4 and number of CPUs)')
+    argparser.add_argument(
+        '--compression',
+        default=None,
+        type=int,
+        help='PNG compression level from 0 to 9 (default: OpenCV default)')
+    args = argparser.parse_args()
+
+    images = load_images(args.width, args.height, args.cameras)
+    with tempfile.TemporaryDirectory() as directory:
+        baseline = benchmark(images, args.frames, 0, args.compression, directory)
+        print('cv2.imwrite: %.2f frames/s' % baseline)
+        for workers in sorted(set(args.workers)):
+            fps = benchmark(images, args.frames, workers, args.compression, directory)
+            print('%d workers: %.2f frames/s, %.2fx' % (workers, fps, fps / baseline))
@@ -0,0 +1,229 @@
+
+import os
+import glob
+import json
+import time
+import argparse
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+
+from simulation.config import RGBCameraConfig, RecorderConfig
+from simulation.utils.classes import ACTOR_CLASSES
+from simulation.utils.boxes import BOX_DTYPE, BOX_SERIALIZERS
+from simulation.utils.table import read_table
+from simulation.utils.util import BOX_CORNERS, build_projection_matrix, project_boxes
+from simulation.utils.world_state import rotation_matrices
+
+
+def load_poses(directory, map_name):
+    """
+    Load the ego poses written by the recorder (_pose.json).
+
+    Output:
+        frames: N int64 numpy array of frame ids, sorted.
+        poses: Nx6 numpy array of (x, y, z, pitch, yaw, roll).
+    """
+    frames, poses = [], []
+    for pose_path in glob.glob(os.path.join(directory, '%s_*_pose.json' % map_name)):
+        with open(pose_path) as f:
+            pose = json.load(f)
+        frames.append(pose['frame'])
+        poses.append([pose[name] for name in ('x', 'y', 'z', 'pitch', 'yaw', 'roll')])
+
+    frames = np.array(frames, dtype=np.int64)
+    order = np.argsort(frames)
+    return frames[order], np.array(poses, dtype=np.float64).reshape(-1, 6)[order]
+
+
+def camera_inverse_matrices(poses, mount):
+    """
+    Get the world to camera matrices of a camera attached to the ego vehicle, for many poses at once.
+
+    Input:
+        poses: Nx6 numpy array of ego poses (x, y, z, pitch, yaw, roll).
+        mount: 3 numpy array of camera location relative to the ego vehicle, the camera is not rotated.
+    Output:
+        w2c: Nx4x4 numpy array.
+    """
+    rotations = rotation_matrices(poses[:, 3:6])
+    locations = poses[:, 0:3] + np.einsum('nij,j->ni', rotations, mount)
+    w2c = np.tile(np.identity(4), (len(poses), 1, 1))
+    w2c[:, :3, :3] = rotations.transpose(0, 2, 1)
+    w2c[:, :3, 3] = -np.einsum('nji,nj->ni', rotations, locations)
+    return w2c
+
+
+def reannotate(task):
+    """
+    Project the stored 3D boxes of a chunk of frames for new intrinsics, all boxes of the chunk at once.
+
+    Input:
+        task: Dict of the objects of the chunk, the world to camera matrix of each object and the settings.
+    Output:
+        frames: List of dicts of frames, see BoxSerializer.
+    """
+    objects, w2c, settings = task['objects'], task['w2c'], task['settings']
+    width, height = settings['width'], settings['height']
+    K = build_projection_matrix(width, height, settings['fov'])
+
+    # 3D boxes in world coordinates, the box center already includes the box offset from the actor
+    rotations = rotation_matrices(np.column_stack([objects['pitch'], objects['yaw'], objects['roll']]).astype(np.float64))
+    extents = np.column_stack([objects['l'], objects['w'], objects['h']]).astype(np.float64) / 2.0
+    centers = np.column_stack([objects['x'], objects['y'], objects['z']]).astype(np.float64)
+    vertices = np.einsum('mij,mkj->mki', rotations, extents[:, None, :] * BOX_CORNERS) + centers[:, None, :]
+
+    rects, valid = project_boxes(vertices, K, w2c, width, height, clip=settings['clip'])
+    valid &= objects['distance'] < settings['max_distance']
+    if settings['visible_only']:
+        # Actors without pixels were occluded or out of the original frame
+        valid &= objects['pixels'] > 0
+
+    # Frames are contiguous since objects are sorted by frame
+    frames = []
+    starts = np.flatnonzero(np.concatenate([[True], objects['frame'][1:] != objects['frame'][:-1]]))
+    for start, end in zip(starts, np.append(starts[1:], len(objects))):
+        keep = np.flatnonzero(valid[start:end]) + start
+        boxes = np.empty(len(keep), dtype=BOX_DTYPE)
+        boxes['class_id'] = objects['class'][keep]
+        boxes['x1'], boxes['y1'], boxes['x2'], boxes['y2'] = rects[keep].T
+        boxes['visibility'] = np.nan
+        boxes['actor_id'] = objects['actor_id'][keep]
+        timestamp, frame = float(objects['timestamp'][start]), int(objects['frame'][start])
+        frames.append({'prefix': '%s_%06d_%06d' % (settings['map_name'], timestamp, frame), 'timestamp': timestamp,
+                       'frame': frame, 'boxes': boxes, 'width': width, 'height': height})
+
+    # Per-frame files are written by the workers, per-run files by the caller
+    for box_format in settings['box_formats']:
+        serializer = BOX_SERIALIZERS[box_format]()
+        if not serializer.per_run:
+            serializer.write(settings['output'], settings['map_name'], frames)
+    return frames
+
+
+def main(args):
+    directory = os.path.join(args.dir, args.map)
+    output = args.output or os.path.join(directory, 'reannotated_%dx%d_fov%g' % (args.width, args.height, args.fov))
+    os.makedirs(output, exist_ok=True)
+
+    start_time = time.perf_counter()
+    objects = read_table(os.path.join(directory, '%s_objects' % args.map))
+    if objects is None:
+        print('No objects table in %s, record with InstanceCameraConfig["objects"] enabled.' % directory)
+        return
+    objects = objects[np.isin(objects['class'], [ACTOR_CLASSES.index(name) for name in args.classes])]
+
+    # Match the objects to the ego pose of their frame
+    pose_frames, poses = load_poses(directory, args.map)
+    index = np.minimum(np.searchsorted(pose_frames, objects['frame']), max(len(pose_frames) - 1, 0))
+    has_pose = (pose_frames[index] == objects['frame']) if len(pose_frames) else np.zeros(len(objects), dtype=bool)
+    if not has_pose.all():
+        print('Dropped %d objects of frames without _pose.json.' % np.count_nonzero(~has_pose))
+    objects, index = objects[has_pose], index[has_pose]
+    order = np.argsort(objects['frame'], kind='stable')
+    objects, index = objects[order], index[order]
+    w2c = camera_inverse_matrices(poses, np.array([args.pos_x, 0.0, args.pos_z]))[index]
+
+    settings = {'width': args.width, 'height': args.height, 'fov': args.fov, 'clip': args.clip,
+                'max_distance': args.max_distance, 'visible_only': args.visible_only, 'map_name': args.map,
+                'box_formats': args.formats, 'output': output}
+
+    # Chunks of whole frames, a few per worker so they finish together
+    frame_starts = np.flatnonzero(np.concatenate([[True], objects['frame'][1:] != objects['frame'][:-1]])) \
+        if len(objects) else np.empty(0, dtype=np.intp)
+    bounds = [int(frame_starts[i]) for i in range(0, len(frame_starts), args.chunk)] + [len(objects)]
+    tasks = [{'objects': objects[a:b], 'w2c': w2c[a:b], 'settings': settings} for a, b in zip(bounds[:-1], bounds[1:])]
+
+    frames = []
+    with ProcessPoolExecutor(max_workers=args.workers) as executor:
+        for chunk_frames in executor.map(reannotate, tasks):
+            frames.extend(chunk_frames)
+
+    for box_format in args.formats:
+        serializer = BOX_SERIALIZERS[box_format]()
+        if serializer.per_run:
+            serializer.write(output, args.map, frames)
+
+    print('%d frames, %d boxes re-annotated for %dx%d fov %g in %.1f s to %s'
+          % (len(frames), sum(len(frame['boxes']) for frame in frames), args.width, args.height, args.fov,
+             time.perf_counter() - start_time, output))
+
+
+if __name__ == '__main__':
+    argparser = argparse.ArgumentParser(
+        description='Regenerate 2D boxes of recorded frames for new camera intrinsics, from the objects table')
+    argparser.add_argument(
+        '--dir',
+        type=str,
+        default=str(RecorderConfig['save_path']),
+        help='Directory of the recorded maps (default: outputs/)')
+    argparser.add_argument(
+        '--map',
+        type=str,
+        required=True,
+        help='Map name of the recording, e.g. Town10HD_Opt')
+    argparser.add_argument(
+        '-o', '--output',
+        type=str,
+        default=None,
+        help='Output directory (default: <dir>/<map>/reannotated_<width>x<height>_fov<fov>)')
+    argparser.add_argument(
+        '--width',
+        default=int(RGBCameraConfig['img_width']),
+        type=int,
+        help='Target image width (default: RGBCameraConfig)')
+    argparser.add_argument(
+        '--height',
+        default=int(RGBCameraConfig['img_height']),
+        type=int,
+        help='Target image height (default: RGBCameraConfig)')
+    argparser.add_argument(
+        '--fov',
+        default=float(RGBCameraConfig['fov']),
+        type=float,
+        help='Target horizontal field of view (default: RGBCameraConfig)')
+    argparser.add_argument(
+        '--pos-x',
+        default=float(RGBCameraConfig['pos_x']),
+        type=float,
+        help='Camera location along the ego vehicle (default: RGBCameraConfig)')
+    argparser.add_argument(
+        '--pos-z',
+        default=float(RGBCameraConfig['pos_z']),
+        type=float,
+        help='Camera height above the ego vehicle (default: RGBCameraConfig)')
+    argparser.add_argument(
+        '--classes',
+        default=list(RGBCameraConfig['bbox_classes']),
+        nargs='+',
+        choices=ACTOR_CLASSES,
+        help='Classes of actors to annotate (default: RGBCameraConfig)')
+    argparser.add_argument(
+        '--formats',
+        default=list(RecorderConfig['box_formats']),
+        nargs='+',
+        choices=sorted(BOX_SERIALIZERS),
+        help='Box formats to write (default: RecorderConfig)')
+    argparser.add_argument(
+        '--clip',
+        action='store_true',
+        help='Clip boxes crossing the image border instead of dropping them')
+    argparser.add_argument(
+        '--max-distance',
+        default=500.0,
+        type=float,
+        help='Maximum distance of annotated actors in meters (default: 500)')
+    argparser.add_argument(
+        '--visible-only',
+        action='store_true',
+        help='Drop actors without visible pixels in the recorded instance image')
+    argparser.add_argument(
+        '-j', '--workers',
+        default=os.cpu_count(),
+        type=int,
+        help='Number of worker processes (default: number of CPUs)')
+    argparser.add_argument(
+        '--chunk',
+        default=256,
+        type=int,
+        help='Number of frames per task (default: 256)')
+    main(argparser.parse_args())
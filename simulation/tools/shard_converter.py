@@ -0,0 +1,142 @@
+
+import os
+import json
+import time
+import tarfile
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+
+from simulation.config import RecorderConfig
+from simulation.utils.shards import add_sample, key_pattern, sample_bytes, shard_paths, BLOCK
+
+
+def collect_samples(directory, map_name):
+    """
+    Group the loose frame files of a map by sample key.
+
+    Output:
+        samples: List of (key, list of (extension, file name), bytes in a shard), sorted by key.
+    """
+    pattern = key_pattern(map_name)
+    samples = {}
+    for entry in os.scandir(directory):
+        match = pattern.match(entry.name)
+        if match is not None and entry.is_file():
+            key, extension = match.groups()
+            samples.setdefault(key, []).append((extension, entry.name, entry.stat().st_size))
+
+    return [(key, [(extension, name) for extension, name, _ in sorted(files)],
+             sample_bytes([size for _, _, size in files])) for key, files in sorted(samples.items())]
+
+
+def plan_shards(samples, max_bytes, max_samples):
+    """ Split the samples into consecutive shards, as ShardWriter would while recording. """
+    shards, current, size = [], [], 2 * BLOCK
+    for sample in samples:
+        if current and (size + sample[2] > max_bytes or (max_samples and len(current) >= max_samples)):
+            shards.append(current)
+            current, size = [], 2 * BLOCK
+        current.append(sample)
+        size += sample[2]
+    if current:
+        shards.append(current)
+    return shards
+
+
+def write_shard(task):
+    """
+    Pack the files of some samples into a shard, in a worker process.
+
+    Input:
+        task: Dict of directory of the loose files, output directory, shard name and samples.
+    Output:
+        lines: List of str of index lines of the samples.
+    """
+    lines = []
+    shard_path = os.path.join(task['output'], task['shard'])
+    with tarfile.open(shard_path + '.part', 'w') as tar:
+        for key, files, _ in task['samples']:
+            members = []
+            for extension, name in files:
+                with open(os.path.join(task['directory'], name), 'rb') as f:
+                    members.append((extension, f.read()))
+            entry = add_sample(tar, key, members, mtime=os.path.getmtime(os.path.join(task['directory'], files[0][1])))
+            lines.append(json.dumps(dict(key=key, shard=task['shard'], **entry)) + '\n')
+    # A shard only gets its name once complete, so an interrupted conversion leaves no partial shard behind
+    os.replace(shard_path + '.part', shard_path)
+    return lines
+
+
+def main(args):
+    directory = os.path.join(args.dir, args.map)
+    output = args.output or directory
+    os.makedirs(output, exist_ok=True)
+
+    start_time = time.perf_counter()
+    samples = collect_samples(directory, args.map)
+    if not samples:
+        print('No frame files of %s in %s.' % (args.map, directory))
+        return
+
+    # Continue after the shards already there, as a recording would
+    first_shard = len(shard_paths(output, args.map))
+    shards = plan_shards(samples, args.shard_bytes, args.shard_samples)
+    tasks = [{'directory': directory, 'output': output, 'shard': '%s-%06d.tar' % (args.map, first_shard + i),
+              'samples': shard} for i, shard in enumerate(shards)]
+
+    # Index lines are written in shard order once every shard is complete
+    with ProcessPoolExecutor(max_workers=args.workers) as executor:
+        index_lines = list(executor.map(write_shard, tasks))
+    with open(os.path.join(output, '%s_shards.jsonl' % args.map), 'a') as f:
+        for lines in index_lines:
+            f.writelines(lines)
+
+    num_files = sum(len(files) for _, files, _ in samples)
+    if args.delete:
+        for _, files, _ in samples:
+            for _, name in files:
+                os.remove(os.path.join(directory, name))
+
+    print('%d frames, %d files, %.1f MB packed into %d shards in %.1f s to %s%s'
+          % (len(samples), num_files, sum(size for _, _, size in samples) / 1e6, len(shards),
+             time.perf_counter() - start_time, output, ', loose files deleted' if args.delete else ''))
+
+
+if __name__ == '__main__':
+    argparser = argparse.ArgumentParser(
+        description='Repack the loose frame files of a recorded map into tar shards with an index')
+    argparser.add_argument(
+        '--dir',
+        type=str,
+        default=str(RecorderConfig['save_path']),
+        help='Directory of the recorded maps (default: outputs/)')
+    argparser.add_argument(
+        '--map',
+        type=str,
+        required=True,
+        help='Map name of the recording, e.g. Town10HD_Opt')
+    argparser.add_argument(
+        '-o', '--output',
+        type=str,
+        default=None,
+        help='Output directory (default: <dir>/<map>, next to the loose files)')
+    argparser.add_argument(
+        '--shard-bytes',
+        default=RecorderConfig['shard_bytes'],
+        type=int,
+        help='Maximum size of a shard (default: RecorderConfig)')
+    argparser.add_argument(
+        '--shard-samples',
+        default=RecorderConfig['shard_samples'],
+        type=int,
+        help='Maximum number of frames of a shard (default: RecorderConfig)')
+    argparser.add_argument(
+        '--delete',
+        action='store_true',
+        help='Delete the loose files once all shards and the index are written')
+    argparser.add_argument(
+        '-j', '--workers',
+        default=os.cpu_count(),
+        type=int,
+        help='Number of worker processes (default: number of CPUs)')
+    main(argparser.parse_args())
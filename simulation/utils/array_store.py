@@ -0,0 +1,155 @@
+
+import os
+import glob
+import threading
+import numpy as np
+
+# Position of every stored frame, one record appended to index.bin per frame
+ARRAY_INDEX_DTYPE = np.dtype([
+    ('frame', np.int64),
+    ('timestamp', np.float64),
+    ('chunk', np.int32),        # number of the part-<chunk>.npy file
+    ('row', np.int32),          # position of the frame in the chunk
+])
+
+
+class ArrayStore(object):
+    """
+    Store of the label maps of a run, e.g. labelIds (uint8) or instance ids (uint16), as memory-mapped .npy chunks:
+    outputs/Town10HD_Opt/Town10HD_Opt_labelIds/part-00000.npy, part-00001.npy, ... and index.bin.
+
+    Every chunk is an NxHxW .npy file preallocated for `chunk_frames` frames, frames are copied into its rows and
+    a new chunk is created when it is full. The file is created sparse, so the rows a run does not fill take no disk
+    space. index.bin gets an ARRAY_INDEX_DTYPE record per frame. ArrayStoreReader reads any frame as a numpy view of
+    its chunk, without decoding.
+    """
+
+    def __init__(self, path, chunk_frames=256):
+        """
+        Constructor method.
+
+        Input:
+            path: Str of directory of the chunks.
+            chunk_frames: Int of number of frames of a chunk.
+        """
+        self.path = path
+        self.chunk_frames = chunk_frames
+        os.makedirs(self.path, exist_ok=True)
+        # Continue after the chunks of a previous run, so they are not overwritten
+        self.num_chunks = len(glob.glob(os.path.join(self.path, 'part-*.npy')))
+        self.index_file = open(os.path.join(self.path, 'index.bin'), 'ab')
+        self.chunk = None
+        self.row = 0
+        # Writer threads append concurrently
+        self._lock = threading.Lock()
+
+    def append(self, image, timestamp, frame):
+        """
+        Copy the label map of a frame into the current chunk.
+
+        Input:
+            image: HxW numpy array, every frame of a chunk has the same shape and dtype.
+            timestamp: Float of timestamp of the frame.
+            frame: Int of frame id.
+        """
+        with self._lock:
+            if self.chunk is not None and (self.row >= self.chunk_frames or self.chunk.shape[1:] != image.shape
+                                           or self.chunk.dtype != image.dtype):
+                self._close_chunk()
+            if self.chunk is None:
+                self.chunk = np.lib.format.open_memmap(os.path.join(self.path, 'part-%05d.npy' % self.num_chunks),
+                                                       mode='w+', dtype=image.dtype,
+                                                       shape=(self.chunk_frames,) + image.shape)
+                self.num_chunks += 1
+                self.row = 0
+
+            self.chunk[self.row] = image
+            record = np.array([(frame, timestamp, self.num_chunks - 1, self.row)], dtype=ARRAY_INDEX_DTYPE)
+            self.index_file.write(record.tobytes())
+            self.row += 1
+
+    def _close_chunk(self):
+        """ Write the current chunk and its index records to disk. """
+        self.chunk.flush()
+        self.chunk = None
+        self.index_file.flush()
+
+    def close(self):
+        """ Write the current chunk and close the index. """
+        with self._lock:
+            if self.chunk is not None:
+                self._close_chunk()
+            self.index_file.close()
+
+
+class ArrayStoreReader(object):
+    """
+    Reader of an ArrayStore, frames sorted by frame id. Frames are numpy views of the memory-mapped chunks, so
+    reading one costs a page fault instead of a PNG decode, e.g.:
+
+        labelIds = ArrayStoreReader('outputs/Town10HD_Opt/Town10HD_Opt_labelIds')
+        road = [(image == 1).mean() for image in labelIds]
+        image = labelIds.frame(5026200)
+        batch = labelIds[100:132]
+    """
+
+    def __init__(self, path):
+        """
+        Constructor method.
+
+        Input:
+            path: Str of directory of the chunks.
+        """
+        self.path = path
+        index = np.fromfile(os.path.join(self.path, 'index.bin'), dtype=ARRAY_INDEX_DTYPE)
+        self.index = index[np.argsort(index['frame'], kind='stable')]
+        self.frames = self.index['frame']
+        self.timestamps = self.index['timestamp']
+        self._positions = {frame: i for i, frame in enumerate(self.frames.tolist())}
+        self._chunks = {}
+
+    def chunk(self, number):
+        """ Get a chunk as a read-only memory-mapped array, opened on first use. """
+        if number not in self._chunks:
+            self._chunks[number] = np.load(os.path.join(self.path, 'part-%05d.npy' % number), mmap_mode='r')
+        return self._chunks[number]
+
+    def __len__(self):
+        return len(self.index)
+
+    def __getitem__(self, item):
+        """
+        Get frames by position.
+
+        Input:
+            item: Int, or slice of positions.
+        Output:
+            image: HxW numpy view for an int. NxHxW numpy array for a slice, a view if the frames are consecutive rows
+                of a chunk, otherwise a copy, and an empty 0xHxW array for an empty slice.
+        """
+        if isinstance(item, slice):
+            records = self.index[item]
+            if len(records) == 0:
+                # Frames have the shape and dtype of the first chunk, unknown if the store is empty
+                if len(self.index) == 0:
+                    return np.empty((0, 0, 0))
+                first = self.chunk(int(self.index['chunk'][0]))
+                return np.empty((0,) + first.shape[1:], dtype=first.dtype)
+            chunk, rows = records['chunk'], records['row']
+            if (chunk == chunk[0]).all() and (np.diff(rows) == 1).all():
+                return self.chunk(int(chunk[0]))[rows[0]:rows[-1] + 1]
+            return np.stack([self.chunk(int(c))[r] for c, r in zip(chunk.tolist(), rows.tolist())])
+
+        record = self.index[item]
+        return self.chunk(int(record['chunk']))[int(record['row'])]
+
+    def frame(self, frame):
+        """
+        Get a frame by frame id.
+
+        Input:
+            frame: Int of frame id.
+        Output:
+            image: HxW numpy view.
+        """
+        return self[self._positions[frame]]
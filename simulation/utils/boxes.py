@@ -0,0 +1,167 @@
+
+import os
+import json
+import math
+import numpy as np
+
+from simulation.utils.classes import ACTOR_CLASSES
+from simulation.utils.environment import ENV_CLASSES
+
+# Classes of boxes, actors first then static environment objects
+BOX_CLASSES = ACTOR_CLASSES + ENV_CLASSES
+
+# Per-frame 2D boxes of RGBBboxsCamera, one record per object
+BOX_DTYPE = np.dtype([
+    ('class_id', np.uint8),      # index into BOX_CLASSES
+    ('x1', np.float32),          # box in the image, clipped to it
+    ('y1', np.float32),
+    ('x2', np.float32),
+    ('y2', np.float32),
+    ('visibility', np.float32),  # ratio of the box which is not occluded, NaN if it is unknown
+    ('actor_id', np.int64),      # -1 for environment objects
+])
+
+VOC_HEADER = """<annotation>
+    <folder>%(folder)s</folder>
+    <filename>%(filename)s</filename>
+    <path>%(path)s</path>
+    <source>
+        <database>Unknown</database>
+    </source>
+    <size>
+        <width>%(width)d</width>
+        <height>%(height)d</height>
+        <depth>3</depth>
+    </size>
+    <segmented>0</segmented>
+"""
+
+VOC_OBJECT = """    <object>
+        <name>%s</name>
+        <pose>Unspecified</pose>
+        <truncated>0</truncated>
+        <difficult>0</difficult>
+%s        <bndbox>
+            <xmin>%.2f</xmin>
+            <ymin>%.2f</ymin>
+            <xmax>%.2f</xmax>
+            <ymax>%.2f</ymax>
+        </bndbox>
+    </object>"""
+
+
+class BoxSerializer(object):
+    """
+    Base class of box serializers, which write the boxes of all buffered frames when the recorder flushes.
+
+    Every frame is a dict with the keys:
+        prefix: Str of the file name prefix of the frame, i.e. <map>_<timestamp>_<frame>.
+        timestamp: Float of timestamp of the frame.
+        frame: Int of frame id.
+        boxes: Numpy structured array of BOX_DTYPE.
+        width: Int of image width.
+        height: Int of image height.
+        extension: Optional str of the image file extension, '.png' by default.
+
+    Per-run serializers write all frames to a single file, so they must not be run by several processes at once.
+    """
+    per_run = False
+
+    def write(self, save_path, map_name, frames):
+        """
+        Write the boxes of some frames to disk.
+
+        Input:
+            save_path: Str of output directory.
+            map_name: Str of map name.
+            frames: List of dicts of frames, see above.
+        """
+        raise NotImplementedError()
+
+
+class FrameSerializer(BoxSerializer):
+    """ Base class of serializers writing one file per frame, named after the frame prefix and a suffix. """
+    suffix = None
+
+    def serialize(self, save_path, frame):
+        """
+        Get the content of the file of a frame.
+
+        Input:
+            save_path: Str of output directory.
+            frame: Dict of frame, see BoxSerializer.
+        Output:
+            content: Str.
+        """
+        raise NotImplementedError()
+
+    def write(self, save_path, map_name, frames):
+        for frame in frames:
+            with open(os.path.join(save_path, frame['prefix'] + self.suffix), 'w') as f:
+                f.write(self.serialize(save_path, frame))
+
+
+class VOCSerializer(FrameSerializer):
+    """ One Pascal VOC XML file per frame (_bounding_box.xml), as pascal_voc_writer writes them. """
+    suffix = '_bounding_box.xml'
+
+    def serialize(self, save_path, frame):
+        image_path = os.path.abspath(os.path.join(save_path, frame['prefix'] + '_img' + frame.get('extension', '.png')))
+        content = VOC_HEADER % {'folder': os.path.basename(os.path.dirname(image_path)),
+                                'filename': os.path.basename(image_path), 'path': image_path,
+                                'width': frame['width'], 'height': frame['height']}
+        content += ''.join(VOC_OBJECT % (BOX_CLASSES[class_id],
+                                         '' if math.isnan(visibility) else
+                                         '        <visibility>%.3f</visibility>\n' % visibility,
+                                         x1, y1, x2, y2)
+                           for class_id, x1, y1, x2, y2, visibility, _ in frame['boxes'].tolist())
+        return content + '\n</annotation>\n'
+
+
+class YOLOSerializer(FrameSerializer):
+    """
+    One YOLO text file per frame (_bounding_box.txt), a line "class_id x_center y_center width height" per object
+    with coordinates normalized by the image size. Class ids are indices into BOX_CLASSES.
+    """
+    suffix = '_bounding_box.txt'
+
+    def serialize(self, save_path, frame):
+        boxes = frame['boxes']
+        size = np.array([frame['width'], frame['height']], dtype=np.float64)
+        centers = (np.column_stack([boxes['x1'] + boxes['x2'], boxes['y1'] + boxes['y2']]) / 2.0) / size
+        sizes = np.column_stack([boxes['x2'] - boxes['x1'], boxes['y2'] - boxes['y1']]) / size
+        return ''.join('%d %.6f %.6f %.6f %.6f\n' % (class_id, cx, cy, w, h)
+                       for class_id, (cx, cy), (w, h) in zip(boxes['class_id'].tolist(), centers.tolist(),
+                                                             sizes.tolist()))
+
+
+class JSONLSerializer(BoxSerializer):
+    """ A single file per run (<map>_bounding_boxes.jsonl), a JSON line per frame appended at every flush. """
+    per_run = True
+
+    def write(self, save_path, map_name, frames):
+        lines = []
+        for frame in frames:
+            boxes = frame['boxes']
+            rects = np.column_stack([boxes['x1'], boxes['y1'], boxes['x2'], boxes['y2']]).round(2).tolist()
+            lines.append(json.dumps({
+                'timestamp': frame['timestamp'],
+                'frame': frame['frame'],
+                'width': frame['width'],
+                'height': frame['height'],
+                'boxes': [{'class': BOX_CLASSES[class_id], 'actor_id': actor_id, 'bbox': rect,
+                           'visibility': None if math.isnan(visibility) else round(visibility, 3)}
+                          for class_id, actor_id, rect, visibility in zip(boxes['class_id'].tolist(),
+                                                                          boxes['actor_id'].tolist(), rects,
+                                                                          boxes['visibility'].tolist())],
+            }))
+        with open(os.path.join(save_path, '%s_bounding_boxes.jsonl' % map_name), 'a') as f:
+            f.write(''.join(line + '\n' for line in lines))
+
+
+# Serializers selectable in RecorderConfig['box_formats']
+BOX_SERIALIZERS = {
+    'voc': VOCSerializer,
+    'yolo': YOLOSerializer,
+    'jsonl': JSONLSerializer,
+}
@@ -0,0 +1,64 @@
+
+
+class CapturePolicy(object):
+    """
+    Base class deciding on which frames the sensor data are captured.
+
+    Sensors only decode their raw events on capture frames, the other frames just drain the sensor queues.
+    """
+
+    def __call__(self, frame):
+        """
+        Decide whether a frame should be captured.
+
+        Input:
+            frame: Int of frame id.
+        Output:
+            bool to indicate if the frame should be captured.
+        """
+        raise NotImplementedError()
+
+
+class AlwaysCapture(CapturePolicy):
+    """ Capture every frame. """
+
+    def __call__(self, frame):
+        return True
+
+
+class EveryNFrames(CapturePolicy):
+    """ Capture one frame in every n frames, i.e. frames where frame % n == offset. """
+
+    def __init__(self, n, offset=0):
+        """ Constructor method. """
+        if n < 1:
+            raise ValueError('Capture interval must be a positive integer.')
+        self.n = n
+        self.offset = offset % n
+
+    def __call__(self, frame):
+        return frame % self.n == self.offset
+
+
+class CadenceCapture(CapturePolicy):
+    """
+    Capture the frames on which all the given sensors report on time according to a CadenceScheduler, i.e. within its
+    slack of the frames they are expected at.
+
+    It is meant for sensors rendered at a reduced rate with sensor_tick, so frames are recorded when they report.
+    The reports of the frame must be observed by the scheduler before the policy is called.
+    """
+
+    def __init__(self, scheduler, names):
+        """
+        Constructor method.
+
+        Input:
+            scheduler: CadenceScheduler of the world.
+            names: List of sensor names which must report on capture frames.
+        """
+        self.scheduler = scheduler
+        self.names = list(names)
+
+    def __call__(self, frame):
+        return all(self.scheduler.reported(name, frame) for name in self.names)
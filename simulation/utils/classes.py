@@ -0,0 +1,12 @@
+
+# Classes of annotated actors, ActorRegistry.classes holds indices into it
+ACTOR_CLASSES = ('vehicle', 'pedestrian')
+
+
+def actor_class(type_id):
+    """ Get the index in ACTOR_CLASSES of a blueprint id, None if the actor is not annotated. """
+    if type_id.startswith('vehicle.'):
+        return 0
+    if type_id.startswith('walker.pedestrian.'):
+        return 1
+    return None
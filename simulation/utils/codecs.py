@@ -0,0 +1,311 @@
+
+import io
+import os
+import zlib
+import struct
+import cv2
+import numpy as np
+
+from simulation.utils.palette import CITYSCAPES_PALETTE
+
+# Images written by the recorder: dtype and number of channels of each modality
+MODALITIES = {
+    'rgb': (np.uint8, 3),           # _img, also the views of the camera rig
+    'color': (np.uint8, 3),         # _color, CityScapes colors of labelIds
+    'labelIds': (np.uint8, 1),      # _labelIds
+    'instance': (np.uint8, 3),      # _instance, raw instance image (tag in R, object id in G and B)
+    'instance_ids': (np.uint16, 1), # _instanceIds
+    'instance_tags': (np.uint8, 1), # _instanceTags
+}
+
+PNG_SIGNATURE = b'\x89PNG\r\n\x1a\n'
+
+
+class Codec(object):
+    """
+    Base class of image codecs, which encode the images of a modality to files with their own extension.
+
+    Codecs only hold their settings, so they can be sent to the processes of ImageEncoder.
+    """
+    extension = '.png'
+    lossless = True
+    # Whether the file shows the CityScapes colors, which makes the _color image redundant
+    embeds_palette = False
+
+    def supports(self, dtype, channels):
+        """
+        Whether images of a dtype and number of channels can be encoded.
+
+        Input:
+            dtype: Numpy dtype.
+            channels: Int of number of channels, 1 for HxW images.
+        Output:
+            supported: Bool.
+        """
+        raise NotImplementedError()
+
+    def encode(self, image):
+        """
+        Encode an image.
+
+        Input:
+            image: HxW or HxWxC numpy array.
+        Output:
+            data: Bytes-like object of the encoded file.
+        """
+        raise NotImplementedError()
+
+    def decode(self, data):
+        """
+        Decode an encoded image.
+
+        Input:
+            data: Bytes-like object of the encoded file.
+        Output:
+            image: HxW or HxWxC numpy array.
+        """
+        return cv2.imdecode(np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_UNCHANGED)
+
+    def write(self, path, image):
+        """
+        Encode an image and write it to disk.
+
+        Input:
+            path: Str of file path, including the extension.
+            image: HxW or HxWxC numpy array.
+        Output:
+            size: Int of bytes written.
+        """
+        data = self.encode(image)
+        with open(path, 'wb') as f:
+            f.write(data)
+        return len(data)
+
+
+class OpenCVCodec(Codec):
+    """ Codec encoding with cv2.imencode. """
+    params = []
+
+    def encode(self, image):
+        ok, encoded = cv2.imencode(self.extension, image, self.params)
+        if not ok:
+            raise RuntimeError('Failed to encode %s image %s' % (self.extension, image.shape))
+        return encoded.data
+
+
+class PNGCodec(OpenCVCodec):
+    """ PNG, for 8 and 16 bit images. """
+
+    def __init__(self, compression=None):
+        """
+        Input:
+            compression: Optional int of zlib level from 0 to 9, OpenCV's default (1) if None.
+        """
+        self.params = [] if compression is None else [cv2.IMWRITE_PNG_COMPRESSION, int(compression)]
+
+    def supports(self, dtype, channels):
+        return dtype in (np.uint8, np.uint16) and channels in (1, 3, 4)
+
+
+class WebPCodec(OpenCVCodec):
+    """ Lossless WebP, for 8 bit color images. """
+    extension = '.webp'
+    # A quality above 100 selects lossless compression
+    params = [cv2.IMWRITE_WEBP_QUALITY, 101]
+
+    def supports(self, dtype, channels):
+        # Single channel images are decoded as 3 channels
+        return dtype == np.uint8 and channels in (3, 4)
+
+
+class JPEGCodec(OpenCVCodec):
+    """ JPEG, lossy, for RGB images only. """
+    extension = '.jpg'
+    lossless = False
+
+    def __init__(self, quality=95):
+        """
+        Input:
+            quality: Int of quality from 0 to 100.
+        """
+        self.params = [cv2.IMWRITE_JPEG_QUALITY, int(quality)]
+
+    def supports(self, dtype, channels):
+        return dtype == np.uint8 and channels == 3
+
+
+class NPYCodec(Codec):
+    """ Raw numpy array, no compression. """
+    extension = '.npy'
+
+    def supports(self, dtype, channels):
+        return True
+
+    def encode(self, image):
+        f = io.BytesIO()
+        np.save(f, image)
+        return f.getbuffer()
+
+    def decode(self, data):
+        return np.load(io.BytesIO(data))
+
+
+class PalettePNGCodec(Codec):
+    """
+    Indexed PNG of labelIds with the CityScapes palette embedded: pixels store the labelIds and viewers show their
+    colors, so no separate color image is needed.
+
+    OpenCV reads these files as colors, decode() or read_image() give the labelIds back.
+    """
+    embeds_palette = True
+
+    def __init__(self, compression=1, palette=CITYSCAPES_PALETTE):
+        """
+        Input:
+            compression: Int of zlib level from 0 to 9.
+            palette: List of RGB colors indexed by labelId, labelIds beyond it are black.
+        """
+        self.compression = int(compression)
+        colors = np.zeros((256, 3), dtype=np.uint8)
+        colors[:len(palette)] = palette
+        self.plte = colors.tobytes()
+
+    def supports(self, dtype, channels):
+        return dtype == np.uint8 and channels == 1
+
+    @staticmethod
+    def _chunk(kind, data):
+        return struct.pack('>I', len(data)) + kind + data + struct.pack('>I', zlib.crc32(kind + data))
+
+    def encode(self, image):
+        height, width = image.shape
+        # Every row with the Sub filter: differences to the left pixel, mostly zeros in label images
+        rows = np.empty((height, width + 1), dtype=np.uint8)
+        rows[:, 0] = 1
+        rows[:, 1] = image[:, 0]
+        np.subtract(image[:, 1:], image[:, :-1], out=rows[:, 2:])
+        ihdr = struct.pack('>IIBBBBB', width, height, 8, 3, 0, 0, 0)
+        return b''.join([PNG_SIGNATURE, self._chunk(b'IHDR', ihdr), self._chunk(b'PLTE', self.plte),
+                         self._chunk(b'IDAT', zlib.compress(rows.data, self.compression)), self._chunk(b'IEND', b'')])
+
+    def decode(self, data):
+        return decode_palette_png(data)
+
+
+def is_palette_png(data):
+    """ Whether bytes are an indexed PNG, the color type is in the IHDR chunk right after the signature. """
+    return bytes(data[:8]) == PNG_SIGNATURE and len(data) > 25 and data[25] == 3
+
+
+def decode_palette_png(data):
+    """
+    Decode the pixel indices of an 8 bit indexed PNG written by PalettePNGCodec.
+
+    Input:
+        data: Bytes-like object of the PNG file.
+    Output:
+        image: HxW uint8 numpy array of indices.
+    """
+    data = bytes(data)
+    offset, idat = len(PNG_SIGNATURE), []
+    while offset < len(data):
+        length, kind = struct.unpack('>I4s', data[offset:offset + 8])
+        if kind == b'IHDR':
+            width, height, depth, _, _, _, interlace = struct.unpack('>IIBBBBB', data[offset + 8:offset + 21])
+            if depth != 8 or interlace != 0:
+                raise ValueError('Only 8 bit, non interlaced indexed PNGs are supported.')
+        elif kind == b'IDAT':
+            idat.append(data[offset + 8:offset + 8 + length])
+        elif kind == b'IEND':
+            break
+        offset += 12 + length
+
+    rows = np.frombuffer(zlib.decompress(b''.join(idat)), dtype=np.uint8).reshape(height, width + 1)
+    filters = rows[:, 0]
+    if np.any((filters != 0) & (filters != 1)):
+        raise ValueError('Only the None and Sub PNG filters are supported, read the file with an image library.')
+    image = rows[:, 1:].copy()
+    sub = filters == 1
+    # Undo the Sub filter, the cumulative sum wraps around as the filter does
+    image[sub] = np.cumsum(image[sub], axis=1, dtype=np.uint8)
+    return image
+
+
+CODECS = {
+    'png': PNGCodec,
+    'webp': WebPCodec,
+    'jpeg': JPEGCodec,
+    'npy': NPYCodec,
+    'palette_png': PalettePNGCodec,
+}
+
+
+def make_codec(spec):
+    """
+    Create a codec from its configuration.
+
+    Input:
+        spec: Str of codec name, or dict of codec name ('codec') and its arguments, e.g. {'codec': 'png', 'compression': 3}.
+    Output:
+        codec: Codec.
+    """
+    if isinstance(spec, str):
+        return CODECS[spec]()
+    spec = dict(spec)
+    return CODECS[spec.pop('codec')](**spec)
+
+
+def make_codecs(config):
+    """
+    Create the codec of every modality, PNG for the modalities which are not configured.
+
+    Input:
+        config: Dict of codec configuration keyed by modality, see RecorderConfig['codecs'].
+    Output:
+        codecs: Dict of Codec keyed by modality.
+    """
+    unknown = set(config) - set(MODALITIES)
+    if unknown:
+        raise ValueError('Unknown modalities %s, expected some of %s.' % (sorted(unknown), list(MODALITIES)))
+
+    codecs = {}
+    for modality, (dtype, channels) in MODALITIES.items():
+        codec = make_codec(config.get(modality, 'png'))
+        if not codec.supports(dtype, channels):
+            raise ValueError('Codec %s does not support %s images (%s, %d channels).'
+                             % (type(codec).__name__, modality, np.dtype(dtype).name, channels))
+        codecs[modality] = codec
+    return codecs
+
+
+def find_image(prefix):
+    """
+    Find the file of a recorded image whatever its codec.
+
+    Input:
+        prefix: Str of file path without extension, e.g. outputs/Town10HD_Opt/Town10HD_Opt_000033_5026200_labelIds.
+    Output:
+        path: Str of file path, None if there is no such image.
+    """
+    for extension in ('.png', '.webp', '.jpg', '.npy'):
+        if os.path.isfile(prefix + extension):
+            return prefix + extension
+    return None
+
+
+def read_image(path):
+    """
+    Read a recorded image as it was before encoding, i.e. the labelIds of palette PNGs instead of their colors.
+
+    Input:
+        path: Str of file path.
+    Output:
+        image: HxW or HxWxC numpy array.
+    """
+    if path.endswith('.npy'):
+        return np.load(path)
+    with open(path, 'rb') as f:
+        data = f.read()
+    if is_palette_png(data):
+        return decode_palette_png(data)
+    return cv2.imdecode(np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_UNCHANGED)
@@ -0,0 +1,124 @@
+
+import numpy as np
+
+from simulation.utils.util import project_points
+
+# Far plane of the Carla depth camera in meters
+DEPTH_FAR = 1000.0
+
+# Carla encodes depth in 24 bits as R + G * 256 + B * 256 ** 2, normalized to [0, 1] over the far plane
+DEPTH_SCALE = np.float32(DEPTH_FAR / (256 ** 3 - 1))
+
+
+def decode_depth(bgra, out=None):
+    """
+    Decode a Carla depth image into depth in meters.
+
+    A BGRA pixel read as a little-endian uint32 is B + G << 8 + R << 16 + A << 24, so swapping its bytes and dropping
+    the alpha byte gives the 24-bit code R + G << 8 + B << 16 with no per-channel arithmetic.
+
+    Input:
+        bgra: HxWx4 uint8 C-contiguous numpy array of the raw BGRA image.
+        out: Optional HxW numpy array, e.g. float16, to write depth into.
+    Output:
+        depth: HxW numpy array of depth in meters, float32 unless out is given.
+    """
+    code = bgra.view('<u4')[:, :, 0].byteswap()
+    depth = np.multiply(np.right_shift(code, 8, out=code), DEPTH_SCALE, dtype=np.float32)
+    if out is None:
+        return depth
+    np.copyto(out, depth, casting='same_kind')
+    return out
+
+
+def box_samples(vertices, steps=3):
+    """
+    Sample points on a regular grid spanning boxes, corners included.
+
+    Input:
+        vertices: Mx8x3 numpy array of box corners in the order of simulation.utils.util.BOX_CORNERS.
+        steps: Int of number of samples along each box axis.
+    Output:
+        samples: MxSx3 numpy array of sample points, S = steps ** 3.
+    """
+    t = np.linspace(0.0, 1.0, steps)
+    tx, ty, tz = (axis.ravel() for axis in np.meshgrid(t, t, t, indexing='ij'))
+    # Trilinear weights of the 8 corners for every sample, corners are ordered by the signs of x, y then z
+    weights = np.stack([wx * wy * wz for wx in (1 - tx, tx) for wy in (1 - ty, ty) for wz in (1 - tz, tz)], axis=1)
+    return np.einsum('sc,mcd->msd', weights, vertices)
+
+
+def box_entry_depths(vertices, samples, w2c):
+    """
+    Get the depth at which the camera ray through every sample enters the box of the sample.
+
+    Input:
+        vertices: Mx8x3 numpy array of box corners in the order of simulation.utils.util.BOX_CORNERS.
+        samples: MxSx3 numpy array of points in the boxes, e.g. from box_samples().
+        w2c: 4x4 numpy array of world to camera matrix.
+    Output:
+        depths: MxS numpy array of depth along the optical axis of the near face of the box on the ray of every
+            sample, 0 if the camera is in the box.
+    """
+    # Box frame: center, unit axes and half sizes from the corners, ordered by the signs of x, y then z
+    centers = vertices.mean(axis=1)
+    edges = np.stack([vertices[:, 4] - vertices[:, 0], vertices[:, 2] - vertices[:, 0], vertices[:, 1] - vertices[:, 0]],
+                     axis=1)
+    sizes = np.linalg.norm(edges, axis=2)
+    axes = edges / np.where(sizes > 0.0, sizes, 1.0)[:, :, None]
+
+    # Slab test of the rays from the camera to the samples in the box frame, the sample is at t = 1
+    camera = -w2c[:3, :3].T @ w2c[:3, 3]
+    origins = np.einsum('mij,mj->mi', axes, camera - centers)[:, None, :]
+    directions = np.einsum('mij,msj->msi', axes, samples - camera)
+    half = sizes[:, None, :] / 2.0
+    with np.errstate(divide='ignore', invalid='ignore'):
+        t1 = (-half - origins) / directions
+        t2 = (half - origins) / directions
+    # fmin and fmax skip the NaN of rays lying in a face plane
+    t_enter = np.nanmax(np.fmin(t1, t2), axis=2)
+
+    # Depth is linear along a ray from the camera center
+    sample_depths = samples @ w2c[:3, :3].T[:, 0] + w2c[0, 3]
+    return np.clip(t_enter, 0.0, 1.0) * sample_depths
+
+
+def box_visibility(vertices, K, w2c, depth_lookup, image_w, image_h, steps=3, margin=0.2):
+    """
+    Score how much of each box is visible from a camera, by testing box samples against the depth seen by the camera.
+
+    A sample is visible if the depth at its pixel is not nearer than where its camera ray enters its box: the object
+    lies in its box, so anything nearer is an occluder. Boxes hidden by nearer objects score 0.
+
+    Input:
+        vertices: Mx8x3 numpy array of world coordinates of the box corners, see simulation.utils.util.box_vertices().
+        K: 3x3 numpy array of camera projection matrix.
+        w2c: 4x4 numpy array of world to camera matrix.
+        depth_lookup: Callable taking pixel coordinates u, v and returning the depth in meters at them,
+            e.g. DepthCamera.sample. The depth camera must share the pose and intrinsics of the camera.
+        image_w: Int of image width.
+        image_h: Int of image height.
+        steps: Int of number of samples along each box axis.
+        margin: Float of depth tolerance in meters, for the pixel a sample falls in.
+    Output:
+        visibility: M numpy array of ratio of visible samples among the samples in the image, NaN for boxes out of it.
+    """
+    num = len(vertices)
+    if num == 0:
+        return np.empty(0)
+
+    samples = box_samples(vertices, steps)
+    points_img = project_points(samples.reshape(-1, 3), K, w2c).reshape(num, -1, 3)
+    u = np.floor(points_img[:, :, 0])
+    v = np.floor(points_img[:, :, 1])
+    depth = points_img[:, :, 2]
+    inside = (depth > 0.0) & (u >= 0) & (u < image_w) & (v >= 0) & (v < image_h)
+
+    measured = np.full(depth.shape, np.inf)
+    measured[inside] = depth_lookup(u[inside].astype(np.intp), v[inside].astype(np.intp))
+
+    visible = inside & (measured >= box_entry_depths(vertices, samples, w2c) - margin)
+
+    counts = inside.sum(axis=1)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return np.where(counts > 0, visible.sum(axis=1) / counts, np.nan)
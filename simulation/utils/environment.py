@@ -0,0 +1,150 @@
+
+import os
+import numpy as np
+
+from simulation.utils.util import BOX_CORNERS
+from simulation.utils.world_state import rotation_matrices
+
+# Classes of annotated environment objects and the carla.CityObjectLabel names they are made of
+ENV_CLASSES = ('traffic_light', 'traffic_sign', 'pole', 'static_vehicle')
+ENV_CLASS_LABELS = {
+    'traffic_light': ('TrafficLight',),
+    'traffic_sign': ('TrafficSigns',),
+    'pole': ('Poles',),
+    # Parked vehicles of the maps, they are part of the level and not actors
+    'static_vehicle': ('Car', 'Truck', 'Bus', 'Motorcycle', 'Bicycle'),
+}
+
+
+class EnvironmentCache(object):
+    """
+    Cache of the 3D boxes of static environment objects of a town, e.g. traffic lights, signs and parked vehicles.
+
+    These objects never move, so world.get_environment_objects() is queried once per town and the world coordinates
+    of the box corners are stored on disk. Objects are sorted by the cells of a uniform grid in the XY plane, so the
+    objects near a location are a few contiguous slices of the arrays, one row per object:
+
+        ids: N uint64 numpy array of environment object ids.
+        classes: N uint8 numpy array of indices into ENV_CLASSES.
+        centers: Nx3 numpy array of box centers in world coordinates.
+        vertices: Nx8x3 numpy array of box corners in world coordinates, see box_vertices().
+    """
+
+    def __init__(self, ids, classes, centers, vertices, env_classes, cell_size):
+        """
+        Constructor method, use build() or load() instead.
+
+        Input:
+            ids: N numpy array of object ids.
+            classes: N numpy array of indices into ENV_CLASSES.
+            centers: Nx3 numpy array of box centers.
+            vertices: Nx8x3 numpy array of box corners.
+            env_classes: Sequence of names in ENV_CLASSES the cache holds.
+            cell_size: Float of size of the grid cells in meters.
+        """
+        self.env_classes = tuple(env_classes)
+        self.cell_size = float(cell_size)
+
+        cells = np.floor(centers[:, :2] / self.cell_size).astype(np.int64)
+        order = np.lexsort((cells[:, 1], cells[:, 0]))
+        self.ids = ids[order]
+        self.classes = classes[order]
+        self.centers = centers[order]
+        self.vertices = vertices[order]
+
+        # Slice of the rows of every non-empty cell
+        cells = cells[order]
+        starts = np.flatnonzero(np.concatenate([[len(cells) > 0], np.any(cells[1:] != cells[:-1], axis=1)]))
+        ends = np.append(starts[1:], len(cells))
+        self._cells = {(int(cx), int(cy)): (start, end) for (cx, cy), start, end in zip(cells[starts].tolist(), starts, ends)}
+
+    def __len__(self):
+        return len(self.ids)
+
+    @classmethod
+    def build(cls, carla_world, env_classes=ENV_CLASSES, cell_size=32.0):
+        """
+        Query the environment objects of the loaded town from the server.
+
+        Input:
+            carla_world: Carla.World of the town.
+            env_classes: Sequence of names in ENV_CLASSES to keep.
+            cell_size: Float of size of the grid cells in meters.
+        Output:
+            cache: EnvironmentCache.
+        """
+        import carla
+
+        ids, classes, boxes = [], [], []
+        for name in env_classes:
+            for label in ENV_CLASS_LABELS[name]:
+                for env_object in carla_world.get_environment_objects(getattr(carla.CityObjectLabel, label)):
+                    bb = env_object.bounding_box
+                    ids.append(env_object.id)
+                    classes.append(ENV_CLASSES.index(name))
+                    boxes.append((bb.location.x, bb.location.y, bb.location.z, bb.extent.x, bb.extent.y, bb.extent.z,
+                                  bb.rotation.pitch, bb.rotation.yaw, bb.rotation.roll))
+
+        # Bounding boxes of environment objects are in world coordinates
+        boxes = np.array(boxes, dtype=np.float64).reshape(-1, 9)
+        local = boxes[:, None, 3:6] * BOX_CORNERS
+        vertices = np.einsum('mij,mkj->mki', rotation_matrices(boxes[:, 6:9]), local) + boxes[:, None, 0:3]
+
+        return cls(np.array(ids, dtype=np.uint64), np.array(classes, dtype=np.uint8), boxes[:, 0:3], vertices,
+                   env_classes, cell_size)
+
+    def save(self, path):
+        """ Save the cache to a .npz file. """
+        np.savez(path, ids=self.ids, classes=self.classes, centers=self.centers, vertices=self.vertices,
+                 env_classes=np.array(self.env_classes), cell_size=self.cell_size)
+
+    @classmethod
+    def load(cls, path):
+        """ Load a cache saved by save(). """
+        with np.load(path) as f:
+            return cls(f['ids'], f['classes'], f['centers'], f['vertices'], f['env_classes'].tolist(), f['cell_size'])
+
+    @classmethod
+    def load_or_build(cls, carla_world, path, env_classes=ENV_CLASSES, cell_size=32.0):
+        """
+        Load the cache of a town, or build it and save it if there is none with the same classes and cells.
+
+        Input:
+            carla_world: Carla.World of the town.
+            path: Str of .npz file of the cache, e.g. outputs/Town10HD_Opt_environment.npz.
+            env_classes: Sequence of names in ENV_CLASSES to keep.
+            cell_size: Float of size of the grid cells in meters.
+        Output:
+            cache: EnvironmentCache.
+        """
+        if os.path.isfile(path):
+            cache = cls.load(path)
+            if cache.env_classes == tuple(env_classes) and cache.cell_size == cell_size:
+                return cache
+
+        cache = cls.build(carla_world, env_classes, cell_size)
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        cache.save(path)
+        print('Cached %d environment objects to %s.' % (len(cache), path))
+        return cache
+
+    def query(self, location, radius):
+        """
+        Get the objects near a location, only the grid cells overlapping the search square are visited.
+
+        Input:
+            location: 3 numpy array of location in world coordinates.
+            radius: Float of search radius in meters.
+        Output:
+            rows: Numpy array of rows of the objects whose centers are within radius in the XY plane.
+        """
+        x_min, y_min = np.floor((location[:2] - radius) / self.cell_size).astype(int).tolist()
+        x_max, y_max = np.floor((location[:2] + radius) / self.cell_size).astype(int).tolist()
+        slices = [self._cells[(cx, cy)] for cx in range(x_min, x_max + 1) for cy in range(y_min, y_max + 1)
+                  if (cx, cy) in self._cells]
+        if not slices:
+            return np.empty(0, dtype=np.intp)
+
+        rows = np.concatenate([np.arange(start, end) for start, end in slices])
+        rays = self.centers[rows, :2] - location[:2]
+        return rows[np.einsum('mi,mi->m', rays, rays) < radius ** 2]
@@ -0,0 +1,130 @@
+
+import time
+import threading
+
+class FrameSync(object):
+    """
+    Synchronizer collecting sensor events keyed by frame id.
+
+    Sensor callbacks put their events here from Carla's streaming threads. The main loop waits for a frame until every
+    due sensor has reported it, then the events of that frame are released together, so data from different frames
+    are never mixed. Pending frames are bounded, and frames older than a released one are dropped as stale.
+    This works the same whether the world is ticked synchronously or runs freely.
+    """
+
+    def __init__(self, max_frames=8):
+        """
+        Constructor method.
+
+        Input:
+            max_frames: Int of maximum number of pending frames, older frames are dropped beyond it.
+        """
+        self.max_frames = max_frames
+
+        self._cond = threading.Condition()
+        # Pending events, {frame: {sensor name: event}}
+        self._frames = {}
+        # Latest frame reported by each sensor
+        self._last_frames = {}
+        # Frames up to this one have been released or dropped
+        self._released_frame = -1
+
+        # Counters
+        self.released_frames = 0
+        self.incomplete_frames = 0
+        self.dropped_frames = 0
+        self.stale_events = 0
+
+    def put(self, name, event):
+        """
+        Add a sensor event. It is thread-safe and meant to be called in sensor callbacks.
+
+        Input:
+            name: Str of sensor name.
+            event: Carla.SensorData of sensor event.
+        """
+        with self._cond:
+            frame = event.frame
+            if self._last_frames.get(name, -1) < frame:
+                self._last_frames[name] = frame
+
+            if frame <= self._released_frame:
+                self.stale_events += 1
+                return
+
+            self._frames.setdefault(frame, {})[name] = event
+            # Drop the oldest frames if the buffer is full
+            while len(self._frames) > self.max_frames:
+                del self._frames[min(self._frames)]
+                self.dropped_frames += 1
+
+            self._cond.notify_all()
+
+    def last_frame(self, name):
+        """ Get the latest frame reported by a sensor, None if it hasn't reported yet. """
+        with self._cond:
+            return self._last_frames.get(name, None)
+
+    def wait(self, frame, names, timeout=None):
+        """
+        Wait until all the given sensors have reported a frame and release its events.
+
+        Events of sensors which are not waited for are released as well if they have reported the frame.
+        Pending frames older than the released one are dropped.
+
+        Input:
+            frame: Int of frame id.
+            names: List of names of the sensors due at this frame.
+            timeout: Float of seconds to wait, None waits forever.
+        Output:
+            events: Dict of released events keyed by sensor name, which may miss due sensors on timeout.
+            complete: Bool to indicate if all due sensors reported the frame.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+
+        with self._cond:
+            while True:
+                events = self._frames.get(frame, {})
+                complete = all(name in events for name in names)
+                if complete:
+                    break
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    break
+                self._cond.wait(remaining)
+
+            # Release the frame and drop the stale ones
+            for pending_frame in [f for f in self._frames if f <= frame]:
+                if pending_frame != frame:
+                    self.dropped_frames += 1
+                del self._frames[pending_frame]
+            self._released_frame = max(self._released_frame, frame)
+
+            if complete:
+                self.released_frames += 1
+            else:
+                self.incomplete_frames += 1
+
+            return events, complete
+
+    def reset(self):
+        """ Drop all pending events and forget the reported frames. """
+        with self._cond:
+            self._frames.clear()
+            self._last_frames.clear()
+
+    def stats(self):
+        """
+        Get the counters of the synchronizer.
+
+        Output:
+            stats: Dict of counters.
+        """
+        with self._cond:
+            return {
+                'released_frames': self.released_frames,
+                'incomplete_frames': self.incomplete_frames,
+                'dropped_frames': self.dropped_frames,
+                'stale_events': self.stale_events,
+                'pending_frames': len(self._frames),
+            }
@@ -0,0 +1,190 @@
+
+import numpy as np
+
+# Per-frame table of the objects in an instance segmentation image
+INSTANCE_TABLE_DTYPE = np.dtype([
+    ('id', np.uint16),      # object id
+    ('tag', np.uint8),      # semantic tag (labelId) of the object
+    ('pixels', np.uint32),  # number of pixels
+    ('x1', np.int32),       # bounding rectangle, both corners inclusive
+    ('y1', np.int32),
+    ('x2', np.int32),
+    ('y2', np.int32),
+])
+
+
+# Per-frame boxes of the actors visible in an instance segmentation image
+MASK_BOX_DTYPE = np.dtype([
+    ('actor_id', np.int64),         # id of the actor, -1 if it is not registered
+    ('class', np.int8),             # index in ACTOR_CLASSES, -1 if the actor is not registered
+    ('tag', np.uint8),              # semantic tag (labelId)
+    ('pixels', np.uint32),          # number of visible pixels
+    ('x1', np.int32),               # visible rectangle, both corners inclusive
+    ('y1', np.int32),
+    ('x2', np.int32),
+    ('y2', np.int32),
+    ('fill_ratio', np.float32),     # visible pixels over the amodal rectangle area in the image, NaN if unknown. It
+                                    # depends on the shape, not only on occlusion: ~0.6 for a car, ~0.3 for a walker
+    ('truncation', np.float32),     # part of the amodal rectangle outside the image, NaN if unknown
+    ('truncated', np.bool_),        # whether the object is cut by the image border
+])
+
+# Semantic tags (labelIds) of the pixels of actors of each class of ACTOR_CLASSES, see README.md
+# Riders are part of their bicycle or motorcycle actor
+ACTOR_CLASS_TAGS = (
+    (13, 14, 15, 16, 17, 18, 19),   # vehicle: rider, car, truck, bus, train, motorcycle, bicycle
+    (12,),                          # pedestrian
+)
+
+
+def split_instance(bgra, ids_out=None, tags_out=None):
+    """
+    Split a Carla instance segmentation image into an object id map and a semantic tag map.
+
+    Carla encodes the semantic tag in the R channel and the object id in the G (low byte) and B (high byte) channels.
+
+    Input:
+        bgra: HxWx4 uint8 numpy array of the raw BGRA image.
+        ids_out: Optional HxW uint16 numpy array to write object ids into.
+        tags_out: Optional HxW uint8 numpy array to write semantic tags into.
+    Output:
+        instance_ids: HxW uint16 numpy array of object ids.
+        semantic_tags: HxW uint8 numpy array of semantic tags.
+    """
+    if ids_out is None:
+        ids_out = np.empty(bgra.shape[:2], dtype=np.uint16)
+    if tags_out is None:
+        tags_out = np.empty(bgra.shape[:2], dtype=np.uint8)
+
+    np.left_shift(bgra[:, :, 0], 8, out=ids_out, dtype=np.uint16)
+    np.bitwise_or(ids_out, bgra[:, :, 1], out=ids_out)
+    np.copyto(tags_out, bgra[:, :, 2])
+
+    return ids_out, tags_out
+
+
+def instance_table(instance_ids, semantic_tags=None):
+    """
+    Count the pixels and find the bounding rectangle of every object id in an instance id map.
+
+    Pixels are counted with np.bincount. Rectangles are reduced from the horizontal runs of equal ids,
+    which are far fewer than pixels, instead of looping over objects.
+
+    Input:
+        instance_ids: HxW uint16 numpy array of object ids.
+        semantic_tags: Optional HxW uint8 numpy array of semantic tags.
+    Output:
+        table: Numpy structured array of INSTANCE_TABLE_DTYPE, one row per object id present, sorted by id.
+    """
+    h, w = instance_ids.shape
+
+    counts = np.bincount(instance_ids.ravel(), minlength=1 << 16)
+    ids = np.flatnonzero(counts)
+    num = len(ids)
+
+    # Start of every horizontal run of equal ids
+    starts = np.empty((h, w), dtype=bool)
+    starts[:, 0] = True
+    np.not_equal(instance_ids[:, 1:], instance_ids[:, :-1], out=starts[:, 1:])
+    run_ys, run_xs = np.nonzero(starts)
+
+    # A run ends right before the next one starts, or at the end of its row
+    run_ends = np.empty_like(run_xs)
+    run_ends[:-1] = run_xs[1:] - 1
+    row_ends = np.empty(len(run_ys), dtype=bool)
+    row_ends[:-1] = run_ys[1:] != run_ys[:-1]
+    row_ends[-1] = True
+    run_ends[row_ends] = w - 1
+
+    # Map object ids to 0..num-1
+    remap = np.zeros(1 << 16, dtype=np.intp)
+    remap[ids] = np.arange(num)
+    run_index = remap[instance_ids[run_ys, run_xs]]
+
+    table = np.empty(num, dtype=INSTANCE_TABLE_DTYPE)
+    table['id'] = ids
+    table['pixels'] = counts[ids]
+    table['x1'] = w
+    table['y1'] = h
+    table['x2'] = -1
+    table['y2'] = -1
+    x1, y1, x2, y2 = (np.array(table[name], dtype=np.intp) for name in ('x1', 'y1', 'x2', 'y2'))
+    np.minimum.at(x1, run_index, run_xs)
+    np.minimum.at(y1, run_index, run_ys)
+    np.maximum.at(x2, run_index, run_ends)
+    np.maximum.at(y2, run_index, run_ys)
+    table['x1'], table['y1'], table['x2'], table['y2'] = x1, y1, x2, y2
+
+    table['tag'] = 0
+    if semantic_tags is not None:
+        # Actors have a single tag. Static objects made of several meshes, e.g. a pole holding a traffic light,
+        # may carry several tags, then the tag of one of their runs is kept.
+        table['tag'][run_index] = semantic_tags[run_ys, run_xs]
+
+    return table
+
+
+def table_to_list(table):
+    """
+    Convert a structured array, e.g. an instance table, to a list of dicts which can be dumped to JSON.
+    NaN is converted to None, i.e. null.
+    """
+    return [{name: None if value != value else value for name, value in zip(table.dtype.names, row)}
+            for row in table.tolist()]
+
+
+def mask_boxes(table, image_w, image_h, actor_ids, actor_classes, amodal_rects=None, min_pixels=1):
+    """
+    Get the boxes of the actors visible in an instance segmentation image from its instance table.
+
+    Boxes only cover visible pixels, so occluded parts don't stretch them and hidden actors get no box.
+    Carla encodes the low 16 bits of the actor id as the object id of actors, objects are matched to actors on it
+    and on the semantic tag of their class. Objects which are not actors, e.g. buildings, are dropped.
+
+    Input:
+        table: Numpy structured array of INSTANCE_TABLE_DTYPE, see instance_table().
+        image_w: Int of image width.
+        image_h: Int of image height.
+        actor_ids: N numpy array of ids of the actors to match, e.g. ActorRegistry.ids.
+        actor_classes: N numpy array of indices in ACTOR_CLASSES of the actors.
+        amodal_rects: Optional Nx4 numpy array of (x_min, y_min, x_max, y_max) of the projected 3D boxes of the actors,
+            not clipped to the image, NaN for actors behind the camera.
+        min_pixels: Int of minimum number of visible pixels of a box.
+    Output:
+        boxes: Numpy structured array of MASK_BOX_DTYPE, sorted by object id.
+    """
+    # Keep the objects which are actors of some class
+    actor_tags = np.zeros(256, dtype=np.int8) - 1
+    for class_index, tags in enumerate(ACTOR_CLASS_TAGS):
+        actor_tags[list(tags)] = class_index
+    table = table[(actor_tags[table['tag']] >= 0) & (table['pixels'] >= min_pixels)]
+
+    # Match object ids to actors, objects without an actor point at the trailing -1 entries
+    actor_ids = np.append(np.asarray(actor_ids, dtype=np.int64), -1)
+    actor_classes = np.append(np.asarray(actor_classes, dtype=np.int8), -1)
+    lookup = np.full(1 << 16, -1, dtype=np.intp)
+    lookup[actor_ids[:-1] & 0xFFFF] = np.arange(len(actor_ids) - 1)
+    index = lookup[table['id']]
+    matched = actor_classes[index] == actor_tags[table['tag']]
+
+    boxes = np.empty(len(table), dtype=MASK_BOX_DTYPE)
+    boxes['actor_id'] = np.where(matched, actor_ids[index], -1)
+    boxes['class'] = np.where(matched, actor_classes[index], -1)
+    for name in ('tag', 'pixels', 'x1', 'y1', 'x2', 'y2'):
+        boxes[name] = table[name]
+    boxes['fill_ratio'] = np.nan
+    boxes['truncation'] = np.nan
+    boxes['truncated'] = ((table['x1'] == 0) | (table['y1'] == 0) | (table['x2'] == image_w - 1)
+                          | (table['y2'] == image_h - 1))
+
+    if amodal_rects is not None and matched.any():
+        rects = amodal_rects[index[matched]]
+        area = (rects[:, 2] - rects[:, 0]) * (rects[:, 3] - rects[:, 1])
+        inside = ((np.minimum(rects[:, 2], image_w) - np.maximum(rects[:, 0], 0))
+                  * (np.minimum(rects[:, 3], image_h) - np.maximum(rects[:, 1], 0)))
+        with np.errstate(invalid='ignore', divide='ignore'):
+            boxes['truncation'][matched] = np.clip(1.0 - inside / area, 0.0, 1.0)
+            boxes['fill_ratio'][matched] = np.clip(table['pixels'][matched] / inside, 0.0, 1.0)
+        boxes['truncated'][matched] |= boxes['truncation'][matched] > 0.0
+
+    return boxes
@@ -0,0 +1,152 @@
+
+import numpy as np
+
+from simulation.utils.util import box_vertices, project_points
+
+# Per-frame KITTI object labels, see the KITTI object development kit
+KITTI_LABEL_DTYPE = np.dtype([
+    ('type', 'U16'),             # Car, Van, Truck, Pedestrian, Cyclist, Misc
+    ('truncated', np.float32),   # part of the object outside the image, from 0 to 1
+    ('occluded', np.int8),       # 0 fully visible, 1 partly occluded, 2 largely occluded, 3 unknown
+    ('alpha', np.float32),       # observation angle
+    ('x1', np.float32),          # 2D box in the image
+    ('y1', np.float32),
+    ('x2', np.float32),
+    ('y2', np.float32),
+    ('h', np.float32),           # 3D box dimensions in meters
+    ('w', np.float32),
+    ('l', np.float32),
+    ('x', np.float32),           # bottom center of the 3D box in camera coordinates
+    ('y', np.float32),
+    ('z', np.float32),
+    ('rotation_y', np.float32),  # yaw around the Y axis of the camera
+    ('actor_id', np.int64),      # id of the actor, not part of the KITTI format
+])
+
+# KITTI type of the base_type attribute of vehicle blueprints, vehicles without base type are cars
+KITTI_VEHICLE_TYPES = {
+    'car': 'Car',
+    'van': 'Van',
+    'truck': 'Truck',
+    'bus': 'Misc',
+    'motorcycle': 'Cyclist',
+    'bicycle': 'Cyclist',
+}
+
+# From Unreal camera axes (x forward, y right, z up) to KITTI camera axes (x right, y down, z forward)
+UE4_TO_KITTI = np.array([[0.0, 1.0, 0.0], [0.0, 0.0, -1.0], [1.0, 0.0, 0.0]])
+
+
+def occlusion_level(visibility):
+    """ Convert visibility ratios to KITTI occlusion levels, NaN is unknown. """
+    with np.errstate(invalid='ignore'):
+        levels = np.where(visibility >= 0.8, 0, np.where(visibility >= 0.4, 1, 2))
+    return np.where(np.isnan(visibility), 3, levels).astype(np.int8)
+
+
+def kitti_labels(state, rows, entries, K, w2c, image_w, image_h, visibility=None, max_distance=100.0):
+    """
+    Get the KITTI labels of actors seen by a camera, for all actors at once.
+
+    Input:
+        state: WorldState of the frame.
+        rows: Numpy array of rows of the actors in the state, see WorldState.select().
+        entries: Numpy array of rows of the same actors in the registry.
+        K: 3x3 numpy array of camera projection matrix.
+        w2c: 4x4 numpy array of world to camera matrix.
+        image_w: Int of image width.
+        image_h: Int of image height.
+        visibility: Optional numpy array of visibility ratios of the actors, e.g. from box_visibility().
+        max_distance: Float of maximum distance to the camera in meters.
+    Output:
+        labels: Numpy structured array of KITTI_LABEL_DTYPE of the actors in front of the camera and on the image.
+    """
+    registry = state.registry
+    matrices = state.matrices[rows]
+    box_locations = registry.box_locations[entries]
+    box_extents = registry.box_extents[entries]
+
+    # 2D boxes, clipped to the image
+    vertices = box_vertices(matrices, box_locations, box_extents)
+    points_img = project_points(vertices.reshape(-1, 3), K, w2c).reshape(len(rows), 8, 3)
+    rects = np.concatenate([points_img[:, :, :2].min(axis=1), points_img[:, :, :2].max(axis=1)], axis=1)
+    clipped = np.column_stack([np.clip(rects[:, 0], 0, image_w), np.clip(rects[:, 1], 0, image_h),
+                               np.clip(rects[:, 2], 0, image_w), np.clip(rects[:, 3], 0, image_h)])
+
+    # Bottom center of the boxes in KITTI camera coordinates
+    bottoms = box_locations - box_extents * [0.0, 0.0, 1.0]
+    bottoms = np.einsum('mij,mj->mi', matrices[:, :3, :3], bottoms) + matrices[:, :3, 3]
+    locations = (bottoms @ w2c[:3, :3].T + w2c[:3, 3]) @ UE4_TO_KITTI.T
+
+    keep = (np.all(points_img[:, :, 2] > 0.0, axis=1) & (clipped[:, 2] > clipped[:, 0]) & (clipped[:, 3] > clipped[:, 1])
+            & (np.linalg.norm(locations, axis=1) < max_distance))
+    if visibility is not None:
+        # Fully occluded actors are not labelled
+        with np.errstate(invalid='ignore'):
+            keep &= ~(visibility <= 0.0)
+
+    # Forward vectors of the actors in KITTI camera coordinates, rotation_y is 0 facing the X axis
+    forwards = (matrices[keep, :3, 0] @ w2c[:3, :3].T) @ UE4_TO_KITTI.T
+    rotation_y = np.arctan2(-forwards[:, 2], forwards[:, 0])
+    locations = locations[keep]
+    alpha = rotation_y - np.arctan2(locations[:, 0], locations[:, 2])
+
+    rect_area = (rects[keep, 2] - rects[keep, 0]) * (rects[keep, 3] - rects[keep, 1])
+    clipped_area = (clipped[keep, 2] - clipped[keep, 0]) * (clipped[keep, 3] - clipped[keep, 1])
+
+    types = np.array([KITTI_VEHICLE_TYPES.get(base_type, 'Car') for base_type in registry.base_types] + ['Pedestrian'],
+                     dtype='U16')
+    # Pedestrians point at the trailing type
+    type_index = np.where(registry.classes[entries[keep]] == 1, len(types) - 1, registry.blueprints[entries[keep]])
+
+    labels = np.empty(int(keep.sum()), dtype=KITTI_LABEL_DTYPE)
+    labels['type'] = types[type_index]
+    labels['truncated'] = np.clip(1.0 - clipped_area / rect_area, 0.0, 1.0)
+    labels['occluded'] = 3 if visibility is None else occlusion_level(visibility[keep])
+    labels['alpha'] = (alpha + np.pi) % (2 * np.pi) - np.pi
+    labels['x1'], labels['y1'], labels['x2'], labels['y2'] = clipped[keep].T
+    labels['h'], labels['w'], labels['l'] = (2.0 * box_extents[keep][:, [2, 1, 0]]).T
+    labels['x'], labels['y'], labels['z'] = locations.T
+    labels['rotation_y'] = (rotation_y + np.pi) % (2 * np.pi) - np.pi
+    labels['actor_id'] = registry.ids[entries[keep]]
+    return labels
+
+
+def kitti_calib(K, w2c, ego_matrix):
+    """
+    Get the KITTI calibration of a camera.
+
+    The reference frame of the ego vehicle stands in for the velodyne frame, so Tr_velo_to_cam maps ego coordinates
+    (Unreal axes) to KITTI camera coordinates. The world to camera matrix is added as Tr_world_to_cam.
+
+    Input:
+        K: 3x3 numpy array of camera projection matrix, see build_projection_matrix().
+        w2c: 4x4 numpy array of world to camera matrix.
+        ego_matrix: 4x4 numpy array of ego vehicle transform matrix.
+    Output:
+        calib: Dict of 3x4 or 3x3 numpy arrays keyed by KITTI calibration names.
+    """
+    P = np.hstack([K, np.zeros((3, 1))])
+    world_to_cam = UE4_TO_KITTI @ w2c[:3, :]
+    return {
+        'P0': P,
+        'P1': P,
+        'P2': P,
+        'P3': P,
+        'R0_rect': np.identity(3),
+        'Tr_velo_to_cam': UE4_TO_KITTI @ (w2c @ ego_matrix)[:3, :],
+        'Tr_imu_to_velo': np.identity(4)[:3, :],
+        'Tr_world_to_cam': world_to_cam,
+    }
+
+
+def format_labels(labels):
+    """ Format KITTI labels as the lines of a label_2 file. """
+    return ''.join('%s %.2f %d %.2f %.2f %.2f %.2f %.2f %.2f %.2f %.2f %.2f %.2f %.2f %.2f\n' % row[:15]
+                   for row in labels.tolist())
+
+
+def format_calib(calib):
+    """ Format a KITTI calibration as the lines of a calib file. """
+    return ''.join('%s: %s\n' % (name, ' '.join('%.12e' % value for value in matrix.ravel()))
+                   for name, matrix in calib.items())
@@ -0,0 +1,90 @@
+
+import numpy as np
+
+from simulation.utils.instance import mask_boxes
+
+# Per-frame facts about each annotated actor, one row per actor and frame
+OBJECT_DTYPE = np.dtype([
+    ('frame', np.int64),
+    ('timestamp', np.float64),
+    ('actor_id', np.int64),
+    ('class', np.uint8),        # index in ACTOR_CLASSES
+    ('distance', np.float32),   # distance between the box center and the ego vehicle in meters
+    ('rel_vx', np.float32),     # velocity relative to the ego vehicle in its frame (x forward, y right, z up) in m/s
+    ('rel_vy', np.float32),
+    ('rel_vz', np.float32),
+    ('x', np.float32),          # 3D box center in world coordinates
+    ('y', np.float32),
+    ('z', np.float32),
+    ('l', np.float32),          # 3D box size in meters
+    ('w', np.float32),
+    ('h', np.float32),
+    ('pitch', np.float32),      # rotation of the actor (and its box) in degrees
+    ('yaw', np.float32),
+    ('roll', np.float32),
+    ('pixels', np.uint32),      # number of visible pixels in the instance image
+    ('in_frame', np.bool_),     # whether the projected 3D box is in front of the camera and overlaps the image
+])
+
+
+def object_table(state, rows, entries, ego_id, rects, image_w, image_h):
+    """
+    Get the facts about actors at a frame from the world state, for all actors at once.
+
+    Visible pixels are unknown until the instance image is decoded, they are counted by count_pixels().
+
+    Input:
+        state: WorldState of the frame.
+        rows: Numpy array of rows of the actors in the state, see WorldState.select().
+        entries: Numpy array of rows of the same actors in the registry.
+        ego_id: Int of ego vehicle id.
+        rects: Nx4 numpy array of (x_min, y_min, x_max, y_max) of the projected 3D boxes of the actors, not clipped to
+            the image, NaN for actors behind the camera.
+        image_w: Int of image width.
+        image_h: Int of image height.
+    Output:
+        objects: Numpy structured array of OBJECT_DTYPE.
+    """
+    registry = state.registry
+    matrices = state.matrices[rows]
+    ego_matrix = state.matrix(ego_id)
+
+    centers = np.einsum('mij,mj->mi', matrices[:, :3, :3], registry.box_locations[entries]) + matrices[:, :3, 3]
+    velocities = (state.velocities[rows] - state.velocities[state.row(ego_id)]) @ ego_matrix[:3, :3]
+
+    objects = np.empty(len(rows), dtype=OBJECT_DTYPE)
+    objects['frame'] = state.frame
+    objects['timestamp'] = state.timestamp
+    objects['actor_id'] = registry.ids[entries]
+    objects['class'] = registry.classes[entries]
+    objects['distance'] = np.linalg.norm(centers - ego_matrix[:3, 3], axis=1)
+    objects['rel_vx'], objects['rel_vy'], objects['rel_vz'] = velocities.T
+    objects['x'], objects['y'], objects['z'] = centers.T
+    objects['l'], objects['w'], objects['h'] = (2.0 * registry.box_extents[entries]).T
+    objects['pitch'], objects['yaw'], objects['roll'] = state.rotations[rows].T
+    objects['pixels'] = 0
+    with np.errstate(invalid='ignore'):
+        objects['in_frame'] = ((rects[:, 2] > 0) & (rects[:, 0] < image_w) & (rects[:, 3] > 0) & (rects[:, 1] < image_h))
+    return objects
+
+
+def count_pixels(objects, table, image_w, image_h):
+    """
+    Fill in the visible pixels of the objects from the instance table of the same frame, in place.
+
+    Input:
+        objects: Numpy structured array of OBJECT_DTYPE, see object_table().
+        table: Numpy structured array of INSTANCE_TABLE_DTYPE, see instance_table().
+        image_w: Int of image width.
+        image_h: Int of image height.
+    """
+    boxes = mask_boxes(table, image_w, image_h, objects['actor_id'], objects['class'])
+    boxes = boxes[boxes['actor_id'] >= 0]
+    objects['pixels'] = 0
+    if len(boxes) == 0:
+        return
+
+    boxes = boxes[np.argsort(boxes['actor_id'])]
+    index = np.minimum(np.searchsorted(boxes['actor_id'], objects['actor_id']), len(boxes) - 1)
+    found = boxes['actor_id'][index] == objects['actor_id']
+    objects['pixels'][found] = boxes['pixels'][index[found]]
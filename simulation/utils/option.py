@@ -9,6 +9,11 @@ def get_args():
         '--spectator',
         action='store_true',
         help='Whether to use the spectator')
+    argparser.add_argument(
+        '--no-spectator',
+        dest='spectator',
+        action='store_false',
+        help='Leave the spectator alone, e.g. when the server runs off-screen')
     argparser.set_defaults(spectator=True)
     argparser.add_argument(
         '--weather',
@@ -0,0 +1,69 @@
+
+import numpy as np
+
+# CityScapes palette used by carla.ColorConverter.CityScapesPalette, indexed by labelId (see README.md).
+# Colors are in RGB order.
+CITYSCAPES_PALETTE = [
+    (0, 0, 0),          # 0  unlabeled
+    (128, 64, 128),     # 1  road
+    (244, 35, 232),     # 2  sidewalk
+    (70, 70, 70),       # 3  building
+    (102, 102, 156),    # 4  wall
+    (190, 153, 153),    # 5  fence
+    (153, 153, 153),    # 6  pole
+    (250, 170, 30),     # 7  traffic light
+    (220, 220, 0),      # 8  traffic sign
+    (107, 142, 35),     # 9  vegetation
+    (152, 251, 152),    # 10 terrain
+    (70, 130, 180),     # 11 sky
+    (220, 20, 60),      # 12 pedestrian
+    (255, 0, 0),        # 13 rider
+    (0, 0, 142),        # 14 car
+    (0, 0, 70),         # 15 truck
+    (0, 60, 100),       # 16 bus
+    (0, 80, 100),       # 17 train
+    (0, 0, 230),        # 18 motorcycle
+    (119, 11, 32),      # 19 bicycle
+    (110, 190, 160),    # 20 static
+    (170, 120, 50),     # 21 dynamic
+    (55, 90, 80),       # 22 other
+    (45, 60, 150),      # 23 water
+    (157, 234, 50),     # 24 road line
+    (81, 0, 81),        # 25 ground
+    (150, 100, 100),    # 26 bridge
+    (230, 150, 140),    # 27 rail track
+    (180, 165, 180),    # 28 guard rail
+]
+
+
+def build_lut(palette):
+    """
+    Build a lookup table mapping every uint8 labelId to a BGR color.
+
+    Input:
+        palette: List of RGB colors indexed by labelId.
+    Output:
+        lut: 256x3 uint8 numpy array. LabelIds not in palette are mapped to black.
+    """
+    lut = np.zeros((256, 3), dtype=np.uint8)
+    # OpenCV expects images in BGR order
+    lut[:len(palette)] = np.array(palette, dtype=np.uint8)[:, ::-1]
+    return lut
+
+
+CITYSCAPES_LUT = build_lut(CITYSCAPES_PALETTE)
+
+
+def colorize(label_ids, lut=CITYSCAPES_LUT, out=None):
+    """
+    Convert labelIds to a color image with a single lookup table gather.
+
+    Input:
+        label_ids: HxW uint8 numpy array of labelIds.
+        lut: 256x3 uint8 numpy array from build_lut().
+        out: Optional HxWx3 uint8 numpy array to write the color image into.
+    Output:
+        color_image: HxWx3 uint8 numpy array in BGR order.
+    """
+    # uint8 indices are always within the 256 entries, so bounds checking can be skipped with mode='clip'
+    return np.take(lut, label_ids, axis=0, out=out, mode='clip')
@@ -0,0 +1,71 @@
+
+import collections
+from concurrent.futures import ThreadPoolExecutor
+
+class FramePipeline(object):
+    """
+    Pipeline decoding captured frames on worker threads while the simulation keeps ticking.
+
+    Sensor data of a frame are decoded in parallel by a pool of workers, then the decoded frame is handed to
+    on_frame() by a single delivery thread, so frames are delivered one at a time and in the order they were captured.
+    At most `depth` frames are in flight; submitting more blocks until the oldest one is delivered.
+    """
+
+    def __init__(self, on_frame, depth=2, num_workers=2):
+        """
+        Constructor method.
+
+        Input:
+            on_frame: Callable taking the dict of decoded sensor data of a frame, e.g. BufferRecorder.buffering.
+            depth: Int of maximum number of frames in flight, 0 decodes and delivers frames on the calling thread.
+            num_workers: Int of number of decoding threads.
+        """
+        self.on_frame = on_frame
+        self.depth = depth
+
+        self._decoder = None
+        self._deliverer = None
+        if depth > 0:
+            self._decoder = ThreadPoolExecutor(max_workers=num_workers, thread_name_prefix='decoder')
+            self._deliverer = ThreadPoolExecutor(max_workers=1, thread_name_prefix='deliverer')
+        # Delivery futures of frames in flight in frame order
+        self._in_flight = collections.deque()
+
+    def submit(self, jobs):
+        """
+        Decode and deliver a frame.
+
+        Input:
+            jobs: Dict of callables returning the decoded data of each sensor, keyed by sensor name.
+        """
+        if self.depth == 0:
+            self.on_frame({name: job() for name, job in jobs.items()})
+            return
+
+        # Collect delivered frames, so that errors raised on worker threads surface in the main loop
+        while self._in_flight and self._in_flight[0].done():
+            self._in_flight.popleft().result()
+        # Backpressure: don't let the simulation run further ahead of the delivered frames
+        while len(self._in_flight) >= self.depth:
+            self._in_flight.popleft().result()
+
+        decoding = {name: self._decoder.submit(job) for name, job in jobs.items()}
+        self._in_flight.append(self._deliverer.submit(self._deliver, decoding))
+
+    def _deliver(self, decoding):
+        """ Wait for the sensor data of a frame to be decoded and hand them over. """
+        self.on_frame({name: future.result() for name, future in decoding.items()})
+
+    def drain(self):
+        """ Wait until all frames in flight are delivered. """
+        while self._in_flight:
+            self._in_flight.popleft().result()
+
+    def shutdown(self):
+        """ Deliver the frames in flight and stop the worker threads. """
+        try:
+            self.drain()
+        finally:
+            if self._decoder is not None:
+                self._decoder.shutdown()
+                self._deliverer.shutdown()
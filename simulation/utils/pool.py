@@ -0,0 +1,75 @@
+
+import queue
+import threading
+import numpy as np
+
+class FramePool(object):
+    """
+    Fixed-size pool of preallocated frame buffers.
+
+    Sensors write decoded frames into buffers acquired from the pool with np.copyto() instead of allocating
+    a new array per frame. Buffers come back to the pool once the recorder has flushed them, so the memory
+    used by frames is bounded by the pool size and stays flat over long collections.
+    """
+
+    def __init__(self, shape, dtype=np.uint8, size=10, timeout=10.0):
+        """
+        Constructor method.
+
+        Input:
+            shape: Tuple of buffer shape.
+            dtype: Numpy dtype of buffer.
+            size: Int of number of preallocated buffers.
+            timeout: Float of seconds to wait for a free buffer before giving up.
+        """
+        if size < 1:
+            raise ValueError('Frame pool size must be a positive integer.')
+        self.shape = tuple(shape)
+        self.dtype = np.dtype(dtype)
+        self.size = size
+        self.timeout = timeout
+
+        self._free = queue.LifoQueue()
+        self._buffers = {}
+        self._in_use = set()
+        self._lock = threading.Lock()
+        for _ in range(size):
+            buf = np.empty(self.shape, dtype=self.dtype)
+            self._buffers[id(buf)] = buf
+            self._free.put(buf)
+
+    def acquire(self):
+        """
+        Take a free buffer from the pool. It blocks until a buffer is released if the pool is exhausted.
+
+        Output:
+            buf: Numpy array owned by the caller until it is released.
+        """
+        try:
+            buf = self._free.get(timeout=self.timeout)
+        except queue.Empty:
+            raise RuntimeError('Frame pool of {} buffers is exhausted. '
+                               'Make sure buffers are released or increase pool_size.'.format(self.size))
+        with self._lock:
+            self._in_use.add(id(buf))
+        return buf
+
+    def release(self, buf):
+        """
+        Give a buffer back to the pool. Arrays which don't belong to the pool are ignored.
+
+        Output:
+            bool to indicate if the buffer was returned to the pool.
+        """
+        if buf is None:
+            return False
+        with self._lock:
+            if id(buf) not in self._in_use or self._buffers.get(id(buf)) is not buf:
+                return False
+            self._in_use.discard(id(buf))
+        self._free.put(buf)
+        return True
+
+    def num_free(self):
+        """ Get number of buffers available in the pool. """
+        return self._free.qsize()
@@ -0,0 +1,121 @@
+
+
+class CadenceScheduler(object):
+    """
+    Scheduler deciding which sensors are due at each frame according to their capture period.
+
+    Sensors with a sensor_tick are only rendered by the server every `period` frames. The phase of a sensor is not
+    known in advance, so it is learned from the frames of the events it reports: once a sensor reports at frame f,
+    it is expected again at frame f + period.
+
+    The server may render a sensor a frame earlier or later than expected, since sensor_tick is not a whole number of
+    frames. Reports within `slack` frames of the expected frame count as on time, and re-learn the phase.
+    """
+
+    def __init__(self, slack=1):
+        """
+        Constructor method.
+
+        Input:
+            slack: Int of frames a sensor may report before or after the frame it is expected at.
+        """
+        self.slack = slack
+        # Number of frames between two events of each sensor, None if it can't be predicted
+        self._periods = {}
+        # Next frame each sensor is expected to report at, None until its phase is known
+        self._next_frames = {}
+        # Latest frame each sensor reported at, and whether that report was on time
+        self._last_frames = {}
+        self._on_time = {}
+
+    def register(self, name, period):
+        """
+        Register a sensor.
+
+        Input:
+            name: Str of sensor name.
+            period: Int of frames between two sensor events, None if the sensor is only polled.
+        """
+        self._periods[name] = period
+        self._next_frames[name] = None
+        self._last_frames[name] = None
+        self._on_time[name] = False
+
+    def unregister(self, name):
+        """ Unregister a sensor. """
+        self._periods.pop(name, None)
+        self._next_frames.pop(name, None)
+        self._last_frames.pop(name, None)
+        self._on_time.pop(name, None)
+
+    def is_periodic(self, name):
+        """ Whether a sensor doesn't report every frame. """
+        return self._periods[name] != 1
+
+    def _slack(self, period):
+        """ Get the slack of a period, smaller than half of it so consecutive reports can't be confused. """
+        return min(self.slack, (period - 1) // 2)
+
+    def observe(self, name, frame):
+        """
+        Record that a sensor reported an event at a frame, which fixes its phase.
+
+        Input:
+            name: Str of sensor name.
+            frame: Int of frame id of the event.
+        """
+        period = self._periods[name]
+        if period is None or frame == self._last_frames[name]:
+            return
+
+        # Offset of the report from the closest frame it was expected at
+        next_frame = self._next_frames[name]
+        slack = self._slack(period)
+        on_time = False
+        if next_frame is not None and frame >= next_frame - slack:
+            on_time = (frame - next_frame + slack) % period <= 2 * slack
+
+        self._last_frames[name] = frame
+        self._on_time[name] = on_time
+        self._next_frames[name] = frame + period
+
+    def is_due(self, name, frame):
+        """
+        Whether a sensor is expected to report at a frame.
+
+        A sensor which hasn't reported at its expected frame stays due for `slack` more frames.
+
+        Input:
+            name: Str of sensor name.
+            frame: Int of frame id.
+        """
+        period = self._periods[name]
+        if period == 1:
+            return True
+
+        next_frame = self._next_frames[name]
+        if period is None or next_frame is None:
+            return False
+
+        return frame >= next_frame and (frame - next_frame) % period <= self._slack(period)
+
+    def reported(self, name, frame):
+        """
+        Whether a sensor reported at a frame within `slack` frames of the frame it was expected at.
+
+        Input:
+            name: Str of sensor name.
+            frame: Int of frame id, whose reports must have been observed.
+        """
+        if self._periods[name] == 1:
+            return True
+        return self._last_frames[name] == frame and self._on_time[name]
+
+    def due(self, frame):
+        """
+        Get the sensors expected to report at a frame.
+
+        Output:
+            names: List of sensor names.
+        """
+        return [name for name in self._periods if self.is_due(name, frame)]
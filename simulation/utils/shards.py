@@ -0,0 +1,168 @@
+
+import io
+import os
+import re
+import glob
+import json
+import time
+import tarfile
+
+# Tar files are sequences of 512 byte blocks: a header block per member, its data padded to whole blocks, and two empty
+# blocks at the end
+BLOCK = tarfile.BLOCKSIZE
+
+
+def padded(size):
+    """ Get the size of member data padded to whole tar blocks. """
+    return (size + BLOCK - 1) // BLOCK * BLOCK
+
+
+def sample_bytes(sizes):
+    """
+    Get the size of a sample in a tar shard.
+
+    Input:
+        sizes: List of int of sizes of the members of the sample.
+    Output:
+        size: Int of bytes, headers included.
+    """
+    return sum(BLOCK + padded(size) for size in sizes)
+
+
+def key_pattern(map_name):
+    """
+    Get the pattern of the key of frame files, i.e. their <map>_<timestamp>_<frame> prefix.
+
+    A file Town10HD_Opt_000033_5026200_img.png is the member Town10HD_Opt_000033_5026200.img.png of its sample, as
+    WebDataset expects: the key is the member name up to the first dot.
+    """
+    return re.compile(r'^(%s_\d+_\d+)_(.+)$' % re.escape(map_name))
+
+
+def shard_paths(directory, map_name):
+    """ Get the sorted paths of the shards of a map. """
+    return sorted(glob.glob(os.path.join(directory, '%s-[0-9][0-9][0-9][0-9][0-9][0-9].tar' % map_name)))
+
+
+def add_sample(tar, key, members, mtime=None):
+    """
+    Append the members of a sample to an open tar file.
+
+    Input:
+        tar: Tarfile opened for writing.
+        key: Str of sample key.
+        members: List of (extension, bytes-like data) of the members, e.g. ('img.png', data).
+        mtime: Optional float of modification time of the members, now by default.
+    Output:
+        entry: Dict of offset of the sample in the tar file, its size, and the data offset and size of every member
+            keyed by extension.
+    """
+    mtime = time.time() if mtime is None else mtime
+    offset = tar.offset
+    entries = {}
+    for extension, data in members:
+        info = tarfile.TarInfo('%s.%s' % (key, extension))
+        info.size = len(data)
+        info.mtime = mtime
+        tar.addfile(info, io.BytesIO(data))
+        entries[extension] = [tar.offset - padded(info.size), info.size]
+    return {'offset': offset, 'size': tar.offset - offset, 'members': entries}
+
+
+class ShardWriter(object):
+    """
+    Writer of the frames of a run as size-capped tar shards (<map>-000000.tar, <map>-000001.tar, ...), in the
+    WebDataset layout: all files of a frame are consecutive members named <key>.<extension>.
+
+    Shards are written sequentially and every sample gets a line in the index (<map>_shards.jsonl) with its shard,
+    offset and the offset of each member, so a frame can be read with a single seek, see read_sample().
+    """
+
+    def __init__(self, path, map_name, max_bytes=1 << 30, max_samples=None):
+        """
+        Constructor method.
+
+        Input:
+            path: Str of directory of the shards.
+            map_name: Str of map name.
+            max_bytes: Int of maximum size of a shard, unless a single sample is larger.
+            max_samples: Optional int of maximum number of samples of a shard.
+        """
+        self.path = path
+        self.map_name = map_name
+        self.max_bytes = max_bytes
+        self.max_samples = max_samples
+        os.makedirs(self.path, exist_ok=True)
+        # Continue after the shards of a previous run, so they are not overwritten
+        self.num_shards = len(shard_paths(self.path, map_name))
+        self.index_file = open(os.path.join(self.path, '%s_shards.jsonl' % map_name), 'a')
+        self.tar = None
+        self.shard_name = None
+        self.shard_samples = 0
+        self.num_samples = 0
+        self.num_bytes = 0
+
+    def write(self, key, members):
+        """
+        Append a sample to the current shard, or to a new one if it would exceed the caps.
+
+        Input:
+            key: Str of sample key.
+            members: List of (extension, bytes-like data) of the members.
+        """
+        size = sample_bytes([len(data) for _, data in members])
+        if self.tar is not None and (self.tar.offset + size + 2 * BLOCK > self.max_bytes
+                                     or (self.max_samples and self.shard_samples >= self.max_samples)):
+            self.close_shard()
+        if self.tar is None:
+            self.shard_name = '%s-%06d.tar' % (self.map_name, self.num_shards)
+            self.tar = tarfile.open(os.path.join(self.path, self.shard_name), 'w')
+            self.num_shards += 1
+            self.shard_samples = 0
+
+        entry = add_sample(self.tar, key, members)
+        self.index_file.write(json.dumps(dict(key=key, shard=self.shard_name, **entry)) + '\n')
+        self.shard_samples += 1
+        self.num_samples += 1
+        self.num_bytes += entry['size']
+
+    def close_shard(self):
+        """ Finish the current shard. """
+        if self.tar is not None:
+            self.tar.close()
+            self.tar = None
+            self.index_file.flush()
+
+    def close(self):
+        """ Finish the current shard and the index. """
+        self.close_shard()
+        self.index_file.close()
+
+
+def read_index(path, map_name):
+    """
+    Read the index of the shards of a map.
+
+    Output:
+        entries: List of dicts of samples, see add_sample(), with their key and shard.
+    """
+    with open(os.path.join(path, '%s_shards.jsonl' % map_name)) as f:
+        return [json.loads(line) for line in f]
+
+
+def read_sample(path, entry):
+    """
+    Read the members of a sample from its shard without scanning the tar file.
+
+    Input:
+        path: Str of directory of the shards.
+        entry: Dict of sample from read_index().
+    Output:
+        members: Dict of bytes of the members keyed by extension.
+    """
+    members = {}
+    with open(os.path.join(path, entry['shard']), 'rb') as f:
+        for extension, (offset, size) in entry['members'].items():
+            f.seek(offset)
+            members[extension] = f.read(size)
+    return members
@@ -0,0 +1,88 @@
+
+import os
+import glob
+import numpy as np
+
+# Parquet is used if pyarrow is installed, otherwise chunks are stored as .npz
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+    pq = None
+
+
+class ChunkedTable(object):
+    """
+    Columnar table of a run stored as a directory of chunks, e.g. outputs/Town10HD_Opt/Town10HD_Opt_objects/.
+
+    Every append() writes one chunk (part-00000.parquet, part-00001.parquet, ...), so nothing is rewritten and
+    a run stopped midway keeps its chunks. The directory is a Parquet dataset, e.g. for pandas.read_parquet().
+    Without pyarrow, chunks are .npz files with one array per column. read_table() reads both back.
+    """
+
+    def __init__(self, path, use_parquet=True):
+        """
+        Constructor method.
+
+        Input:
+            path: Str of directory of the chunks.
+            use_parquet: Bool of whether to write Parquet chunks when pyarrow is available.
+        """
+        self.path = path
+        self.extension = '.parquet' if use_parquet and pq is not None else '.npz'
+        os.makedirs(self.path, exist_ok=True)
+        # Continue after the chunks of a previous run, so they are not overwritten
+        self.num_chunks = len(glob.glob(os.path.join(self.path, 'part-*')))
+
+    def append(self, rows):
+        """
+        Write rows as a new chunk.
+
+        Input:
+            rows: Numpy structured array.
+        """
+        if len(rows) == 0:
+            return
+
+        chunk_path = os.path.join(self.path, 'part-%05d%s' % (self.num_chunks, self.extension))
+        if self.extension == '.parquet':
+            pq.write_table(pa.table({name: rows[name] for name in rows.dtype.names}), chunk_path)
+        else:
+            np.savez(chunk_path, **{name: rows[name] for name in rows.dtype.names})
+        self.num_chunks += 1
+
+
+def read_table(path, columns=None):
+    """
+    Read the chunks of a ChunkedTable into a single numpy structured array.
+
+    A curation query is then a few array operations, e.g. the frames with more than 10 pedestrians within 30 m:
+
+        objects = read_table('outputs/Town10HD_Opt/Town10HD_Opt_objects')
+        near = objects[(objects['class'] == ACTOR_CLASSES.index('pedestrian')) & (objects['distance'] < 30.0)]
+        frames, counts = np.unique(near['frame'], return_counts=True)
+        frames = frames[counts > 10]
+
+    Input:
+        path: Str of directory of the chunks.
+        columns: Optional list of names of the columns to read, all by default.
+    Output:
+        rows: Numpy structured array.
+    """
+    chunks = []
+    for chunk_path in sorted(glob.glob(os.path.join(path, 'part-*'))):
+        if chunk_path.endswith('.parquet'):
+            chunk = pq.read_table(chunk_path, columns=columns)
+            data = {name: chunk.column(name).to_numpy() for name in chunk.column_names}
+        else:
+            with np.load(chunk_path) as f:
+                data = {name: f[name] for name in (columns or f.files)}
+        rows = np.empty(len(next(iter(data.values()))), dtype=[(name, values.dtype) for name, values in data.items()])
+        for name, values in data.items():
+            rows[name] = values
+        chunks.append(rows)
+
+    if not chunks:
+        return None
+    return np.concatenate(chunks)
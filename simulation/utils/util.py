@@ -28,4 +28,98 @@ def get_image_point(loc, K, w2c):
     point_img[0] /= point_img[2]
     point_img[1] /= point_img[2]
 
-    return point_img[0:2]
\ No newline at end of file
+    return point_img[0:2]
+
+# Signs of the 8 corners of a box relative to its center, in the order of carla.BoundingBox.get_world_vertices()
+BOX_CORNERS = np.array([[sx, sy, sz] for sx in (-1, 1) for sy in (-1, 1) for sz in (-1, 1)], dtype=np.float64)
+
+def project_points(points, K, w2c):
+    """
+    Project 3D points in world coordinates onto the image, the batched counterpart of get_image_point().
+
+    Input:
+        points: Nx3 numpy array of world coordinates.
+        K: 3x3 numpy array of camera projection matrix, see build_projection_matrix().
+        w2c: 4x4 numpy array of world to camera matrix, i.e. the inverse matrix of the camera transform,
+            or Nx4x4 numpy array of one matrix per point, e.g. of points seen by different camera poses.
+    Output:
+        points_img: Nx3 numpy array of (u, v, depth). Depth is along the optical axis, points behind the camera have
+            depth <= 0 and meaningless u, v.
+    """
+    # Transform to camera coordinates, w2c @ [x, y, z, 1] for every point
+    if w2c.ndim == 3:
+        point_camera = np.einsum('nij,nj->ni', w2c[:, :3, :3], points) + w2c[:, :3, 3]
+    else:
+        point_camera = points @ w2c[:3, :3].T + w2c[:3, 3]
+    # Change from UE4's coordinate system to an "standard" (x, y ,z) -> (y, -z, x), then project with K
+    axes = np.array([[0.0, 1.0, 0.0], [0.0, 0.0, -1.0], [1.0, 0.0, 0.0]])
+    point_img = point_camera @ (K @ axes).T
+    depth = point_img[:, 2:3]
+    point_img[:, :2] /= np.where(depth != 0.0, depth, np.finfo(np.float64).tiny)
+    return point_img
+
+def box_vertices(actor_matrices, box_locations, box_extents):
+    """
+    Compute the world vertices of the bounding boxes of many actors at once.
+
+    Boxes are assumed aligned with their actor, which holds for vehicles and walkers.
+
+    Input:
+        actor_matrices: Mx4x4 numpy array of actor transform matrices, i.e. carla.Transform.get_matrix().
+        box_locations: Mx3 numpy array of box centers relative to the actor.
+        box_extents: Mx3 numpy array of box half sizes.
+    Output:
+        vertices: Mx8x3 numpy array of world coordinates of the box corners.
+    """
+    local = box_locations[:, None, :] + box_extents[:, None, :] * BOX_CORNERS
+    return np.einsum('mij,mkj->mki', actor_matrices[:, :3, :3], local) + actor_matrices[:, None, :3, 3]
+
+def project_boxes(vertices, K, w2c, image_w, image_h, clip=False):
+    """
+    Project the vertices of many boxes and get their 2D bounding rectangles.
+
+    Input:
+        vertices: Mx8x3 numpy array of world coordinates of the box corners, see box_vertices().
+        K: 3x3 numpy array of camera projection matrix.
+        w2c: 4x4 numpy array of world to camera matrix, or Mx4x4 numpy array of one matrix per box.
+        image_w: Int of image width.
+        image_h: Int of image height.
+        clip: Bool of whether to clip rectangles crossing the image border to it, otherwise only rectangles
+            strictly inside the image are kept, as the original per-actor loop did.
+    Output:
+        rects: Mx4 numpy array of (x_min, y_min, x_max, y_max).
+        valid: M bool numpy array of rectangles in front of the camera and on the image.
+    """
+    num = len(vertices)
+    if w2c.ndim == 3:
+        w2c = np.repeat(w2c, 8, axis=0)
+    points_img = project_points(vertices.reshape(-1, 3), K, w2c).reshape(num, 8, 3)
+
+    rects = np.concatenate([points_img[:, :, :2].min(axis=1), points_img[:, :, :2].max(axis=1)], axis=1)
+    # A box partly behind the camera projects to meaningless coordinates
+    valid = np.all(points_img[:, :, 2] > 0.0, axis=1)
+
+    if clip:
+        valid &= (rects[:, 2] > 0) & (rects[:, 0] < image_w) & (rects[:, 3] > 0) & (rects[:, 1] < image_h)
+        np.clip(rects[:, 0::2], 0, image_w, out=rects[:, 0::2])
+        np.clip(rects[:, 1::2], 0, image_h, out=rects[:, 1::2])
+    else:
+        valid &= (rects[:, 0] > 0) & (rects[:, 2] < image_w) & (rects[:, 1] > 0) & (rects[:, 3] < image_h)
+
+    return rects, valid
+
+def filter_actors(locations, origin, forward, max_distance=500.0, min_dot=1.0):
+    """
+    Keep actors near an origin and in front of it, e.g. of the ego vehicle.
+
+    Input:
+        locations: Mx3 numpy array of actor locations.
+        origin: 3 numpy array of origin location.
+        forward: 3 numpy array of forward vector at the origin.
+        max_distance: Float of maximum distance in meters.
+        min_dot: Float of minimum dot product between forward and the ray to the actor.
+    Output:
+        mask: M bool numpy array.
+    """
+    rays = locations - origin
+    return (np.einsum('mi,mi->m', rays, rays) < max_distance ** 2) & (rays @ forward > min_dot)
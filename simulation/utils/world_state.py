@@ -0,0 +1,171 @@
+
+import numpy as np
+
+
+def rotation_matrices(rotations):
+    """
+    Compute rotation matrices as carla.Transform.get_matrix() does, for many rotations at once.
+
+    Input:
+        rotations: Mx3 numpy array of (pitch, yaw, roll) in degrees.
+    Output:
+        matrices: Mx3x3 numpy array.
+    """
+    cp, cy, cr = np.cos(np.radians(rotations)).T
+    sp, sy, sr = np.sin(np.radians(rotations)).T
+    matrices = np.empty((len(rotations), 3, 3))
+    matrices[:, 0, 0] = cp * cy
+    matrices[:, 0, 1] = cy * sp * sr - sy * cr
+    matrices[:, 0, 2] = -cy * sp * cr - sy * sr
+    matrices[:, 1, 0] = cp * sy
+    matrices[:, 1, 1] = sy * sp * sr + cy * cr
+    matrices[:, 1, 2] = -sy * sp * cr + cy * sr
+    matrices[:, 2, 0] = sp
+    matrices[:, 2, 1] = -cp * sr
+    matrices[:, 2, 2] = cp * cr
+    return matrices
+
+
+class WorldState(object):
+    """
+    State of all actors at one tick, read from the carla.WorldSnapshot the client receives with every tick.
+
+    Reading transforms and velocities from the snapshot costs no round trip to the server, unlike
+    Actor.get_transform(). The snapshot is only parsed into arrays when the state is first read at a frame,
+    so ticks nobody reads cost nothing. Rows of all arrays are aligned with `ids`.
+
+    Classes and bounding boxes don't change during the lifetime of an actor, they are read from an ActorRegistry.
+    """
+
+    def __init__(self, registry):
+        """
+        Constructor method.
+
+        Input:
+            registry: ActorRegistry holding the static attributes of annotated actors.
+        """
+        self.registry = registry
+        self.frame = None
+        self.timestamp = None
+        self._snapshot = None
+        self._parsed = False
+
+        self._ids = np.empty(0, dtype=np.int64)
+        self._locations = np.empty((0, 3))
+        self._rotations = np.empty((0, 3))
+        self._velocities = np.empty((0, 3))
+        self._rows = {}
+        self._matrices = None
+
+    def update(self, snapshot):
+        """
+        Move the state to a new tick.
+
+        Input:
+            snapshot: Carla.WorldSnapshot of the tick.
+        """
+        self._snapshot = snapshot
+        self.frame = snapshot.frame
+        self.timestamp = snapshot.timestamp.elapsed_seconds
+        self._parsed = False
+
+    def _parse(self):
+        """ Parse the snapshot into arrays, once per frame. """
+        if self._parsed or self._snapshot is None:
+            return
+
+        ids, values = [], []
+        for actor_snapshot in self._snapshot:
+            transform = actor_snapshot.get_transform()
+            velocity = actor_snapshot.get_velocity()
+            ids.append(actor_snapshot.id)
+            values.append((transform.location.x, transform.location.y, transform.location.z,
+                           transform.rotation.pitch, transform.rotation.yaw, transform.rotation.roll,
+                           velocity.x, velocity.y, velocity.z))
+
+        values = np.array(values, dtype=np.float64).reshape(-1, 9)
+        self._ids = np.array(ids, dtype=np.int64)
+        self._locations = values[:, 0:3]
+        self._rotations = values[:, 3:6]
+        self._velocities = values[:, 6:9]
+        self._rows = {actor_id: row for row, actor_id in enumerate(ids)}
+        self._matrices = None
+        self._parsed = True
+
+    @property
+    def ids(self):
+        """ N numpy array of actor ids. """
+        self._parse()
+        return self._ids
+
+    @property
+    def locations(self):
+        """ Nx3 numpy array of actor locations. """
+        self._parse()
+        return self._locations
+
+    @property
+    def rotations(self):
+        """ Nx3 numpy array of actor rotations as (pitch, yaw, roll) in degrees. """
+        self._parse()
+        return self._rotations
+
+    @property
+    def velocities(self):
+        """ Nx3 numpy array of actor velocities in m/s. """
+        self._parse()
+        return self._velocities
+
+    @property
+    def matrices(self):
+        """ Nx4x4 numpy array of actor transform matrices, as carla.Transform.get_matrix(). """
+        self._parse()
+        if self._matrices is None:
+            self._matrices = np.tile(np.identity(4), (len(self._ids), 1, 1))
+            self._matrices[:, :3, :3] = rotation_matrices(self._rotations)
+            self._matrices[:, :3, 3] = self._locations
+        return self._matrices
+
+    def row(self, actor_id):
+        """ Get the row of an actor, None if it is not in the snapshot. """
+        self._parse()
+        return self._rows.get(actor_id)
+
+    def matrix(self, actor_id):
+        """ Get the 4x4 transform matrix of an actor. """
+        return self.matrices[self._rows[actor_id]]
+
+    def inverse_matrix(self, actor_id):
+        """ Get the 4x4 inverse transform matrix of an actor, e.g. the world to camera matrix of a camera. """
+        matrix = self.matrix(actor_id)
+        inverse = np.identity(4)
+        inverse[:3, :3] = matrix[:3, :3].T
+        inverse[:3, 3] = -matrix[:3, :3].T @ matrix[:3, 3]
+        return inverse
+
+    def forward_vector(self, actor_id):
+        """ Get the forward vector of an actor, as carla.Transform.get_forward_vector(). """
+        return self.matrix(actor_id)[:3, 0]
+
+    def pose(self, actor_id):
+        """ Get the location, rotation and velocity of an actor as a dict which can be dumped to JSON. """
+        row = self.row(actor_id)
+        values = np.concatenate([self._locations[row], self._rotations[row], self._velocities[row]]).tolist()
+        return dict(zip(('x', 'y', 'z', 'pitch', 'yaw', 'roll', 'vx', 'vy', 'vz'), values))
+
+    def select(self, class_names):
+        """
+        Get the annotated actors of some classes at this frame, in one pass over all actors.
+
+        Input:
+            class_names: Sequence of names in ACTOR_CLASSES, e.g. ('vehicle', 'pedestrian').
+        Output:
+            rows: Numpy array of rows of the actors in this state.
+            entries: Numpy array of rows of the same actors in the registry.
+        """
+        self.registry.sync(self.ids)
+        entries = self.registry.lookup(self.ids)
+        rows = np.flatnonzero(entries >= 0)
+        entries = entries[rows]
+        selected = self.registry.class_mask(class_names)[entries]
+        return rows[selected], entries[selected]
@@ -1,10 +1,18 @@
 import carla
 import sys
 import random
+import functools
+import numpy as np
 
 from simulation.utils.weather import find_weather_presets
+from simulation.utils.capture import AlwaysCapture
+from simulation.utils.scheduler import CadenceScheduler
+from simulation.utils.frame_sync import FrameSync
+from simulation.utils.pipeline import FramePipeline
+from simulation.utils.world_state import WorldState
 from simulation.sensors import CarlaSensor
 from simulation.generator.generator import get_actor_blueprints
+from simulation.generator.registry import ActorRegistry
 
 class World(object):
     """ Class representing the simulation environment. """
@@ -44,6 +52,30 @@ class World(object):
         # When sensor data are updated, the content in this dict is updated automatically since they are just pointers.
         self.all_sensor_data = {}
 
+        # Policy deciding on which frames the sensors decode their data, see simulation/utils/capture.py.
+        self.capture_policy = AlwaysCapture()
+        # Frame id of the latest tick and whether it is a capture frame
+        self.frame = 0
+        self.is_capture_frame = False
+        # Scheduler deciding which sensors are due at each frame according to their sensor_tick
+        self.scheduler = CadenceScheduler()
+        # Synchronizer collecting sensor events keyed by frame, so each step gets a consistent set of sensor data
+        self.frame_sync = FrameSync(max_frames=config['world'].get('max_pending_frames', 8))
+        # Seconds to wait for the due sensors before giving up the frame
+        self.sensor_timeout = config['world'].get('sensor_timeout', None)
+        # Whether the world is ticked by this client, or runs freely
+        self.synchronous = config['world']['sync_mode']
+        # Pipeline decoding captured frames on worker threads, see start_pipeline()
+        self.pipeline = None
+        # Static attributes of the annotated actors, seed it with the actors of the TrafficGenerator
+        self.registry = ActorRegistry(carla_world)
+        # State of all actors at the latest tick, read from the world snapshot instead of per-actor requests
+        self.state = WorldState(self.registry)
+        # Frames between two spectator updates, 0 never moves the spectator, e.g. when running headless
+        self.spectator_interval = config['world'].get('spectator_interval', 1)
+        # Whether the ego pose is recorded with every captured frame
+        self.log_pose = config['world'].get('log_pose', True)
+
         # Start simuation
         self.restart(config, spawn_point)
         # Tick the world to bring the ego vehicle actor into effect
@@ -64,6 +96,7 @@ class World(object):
         self.carla_world.apply_settings(settings)
 
         self.tm.set_synchronous_mode(config['world']['sync_mode'])
+        self.synchronous = config['world']['sync_mode']
 
         # Spawn a car as the ego vehicle
         ego_veh_bp = self.carla_world.get_blueprint_library().filter('*vehicle*')[0]
@@ -121,6 +154,19 @@ class World(object):
         self.carla_sensors[carla_sensor.name] = carla_sensor
         # Register the CarlaSensor's data to all_sensor_data
         self.all_sensor_data[carla_sensor.name] = carla_sensor.data
+        # Register the CarlaSensor's capture period to the scheduler
+        self.scheduler.register(carla_sensor.name, carla_sensor.period)
+        # Route the CarlaSensor's events to the frame synchronizer
+        carla_sensor.attach_frame_sync(self.frame_sync)
+
+    def set_capture_policy(self, capture_policy):
+        """
+        Set the policy deciding on which frames sensor data are captured.
+
+        Input:
+            capture_policy: Callable taking the frame id and returning whether the frame should be captured.
+        """
+        self.capture_policy = capture_policy
 
     def set_ego_autopilot(self, active, autopilot_config=None):
         """
@@ -156,26 +202,140 @@ class World(object):
         """
         Tick carla world to take simulation one step forward.
 
+        In free-run mode, it waits for the next tick of the server instead.
+        Only the sensors due at this frame are waited for, up to sensor_timeout seconds, with a warning on timeout.
+        Sensors which are not due are updated too if they reported this frame. A frame is not captured if one of its
+        due sensors fails to report it.
+
         Output:
             bool to indicate if should keep running.
         """
         keep_running = True
-        self.carla_world.tick()
+        if self.synchronous:
+            self.frame = self.carla_world.tick()
+            # The snapshot of the tick is kept by the client, no request is sent
+            self.state.update(self.carla_world.get_snapshot())
+        else:
+            snapshot = self.carla_world.wait_for_tick()
+            self.frame = snapshot.frame
+            self.state.update(snapshot)
+
+        due = self.scheduler.due(self.frame)
+        events, complete = self.frame_sync.wait(self.frame, due, timeout=self.sensor_timeout)
+        if not complete:
+            print('Warning! %s did not report frame %d within %s s.'
+                  % (', '.join(name for name in due if name not in events), self.frame, self.sensor_timeout))
+
+        # The policy may depend on the reports of this frame, e.g. CadenceCapture. A report of this frame only counts
+        # if its event was released, an event arriving after wait() missed the frame.
+        for name in self.carla_sensors:
+            last_frame = self.frame_sync.last_frame(name)
+            if name in events:
+                self.scheduler.observe(name, self.frame)
+            elif last_frame is not None and last_frame != self.frame:
+                self.scheduler.observe(name, last_frame)
+        capture = self.capture_policy(self.frame)
+
+        # Update CarlaSensors' data. Raw events are only decoded on capture frames, and on the worker threads
+        # when a pipeline decodes them.
+        for name, carla_sensor in self.carla_sensors.items():
+            if name in events:
+                carla_sensor.receive(events[name], capture=capture and self.pipeline is None)
+
+        self.is_capture_frame = capture and complete
+
+        return keep_running
 
-        # Update CarlaSensors' data
+    def capture(self):
+        """
+        Decode the latest data of all sensors and hand it over, e.g. to a recorder.
+
+        Unlike all_sensor_data, the returned data is not overwritten by subsequent frames. The frame buffers it holds
+        come from the sensors' pools and must be given back with release() once they are no longer used.
+
+        Output:
+            sensor_data: Dict of all sensors' data at the latest frame.
+        """
         for carla_sensor in self.carla_sensors.values():
-            carla_sensor.update()
+            carla_sensor.annotate(self.state)
+        sensor_data = {name: carla_sensor.detach() for name, carla_sensor in self.carla_sensors.items()}
+        if self.log_pose:
+            sensor_data['ego_pose'] = self.ego_pose()
+        return sensor_data
 
-        return keep_running
+    def start_pipeline(self, on_frame, depth=2, num_workers=2):
+        """
+        Decode captured frames on worker threads, so the next tick overlaps with the processing of the current frame.
+
+        Input:
+            on_frame: Callable taking the dict of all sensors' data of a captured frame, e.g. BufferRecorder.buffering.
+                      It is called on a single delivery thread in frame order.
+            depth: Int of maximum number of captured frames in flight, 0 processes frames in capture_async() itself.
+            num_workers: Int of number of decoding threads.
+        """
+        self.pipeline = FramePipeline(on_frame, depth, num_workers)
+
+    def capture_async(self):
+        """
+        Hand the raw data of the latest frame over to the pipeline and return immediately.
+
+        Sensors add annotations depending on the state at this frame first, see CarlaSensor.annotate(), since the world
+        keeps ticking while the frame is decoded.
+        """
+        if self.pipeline is None:
+            raise RuntimeError('The pipeline has not been started, call start_pipeline() first.')
+
+        # All sensors are annotated before any is detached, annotations may read the latest data of other sensors
+        for carla_sensor in self.carla_sensors.values():
+            carla_sensor.annotate(self.state)
+
+        jobs = {}
+        for name, carla_sensor in self.carla_sensors.items():
+            data, event = carla_sensor.detach_raw()
+            jobs[name] = functools.partial(carla_sensor.decode_detached, data, event)
+        if self.log_pose:
+            jobs['ego_pose'] = functools.partial(dict, self.ego_pose())
+
+        self.pipeline.submit(jobs)
+
+    def release(self, sensor_data):
+        """
+        Give frame buffers of data returned by capture() back to the sensors' pools.
+
+        Input:
+            sensor_data: Dict of sensors' data keyed by sensor name.
+        """
+        for name, data in sensor_data.items():
+            if name in self.carla_sensors:
+                self.carla_sensors[name].release(data)
+
+    def ego_pose(self):
+        """ Get the pose of the ego vehicle at the latest tick as a dict which can be dumped to JSON. """
+        pose = self.state.pose(self.ego_veh.id)
+        pose['timestamp'] = self.state.timestamp
+        pose['frame'] = self.state.frame
+        return pose
 
     def see_ego_veh(self, following_dist=5, height=5, tilt_ang=-30):
-        """ Aim the spectator down to the ego vehicle. """
-        spect_location = carla.Location(x=-following_dist)
-        self.ego_veh.get_transform().transform(
-            spect_location)  # it modifies passed-in location
-        ego_rotation = self.ego_veh.get_transform().rotation
-        self.spectator.set_transform(carla.Transform(spect_location + carla.Location(z=height),
-                                                     carla.Rotation(pitch=tilt_ang, yaw=ego_rotation.yaw)))
+        """
+        Aim the spectator down to the ego vehicle.
+
+        The spectator is only moved every spectator_interval frames, each move being a request to the server.
+        """
+        if not self.spectator_interval or self.frame % self.spectator_interval != 0:
+            return
+
+        if self.state.row(self.ego_veh.id) is not None:
+            ego_matrix = self.state.matrix(self.ego_veh.id)
+            ego_yaw = self.state.rotations[self.state.row(self.ego_veh.id)][1]
+        else:
+            # Before the first tick, the ego vehicle is not in a snapshot yet
+            ego_transform = self.ego_veh.get_transform()
+            ego_matrix = np.array(ego_transform.get_matrix())
+            ego_yaw = ego_transform.rotation.yaw
+        x, y, z = ego_matrix[:3, :3] @ [-following_dist, 0.0, 0.0] + ego_matrix[:3, 3]
+        self.spectator.set_transform(carla.Transform(carla.Location(x=x, y=y, z=z + height),
+                                                     carla.Rotation(pitch=tilt_ang, yaw=ego_yaw)))
 
     def allow_free_run(self):
         """ Allow carla engine to run asynchronously and freely. """
@@ -183,15 +343,24 @@ class World(object):
         settings.synchronous_mode = False
         settings.fixed_delta_seconds = 0.0
         self.carla_world.apply_settings(settings)
+        self.synchronous = False
 
     def destroy(self):
         """ Destroy spawned actors in carla world. """
+        if self.pipeline is not None:
+            # Deliver the frames in flight before the sensors are gone
+            pipeline, self.pipeline = self.pipeline, None
+            pipeline.shutdown()
+
         if self.ego_veh:
             print("Destroying the ego vehicle.")
+            self.registry.remove([self.ego_veh.id])
             self.ego_veh.destroy()
             self.ego_veh = None
 
-        for carla_sensor in self.carla_sensors.values():
+        for name, carla_sensor in self.carla_sensors.items():
             carla_sensor.destroy()
+            self.scheduler.unregister(name)
 
-        self.carla_sensors.clear()
\ No newline at end of file
+        self.carla_sensors.clear()
+        self.frame_sync.reset()
\ No newline at end of file
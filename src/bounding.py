@@ -1,7 +1,8 @@
 import copy
 import numpy as np
 from pascal_voc_writer import Writer
-from .util import build_projection_matrix, get_image_point
+from .util import build_projection_matrix
+from simulation.utils.util import box_vertices, filter_actors, project_boxes
 
 
 class Bounding():
@@ -26,50 +27,29 @@ class Bounding():
         # Initialize the exporter
         writer = Writer(save_path + '_img.png', self.image_w, self.image_h)
 
-        for npc in self.world.get_actors().filter('*vehicle*'): # vehicle
-
-            # Filter out the ego vehicle
-            if npc.id != self.ego_vehicle.id:
-
-                bb = npc.bounding_box
-                dist = npc.get_transform().location.distance(self.ego_vehicle.get_transform().location)
-
-                # Filter for the vehicles within 500m
-                if dist < 500:
-
-                # Calculate the dot product between the forward vector
-                # of the vehicle and the vector between the vehicle
-                # and the other vehicle. We threshold this dot product
-                # to limit to drawing bounding boxes IN FRONT OF THE CAMERA
-                    forward_vec = self.ego_vehicle.get_transform().get_forward_vector()
-                    ray = npc.get_transform().location - self.ego_vehicle.get_transform().location
-
-                    if forward_vec.dot(ray) > 1:
-                        p1 = get_image_point(bb.location, self.K, world_2_camera)
-                        verts = [v for v in bb.get_world_vertices(npc.get_transform())]
-                        x_max = -10000
-                        x_min = 10000
-                        y_max = -10000
-                        y_min = 10000
-
-                        for vert in verts:
-                            p = get_image_point(vert, self.K, world_2_camera)
-                            # Find the rightmost vertex
-                            if p[0] > x_max:
-                                x_max = p[0]
-                            # Find the leftmost vertex
-                            if p[0] < x_min:
-                                x_min = p[0]
-                            # Find the highest vertex
-                            if p[1] > y_max:
-                                y_max = p[1]
-                            # Find the lowest  vertex
-                            if p[1] < y_min:
-                                y_min = p[1]
-
-                        # Add the object to the frame (ensure it is inside the image)
-                        if x_min > 0 and x_max < self.image_w and y_min > 0 and y_max < self.image_h:
-                            writer.addObject('vehicle', x_min, y_min, x_max, y_max)
-
-            # Save the bounding boxes in the scene
+        # Filter out the ego vehicle
+        npcs = [npc for npc in self.world.get_actors().filter('*vehicle*') if npc.id != self.ego_vehicle.id] # vehicle
+        if npcs:
+            matrices = np.array([npc.get_transform().get_matrix() for npc in npcs])
+            boxes = [npc.bounding_box for npc in npcs]
+            box_locations = np.array([[bb.location.x, bb.location.y, bb.location.z] for bb in boxes])
+            box_extents = np.array([[bb.extent.x, bb.extent.y, bb.extent.z] for bb in boxes])
+
+            # Filter for the vehicles within 500m and IN FRONT OF THE CAMERA, i.e. the dot product between the
+            # forward vector of the ego vehicle and the ray to the vehicle is above a threshold
+            ego_transform = self.ego_vehicle.get_transform()
+            forward_vec = ego_transform.get_forward_vector()
+            mask = filter_actors(matrices[:, :3, 3], np.array([ego_transform.location.x, ego_transform.location.y,
+                                                               ego_transform.location.z]),
+                                 np.array([forward_vec.x, forward_vec.y, forward_vec.z]))
+
+            # Project all boxes at once, keep those inside the image
+            vertices = box_vertices(matrices[mask], box_locations[mask], box_extents[mask])
+            rects, valid = project_boxes(vertices, self.K, world_2_camera, self.image_w, self.image_h)
+
+            # Add the objects to the frame
+            for x_min, y_min, x_max, y_max in rects[valid].tolist():
+                writer.addObject('vehicle', x_min, y_min, x_max, y_max)
+
+        # Save the bounding boxes in the scene
         writer.save(save_path + '_bounding_box.xml')
\ No newline at end of file